@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# Times the cleaner's windowing over the bundled example datasets, scaled up to whatever size you ask for, and reports
+# throughput and peak memory for each implementation. Run from the repo root: python -m benchmarks.clean_benchmark
+#
+# Each implementation runs in its own process so peak RSS is measured separately. The "reference" implementation is the
+# cleaner's windowing as it was before any of this work, ported to Python 3 but otherwise unchanged: it reads the whole
+# file in, cuts each window off the front of the word list and cleans it with re.sub(). The raw tokenizer's output is
+# checked against it as well as timed. Cutting windows off the front makes it quadratic in the corpus size, so it's
+# only run on corpora up to --reference-size MB.
+
+import hashlib
+import logging
+import os
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from datasettoolkit.text_cleaning_and_labelling import TextCleaningAndLabellingClient
+
+EXAMPLES = [
+    os.path.join('datasettoolkit', 'datasets', 'text_from_papers.txt.example'),
+    os.path.join('datasettoolkit', 'datasets', 'text_from_reddit.txt.example')
+]
+IMPLEMENTATIONS = ['reference', 'raw', 'normalized']
+
+
+def reference_windows(path, max_sentence_length):
+    """
+    The original cleaner()'s windowing, with str swapped for bytes as Python 2's str was.
+    """
+    with open(path, 'rb') as raw_text_file:
+        # This is not scalable! Reads in whole file rather than piece by piece.
+        cleaned_text_fileraw = b' '.join(raw_text_file.read().splitlines()).split(b' ')
+
+    while len(cleaned_text_fileraw) > max_sentence_length:
+        line = b' '.join(cleaned_text_fileraw[:max_sentence_length])
+        del cleaned_text_fileraw[:max_sentence_length]
+
+        line = line.lower()
+        line = re.sub(br'[\W_]+', b' ', line)
+        yield line.decode('ascii')
+
+
+def build_corpus(path, size_mb):
+    """
+    Write the example datasets over and over to path until it's size_mb megabytes.
+    """
+    examples = []
+    for example in EXAMPLES:
+        with open(example, 'rb') as example_file:
+            examples.append(example_file.read())
+    examples = b''.join(examples)
+    target = size_mb * 1024 * 1024
+    with open(path, 'wb') as corpus:
+        written = 0
+        while written < target:
+            corpus.write(examples)
+            written += len(examples)
+    return
+
+
+def run(implementation, path):
+    """
+    Clean the corpus with one implementation and print its stats, for the parent process to collect.
+    """
+    logging.disable(logging.CRITICAL)
+    client = TextCleaningAndLabellingClient()
+    client.dataset_path = os.path.dirname(path)
+
+    started = time.time()
+    if implementation == 'reference':
+        lines = reference_windows(path, client.max_sentence_length)
+    else:
+        client.tokenizer = implementation
+        lines = client.windows(os.path.basename(path))
+
+    digest = hashlib.sha1()
+    count = 0
+    for line in lines:
+        digest.update(line.encode('ascii'))
+        digest.update(b'\n')
+        count += 1
+    seconds = time.time() - started
+
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    print('{} {} {} {}'.format(seconds, peak_rss_mb, count, digest.hexdigest()))
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark the cleaner over the example datasets scaled up.')
+    parser.add_argument('--size', type=int, default=1024, help='Corpus size in MB. (default: 1024)')
+    parser.add_argument('--only', choices=IMPLEMENTATIONS, nargs='+', default=IMPLEMENTATIONS,
+                        help='Implementations to run. (default: all)')
+    parser.add_argument('--reference-size', type=int, default=8,
+                        help='Largest corpus in MB to run the quadratic reference on. (default: 8)')
+    parser.add_argument('--run', nargs=2, metavar=('IMPLEMENTATION', 'CORPUS'), help=argparse.SUPPRESS)
+    flags = parser.parse_args()
+
+    if flags.run:
+        run(*flags.run)
+        return
+
+    corpus_dir = tempfile.mkdtemp()
+    corpus_path = os.path.join(corpus_dir, 'corpus.txt')
+    try:
+        build_corpus(corpus_path, flags.size)
+        corpus_mb = os.path.getsize(corpus_path) / 1024.0 / 1024.0
+
+        print('{:.0f}MB corpus built from {}'.format(corpus_mb, ', '.join(os.path.basename(e) for e in EXAMPLES)))
+        print('{:<12}{:>10}{:>10}{:>14}{:>12}  {}'.format('', 'seconds', 'MB/s', 'peak RSS MB', 'windows', 'sha1'))
+        digests = {}
+        for implementation in flags.only:
+            if implementation == 'reference' and flags.size > flags.reference_size:
+                print('{:<12}skipped, it takes minutes past --reference-size {}MB'.format(
+                    implementation, flags.reference_size))
+                continue
+            output = subprocess.check_output(
+                [sys.executable, '-m', 'benchmarks.clean_benchmark', '--run', implementation, corpus_path]
+            ).decode('ascii').split()
+            seconds, peak_rss_mb, count, digest = float(output[0]), float(output[1]), int(output[2]), output[3]
+            print('{:<12}{:>10.2f}{:>10.1f}{:>14.1f}{:>12}  {}'.format(
+                implementation, seconds, corpus_mb / seconds, peak_rss_mb, count, digest[:12]))
+            digests[implementation] = digest
+        if 'reference' in digests and 'raw' in digests and digests['raw'] != digests['reference']:
+            print('The raw tokenizer does not match the reference!')
+    finally:
+        if os.path.exists(corpus_path):
+            os.remove(corpus_path)
+        os.rmdir(corpus_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Times MultiRedditReader.read() against a local stub of the reddit listing API, next to the old one-page-at-a-time
+# fetch loop, then again with a ResponseCache: revalidating, fresh and offline. Run from the repo root:
+# python -m benchmarks.fetch_benchmark
+
+import hashlib
+import json
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+from datasettoolkit.multi_reddit_reader import MultiRedditReader
+from datasettoolkit.response_cache import ResponseCache
+
+
+class ListingHandler(BaseHTTPRequestHandler):
+    """
+    Serves canned /r/<subreddit>/new/.json listing pages. Every page holds `limit` posts and points at the next one
+    with an "after" token, after sleeping for the server's latency to stand in for the round trip to reddit. Pages
+    carry an ETag, and a matching If-None-Match gets a 304.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        subreddit = url.path.split('/')[2]
+        query = parse_qs(url.query)
+        page = int(query.get('after', ['t3_0'])[0].split('_')[1])
+        limit = int(query.get('limit', ['100'])[0])
+
+        children = [
+            {'kind': 't3', 'data': {
+                'id': '{}{}x{}'.format(subreddit, page, index),
+                'name': 't3_{}{}x{}'.format(subreddit, page, index),
+                'title': 'Post {} on page {} of /r/{}'.format(index, page, subreddit),
+                'selftext': 'Some self text. ' * 20,
+                'is_self': True,
+                'score': index,
+                'url': 'https://www.reddit.com/r/{}/comments/{}{}/'.format(subreddit, page, index)
+            }}
+            for index in range(limit)
+        ]
+        body = json.dumps({'kind': 'Listing', 'data': {
+            'after': 't3_{}'.format(page + 1), 'before': None, 'children': children
+        }}).encode('utf-8')
+        etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+
+        time.sleep(self.server.latency)
+        self.server.requests += 1
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        return
+
+
+def start_server(latency):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ListingHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.requests = 0
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def old_read(url_prefix, subreddits, posts):
+    """
+    The fetch loop read() used to have: one subreddit after another, a bare requests.get for every page and a 50ms
+    sleep per subreddit.
+    """
+    for category, values in subreddits.items():
+        for subreddit_name in values:
+            time.sleep(0.05)
+            post_counter = 0
+            current_after = ''
+            while post_counter < posts:
+                subreddit_url = '{}{}/new/.json?limit=100'.format(url_prefix, subreddit_name)
+                if current_after:
+                    subreddit_url = '{}&after={}'.format(subreddit_url, current_after)
+                reddit_response = requests.get(subreddit_url, headers={'User-Agent': 'bench'}).json()['data']
+                current_after = reddit_response['after']
+                post_counter += len(reddit_response['children'])
+
+
+def new_read(url_prefix, subreddits, posts, workers, output_filepath, cache=None):
+    reddit_client = MultiRedditReader(posts=posts, stage='training', workers=workers, rate=0, dedup=None, cache=cache)
+    reddit_client.subreddits = subreddits
+    reddit_client.subreddit_url_prefix = url_prefix
+    reddit_client.output_filepath = output_filepath
+    reddit_client.checkpoint_filepath = output_filepath
+    reddit_client.destination_dir = None
+    reddit_client.read()
+
+
+def main():
+    import argparse
+    import contextlib
+    import io
+
+    parser = argparse.ArgumentParser(description='Benchmark MultiRedditReader.read() against a local stub server.')
+    parser.add_argument('--posts', type=int, default=1000, help='Posts per subreddit. (default: 1000)')
+    parser.add_argument('--subreddits', type=int, default=22, help='Number of subreddits. (default: 22)')
+    parser.add_argument('--latency', type=float, default=0.05, help='Stub server latency in seconds. (default: 0.05)')
+    parser.add_argument('--workers', type=int, default=8, help='Workers for the new reader. (default: 8)')
+    flags = parser.parse_args()
+
+    server = start_server(flags.latency)
+    url_prefix = 'http://127.0.0.1:{}/r/'.format(server.server_address[1])
+    names = ['sub{:02d}'.format(index) for index in range(flags.subreddits)]
+    subreddits = {'interest': names[:len(names) // 2], 'avoid': names[len(names) // 2:]}
+    output_filepath = tempfile.mkdtemp() + '/'
+    cache_directory = tempfile.mkdtemp()
+
+    def timed_read(cache=None):
+        requests_before = server.requests
+        started = time.time()
+        with contextlib.redirect_stdout(io.StringIO()):
+            new_read(url_prefix, subreddits, flags.posts, flags.workers, output_filepath, cache)
+        with open('{}training-interest.txt'.format(output_filepath), 'rb') as category_file:
+            digest = hashlib.sha1(category_file.read()).hexdigest()
+        return time.time() - started, server.requests - requests_before, digest
+
+    try:
+        started = time.time()
+        old_read(url_prefix, subreddits, flags.posts)
+        old_seconds = time.time() - started
+
+        results = [('new read()', timed_read())]
+        # The first cached run fills the cache, the next one revalidates every page and gets 304s back.
+        results.append(('cold cache', timed_read(ResponseCache(cache_directory))))
+        results.append(('revalidated', timed_read(ResponseCache(cache_directory))))
+        results.append(('fresh cache', timed_read(ResponseCache(cache_directory, max_age=3600))))
+        results.append(('offline', timed_read(ResponseCache(cache_directory, offline=True))))
+    finally:
+        server.shutdown()
+        shutil.rmtree(output_filepath)
+        shutil.rmtree(cache_directory)
+
+    pages = flags.subreddits * ((flags.posts + 99) // 100)
+    print('{} pages from {} subreddits at {:.0f}ms latency'.format(pages, flags.subreddits, flags.latency * 1000))
+    print('{:<14}{:>8.2f}s'.format('old read()', old_seconds))
+    for name, (seconds, requests_made, digest) in results:
+        print('{:<14}{:>8.2f}s{:>8} requests  {:.1f}x faster  sha1 {}'.format(
+            name, seconds, requests_made, old_seconds / seconds, digest[:12]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Times decoding reddit listing pages in full, the way the readers used to, against listing_parser's projected decode
+# with each installed backend. Run from the repo root: python -m benchmarks.listing_benchmark
+#
+# Pages come from a ResponseCache directory if given one (i.e. one filled by a reader run with --cache), otherwise
+# they're generated to look like reddit's: every post carries the ~100 fields a real listing does, previews and all.
+
+import json
+import random
+import sys
+import time
+
+from datasettoolkit.listing_parser import BACKENDS, parse_listing
+from datasettoolkit.response_cache import ResponseCache
+
+
+def fake_post(rng, subreddit, index):
+    """
+    A post shaped like one from /r/<subreddit>/new/.json, with made up values.
+    """
+    post_id = '{:x}{:04d}'.format(rng.getrandbits(24), index)
+    words = ['rocket', 'launch', 'model', 'data', 'the', 'a', 'of', 'engine', 'orbit', 'python', 'and', 'why']
+    title = ' '.join(rng.choice(words) for _ in range(rng.randint(4, 15))).capitalize()
+    is_self = rng.random() < 0.6
+    selftext = ' '.join(rng.choice(words) for _ in range(rng.randint(0, 300))) if is_self else ''
+    image = {'url': 'https://preview.redd.it/{}.jpg?auto=webp&s={:x}'.format(post_id, rng.getrandbits(64)),
+             'width': 1080, 'height': 720}
+
+    data = {
+        'approved_at_utc': None, 'subreddit': subreddit, 'selftext': selftext, 'author_fullname': 't2_{:x}'.format(
+            rng.getrandbits(32)), 'saved': False, 'mod_reason_title': None, 'gilded': 0, 'clicked': False,
+        'title': title, 'link_flair_richtext': [{'e': 'text', 't': 'Discussion'}], 'subreddit_name_prefixed':
+            'r/{}'.format(subreddit), 'hidden': False, 'pwls': 6, 'link_flair_css_class': 'discussion', 'downs': 0,
+        'thumbnail_height': 140, 'top_awarded_type': None, 'hide_score': True, 'name': 't3_{}'.format(post_id),
+        'quarantine': False, 'link_flair_text_color': 'dark', 'upvote_ratio': round(rng.random(), 2),
+        'author_flair_background_color': None, 'subreddit_type': 'public', 'ups': rng.randint(0, 5000),
+        'total_awards_received': 0, 'media_embed': {}, 'thumbnail_width': 140, 'author_flair_template_id': None,
+        'is_original_content': False, 'user_reports': [], 'secure_media': None, 'is_reddit_media_domain': not is_self,
+        'is_meta': False, 'category': None, 'secure_media_embed': {}, 'link_flair_text': 'Discussion',
+        'can_mod_post': False, 'score': rng.randint(0, 5000), 'approved_by': None, 'is_created_from_ads_ui': False,
+        'author_premium': rng.random() < 0.1, 'thumbnail': 'self' if is_self else image['url'], 'edited': False,
+        'author_flair_css_class': None, 'author_flair_richtext': [], 'gildings': {}, 'post_hint': 'image',
+        'content_categories': None, 'is_self': is_self, 'mod_note': None, 'created': 1.6e9 + index,
+        'link_flair_type': 'richtext', 'wls': 6, 'removed_by_category': None, 'banned_by': None,
+        'author_flair_type': 'text', 'domain': 'self.{}'.format(subreddit) if is_self else 'i.redd.it',
+        'allow_live_comments': False, 'selftext_html': '&lt;!-- SC_OFF --&gt;&lt;div class="md"&gt;&lt;p&gt;{}'
+            '&lt;/p&gt;&lt;/div&gt;&lt;!-- SC_ON --&gt;'.format(selftext) if is_self else None,
+        'likes': None, 'suggested_sort': None, 'banned_at_utc': None, 'url_overridden_by_dest': image['url'],
+        'view_count': None, 'archived': False, 'no_follow': True, 'is_crosspostable': True, 'pinned': False,
+        'over_18': False, 'preview': {'images': [{'source': image, 'resolutions': [
+            dict(image, width=width, height=width * 2 // 3) for width in (108, 216, 320, 640, 960)
+        ], 'variants': {}, 'id': '{:x}'.format(rng.getrandbits(64))}], 'enabled': True},
+        'all_awardings': [], 'awarders': [], 'media_only': False, 'link_flair_template_id': '{:x}'.format(
+            rng.getrandbits(64)), 'can_gild': True, 'spoiler': False, 'locked': False, 'author_flair_text': None,
+        'treatment_tags': [], 'visited': False, 'removed_by': None, 'num_reports': None, 'distinguished': None,
+        'subreddit_id': 't5_2r{:x}'.format(rng.getrandbits(16)), 'author_is_blocked': False, 'mod_reason_by': None,
+        'removal_reason': None, 'link_flair_background_color': '#ffd635', 'id': post_id, 'is_robot_indexable': True,
+        'report_reasons': None, 'author': 'user{}'.format(rng.getrandbits(20)), 'discussion_type': None,
+        'num_comments': rng.randint(0, 500), 'send_replies': True, 'whitelist_status': 'all_ads',
+        'contest_mode': False, 'mod_reports': [], 'author_patreon_flair': False, 'author_flair_text_color': None,
+        'permalink': '/r/{}/comments/{}/post/'.format(subreddit, post_id), 'parent_whitelist_status': 'all_ads',
+        'stickied': False, 'url': image['url'], 'subreddit_subscribers': 1234567, 'created_utc': 1.6e9 + index,
+        'num_crossposts': 0, 'media': None, 'is_video': False
+    }
+    return {'kind': 't3', 'data': data}
+
+
+def fake_pages(count, seed=0):
+    rng = random.Random(seed)
+    pages = []
+    for page in range(count):
+        children = [fake_post(rng, 'sub{:02d}'.format(page % 20), index) for index in range(100)]
+        pages.append(json.dumps({'kind': 'Listing', 'data': {
+            'after': 't3_{}'.format(children[-1]['data']['id']), 'dist': 100, 'modhash': '', 'geo_filter': None,
+            'children': children, 'before': None
+        }}).encode('utf-8'))
+    return pages
+
+
+def cached_pages(directory):
+    cache = ResponseCache(directory)
+    pages = []
+    for key in cache.lru:
+        object_name, _ = cache.lru[key]
+        with open(cache.object_path(object_name), 'rb') as object_file:
+            pages.append(object_file.read())
+    return pages
+
+
+def full_decode(body):
+    """
+    What the readers did before: requests' response.json()['data'], keeping every field of every post.
+    """
+    return json.loads(body.decode('utf-8'))['data']
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark decoding listing pages in full against projecting them.')
+    parser.add_argument('--pages', type=int, default=200, help='Number of generated pages. (default: 200)')
+    parser.add_argument('--cache', default=None, help='Use the pages in this ResponseCache directory instead.')
+    parser.add_argument('--repeat', type=int, default=3, help='Take the best of this many runs. (default: 3)')
+    flags = parser.parse_args()
+
+    pages = cached_pages(flags.cache) if flags.cache else fake_pages(flags.pages)
+    if not pages:
+        print('No pages to decode.')
+        sys.exit(1)
+    megabytes = sum(len(page) for page in pages) / 1024.0 / 1024.0
+    print('{} pages, {:.1f}MB, {}'.format(len(pages), megabytes, flags.cache or 'generated'))
+
+    expected = [
+        [sorted(child['data'].items()) for child in parse_listing(page, backend='json')['children']]
+        for page in pages
+    ]
+
+    decoders = [('full json', full_decode)] + [
+        (backend, lambda page, backend=backend: parse_listing(page, backend=backend)) for backend in BACKENDS
+    ]
+    baseline = None
+    print('{:<12}{:>10}{:>10}{:>10}'.format('', 'seconds', 'MB/s', 'speedup'))
+    for name, decode in decoders:
+        seconds = None
+        for _ in range(flags.repeat):
+            started = time.perf_counter()
+            decoded = [decode(page) for page in pages]
+            elapsed = time.perf_counter() - started
+            seconds = elapsed if seconds is None else min(seconds, elapsed)
+
+        if name != 'full json':
+            got = [[sorted(child['data'].items()) for child in listing['children']] for listing in decoded]
+            if got != expected:
+                print('{} does not match the stdlib decode!'.format(name))
+        baseline = baseline or seconds
+        print('{:<12}{:>10.3f}{:>10.1f}{:>9.1f}x'.format(name, seconds, megabytes / seconds, baseline / seconds))
+
+
+if __name__ == '__main__':
+    main()
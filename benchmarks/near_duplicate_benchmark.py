@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Times NearDuplicateFilter over growing corpora of generated windows, some of them edited copies of earlier ones, and
+# reports how many of the copies it caught. Run from the repo root: python -m benchmarks.near_duplicate_benchmark
+
+import random
+import resource
+import time
+
+from datasettoolkit.near_duplicates import NearDuplicateFilter
+
+
+def corpus(count, width, duplicate_share, edited_words, seed=0):
+    """
+    Generate windows of random words. duplicate_share of them are copies of a recent window with edited_words words
+    swapped out, like a repost with a tweaked title.
+
+    :return: Generator of (line, is_copy).
+    """
+    rng = random.Random(seed)
+    vocabulary = ['w{}'.format(index) for index in range(20000)]
+    recent = []
+    for _ in range(count):
+        if recent and rng.random() < duplicate_share:
+            words = list(rng.choice(recent))
+            for position in rng.sample(range(width), edited_words):
+                words[position] = rng.choice(vocabulary)
+            yield ' '.join(words), True
+            continue
+
+        words = [rng.choice(vocabulary) for _ in range(width)]
+        recent.append(words)
+        if len(recent) > 1000:
+            recent.pop(0)
+        yield ' '.join(words), False
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark the near duplicate filter.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help='Corpus sizes, in windows. (default: 10000 100000 1000000)')
+    parser.add_argument('--width', type=int, default=30, help='Words per window. (default: 30)')
+    parser.add_argument('--duplicates', type=float, default=0.1,
+                        help='Share of windows that are copies. (default: 0.1)')
+    parser.add_argument('--edited', type=int, default=1, help='Words changed in each copy. (default: 1)')
+    parser.add_argument('--threshold', type=float, default=0.7, help='Similarity threshold. (default: 0.7)')
+    flags = parser.parse_args()
+
+    print('{:>10}{:>10}{:>14}{:>10}{:>14}{:>14}'.format(
+        'windows', 'seconds', 'windows/s', 'copies', 'caught', 'peak RSS MB'))
+    for size in flags.sizes:
+        near_duplicates = NearDuplicateFilter(threshold=flags.threshold)
+        windows = list(corpus(size, flags.width, flags.duplicates, flags.edited))
+        copies = sum(is_copy for _, is_copy in windows)
+
+        started = time.time()
+        kept = list(near_duplicates.filter(windows, key=lambda window: window[0]))
+        seconds = time.time() - started
+
+        caught = copies - sum(is_copy for _, is_copy in kept)
+        print('{:>10}{:>10.2f}{:>14.0f}{:>10}{:>13.1f}%{:>14.1f}'.format(
+            size, seconds, size / seconds, copies, 100.0 * caught / max(copies, 1),
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# A small online text classifier for the interactive labellers, so they can ask about the lines it's least sure of and
+# label the ones it's sure of by itself.
+
+import os
+import zlib
+from collections import deque
+
+import numpy
+
+from datasettoolkit import normalizer
+
+
+def hashed_features(text, n_features, ngrams=2):
+    """
+    Hash a text's word n-grams into a sparse feature vector.
+
+    :param text: The text, as a string or bytes.
+    :param n_features: Size of the feature space. Each n-gram lands in one of this many buckets.
+    :param ngrams: Use every n-gram of 1 up to this many words.
+    :return: Tuple of (indexes, values): the distinct buckets hit, and their counts scaled so the vector has unit
+    length.
+    """
+    if not isinstance(text, bytes):
+        text = text.encode('utf-8', 'replace')
+    words = normalizer.normalize(text).split() or [b'']
+
+    hashes = []
+    for n in range(1, ngrams + 1):
+        for position in range(len(words) - n + 1):
+            hashes.append(zlib.crc32(b' '.join(words[position:position + n])))
+
+    indexes, counts = numpy.unique(numpy.array(hashes, dtype=numpy.int64) % n_features, return_counts=True)
+    values = counts.astype(numpy.float32)
+    values /= numpy.sqrt(numpy.dot(values, values))
+    return indexes, values
+
+
+class ActiveLearner:
+    def __init__(self, n_labels, n_features=1 << 18, ngrams=2, learning_rate=1.0, l2=1e-6, confidence=0.95,
+                 warmup=5, audit_every=10, check_window=50):
+        """
+        Multinomial logistic regression over hashed n-gram features, trained by SGD one answer at a time. An update
+        only touches the weights for the n-grams in that one text, so it takes microseconds however big the model is.
+
+        The labellers use it two ways: items it's confident about are labelled without asking, and the rest are asked
+        about in order of how unsure it is, preferring items that look like they belong to labels that still need
+        examples. See rank().
+
+        A model trained on the items it was least sure of is often overconfident about the rest, so its confidence
+        isn't taken on trust. Now and then an item it's confident about is asked about anyway, and it only labels
+        items by itself while those spot checks show it's right at least confidence of the time.
+
+        :param n_labels: Number of output labels.
+        :param n_features: Size of the hashed feature space.
+        :param ngrams: Use every n-gram of 1 up to this many words.
+        :param learning_rate: SGD step size.
+        :param l2: L2 penalty on the weights touched by an update.
+        :param confidence: Label an item without asking once the model gives one label at least this probability.
+        :param warmup: Don't label anything without asking until every label has had this many answers.
+        :param audit_every: Once trusted, ask about one confident item for every this many labelled without asking.
+        Until then, every other question is about a confident item, if there are any.
+        :param check_window: Judge the model on this many of its latest spot checks.
+        """
+        self.n_labels = n_labels
+        self.n_features = n_features
+        self.ngrams = ngrams
+        self.learning_rate = learning_rate
+        self.l2 = l2
+        self.confidence = confidence
+        self.warmup = warmup
+        self.audit_every = audit_every
+
+        self.weights = numpy.zeros((n_features, n_labels), dtype=numpy.float32)
+        self.bias = numpy.zeros(n_labels, dtype=numpy.float32)
+        self.answers = numpy.zeros(n_labels, dtype=numpy.int64)
+        # Whether the model got each spot check right, and how many items have gone by since the last one.
+        self.checks = deque(maxlen=check_window)
+        self.since_check = 0
+        return
+
+    def features(self, text):
+        """
+        :param text: The text, as a string or bytes.
+        :return: Its (indexes, values) feature vector, see hashed_features().
+        """
+        return hashed_features(text, self.n_features, self.ngrams)
+
+    @property
+    def trusted(self):
+        """
+        :return: True once every label has had enough answers, and the spot checks show the model's confident
+        predictions are right often enough, smoothed so a handful of lucky checks isn't enough.
+        """
+        if self.answers.min() < self.warmup:
+            return False
+        return (sum(self.checks) + 1.0) / (len(self.checks) + 2.0) >= self.confidence
+
+    def probabilities(self, feature_vectors):
+        """
+        Score a batch of items at once.
+
+        :param feature_vectors: List of (indexes, values) from features().
+        :return: Array of shape [len(feature_vectors), n_labels], each row the probability of each label.
+        """
+        if not feature_vectors:
+            return numpy.zeros((0, self.n_labels), dtype=numpy.float32)
+
+        indexes = numpy.concatenate([vector[0] for vector in feature_vectors])
+        values = numpy.concatenate([vector[1] for vector in feature_vectors])
+        starts = numpy.cumsum([0] + [len(vector[0]) for vector in feature_vectors[:-1]])
+
+        logits = numpy.add.reduceat(self.weights[indexes] * values[:, None], starts, axis=0) + self.bias
+        return self.softmax(logits)
+
+    @staticmethod
+    def softmax(logits):
+        exponents = numpy.exp(logits - logits.max(axis=-1, keepdims=True))
+        return exponents / exponents.sum(axis=-1, keepdims=True)
+
+    def update(self, feature_vector, label):
+        """
+        Take one SGD step towards the given answer.
+
+        :param feature_vector: The item's (indexes, values) from features().
+        :param label: The index of the label the user gave it.
+        :return:
+        """
+        indexes, values = feature_vector
+        rows = self.weights[indexes]
+        gradient = self.softmax(numpy.dot(values, rows) + self.bias)
+        if gradient.max() >= self.confidence:
+            self.checks.append(bool(gradient.argmax() == label))
+        self.since_check += 1
+        gradient[label] -= 1.0
+
+        rows *= 1.0 - self.learning_rate * self.l2
+        rows -= self.learning_rate * numpy.outer(values, gradient)
+        self.weights[indexes] = rows
+        self.bias -= self.learning_rate * gradient
+        self.answers[label] += 1
+        return
+
+    def rank(self, feature_vectors, wanted=None):
+        """
+        Decide what to do with a pool of unlabelled items.
+
+        :param feature_vectors: List of (indexes, values) from features(), one per item.
+        :param wanted: Optional array of n_labels booleans, False for labels that already have all the examples they
+        need. Items confidently of those labels are reported so they can be dropped, and asking about items that look
+        like them is put off.
+        :return: Tuple of (confident, order, probabilities): a dict of item index to label for items to label without
+        asking, the indexes of the rest from most to least worth asking about, and every item's label probabilities.
+        The first item in order should be asked about next, since it may be a spot check.
+        """
+        probabilities = self.probabilities(feature_vectors)
+        if wanted is None:
+            wanted = numpy.ones(self.n_labels, dtype=bool)
+
+        best = probabilities.argmax(axis=1)
+        sure = probabilities.max(axis=1) >= self.confidence
+
+        # Least-confidence uncertainty, weighted by how likely the item is to fill a label that still needs examples.
+        # Before the model has learnt anything every item scores the same, and the stable sort keeps them in order.
+        priority = (1.0 - probabilities.max(axis=1)) * probabilities[:, wanted].sum(axis=1)
+        order = [int(index) for index in numpy.argsort(-priority, kind='stable') if not sure[index]]
+
+        sure_indexes = [int(index) for index in numpy.flatnonzero(sure)]
+        trusted = self.trusted
+        if sure_indexes and self.since_check >= (self.audit_every if trusted else 2):
+            # Ask about the first confident item as a spot check.
+            order.insert(0, sure_indexes.pop(0))
+            self.since_check = 0
+
+        if not trusted:
+            # Confident items are still worth asking about, just after everything else.
+            order.extend(sure_indexes)
+            return {}, order, probabilities
+
+        confident = dict((index, int(best[index])) for index in sure_indexes)
+        self.since_check += len(confident)
+        return confident, order, probabilities
+
+    def save(self, filepath):
+        """
+        Save the model to a .npz file, atomically.
+
+        :param filepath: The file to write.
+        :return:
+        """
+        temp_filepath = '{}.tmp.npz'.format(filepath)
+        numpy.savez(temp_filepath, weights=self.weights, bias=self.bias, answers=self.answers,
+                    checks=numpy.array(self.checks, dtype=bool), since_check=self.since_check)
+        os.replace(temp_filepath, filepath)
+        return
+
+    def load(self, filepath):
+        """
+        Load a model written by save(). It must have the same number of labels and features as this one.
+
+        :param filepath: The file to read.
+        :return:
+        """
+        with numpy.load(filepath) as model:
+            if model['weights'].shape != self.weights.shape:
+                raise ValueError('{} has shape {}, expected {}.'.format(
+                    filepath, model['weights'].shape, self.weights.shape))
+            self.weights = model['weights']
+            self.bias = model['bias']
+            self.answers = model['answers']
+            self.checks.extend(model['checks'].tolist())
+            self.since_check = int(model['since_check'])
+        return
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Reads and writes gzip and zstd compressed datasets, picked by file extension, so archives don't need unpacking first.
+
+import gzip
+import io
+import queue
+import threading
+
+from datasettoolkit.metrics import Metrics
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Compression name to file extension.
+EXTENSIONS = {
+    'gzip': '.gz',
+    'zstd': '.zst'
+}
+
+# Levels that trade a little size for a lot of speed, unlike gzip's default of 9.
+DEFAULT_LEVELS = {
+    'gzip': 6,
+    'zstd': 3
+}
+
+
+def compression_of(filepath):
+    """
+    :param filepath: A file path or name.
+    :return: "gzip" or "zstd" if it ends in .gz or .zst, otherwise None.
+    """
+    for compression, extension in EXTENSIONS.items():
+        if filepath.endswith(extension):
+            return compression
+    return None
+
+
+def strip_compression(filepath):
+    """
+    :param filepath: A file path or name, i.e. "dataset.csv.gz".
+    :return: The path without its compression extension, i.e. "dataset.csv".
+    """
+    compression = compression_of(filepath)
+    return filepath[:-len(EXTENSIONS[compression])] if compression else filepath
+
+
+def require(compression):
+    """
+    Check the compression is one that can be used here.
+
+    :param compression: "gzip" or "zstd".
+    :return:
+    """
+    if compression not in EXTENSIONS:
+        raise ValueError('compression must be "gzip" or "zstd", not "{}".'.format(compression))
+    if compression == 'zstd' and zstandard is None:
+        raise ImportError('zstd files need the zstandard package: pip install zstandard')
+    return
+
+
+def open_decompressor(filepath):
+    """
+    :param filepath: A .gz or .zst file.
+    :return: Binary file object of the decompressed contents. Concatenated gzip members or zstd frames, as appending
+    writes, are read as one stream.
+    """
+    compression = compression_of(filepath)
+    require(compression)
+    if compression == 'gzip':
+        return gzip.open(filepath, 'rb')
+    return zstandard.ZstdDecompressor().stream_reader(open(filepath, 'rb'), read_across_frames=True, closefd=True)
+
+
+def open_compressor(raw_file, compression, level=None):
+    """
+    :param raw_file: Binary file object to write the compressed data to, which stays open when the compressor is
+    closed. Anything already in it is kept, and the compressed data starts a new gzip member or zstd frame after it.
+    :param compression: "gzip" or "zstd".
+    :param level: Optional compression level. Defaults to DEFAULT_LEVELS.
+    :return: Binary file object to write the uncompressed data to. Close it to finish the member or frame.
+    """
+    require(compression)
+    level = DEFAULT_LEVELS[compression] if level is None else level
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=raw_file, mode='wb', compresslevel=level)
+    return zstandard.ZstdCompressor(level=level).stream_writer(raw_file, closefd=False)
+
+
+class BackgroundReader(io.BufferedIOBase):
+    def __init__(self, source, chunk_size=1048576, queue_chunks=4, metrics=None):
+        """
+        Reads a file object, i.e. a decompressor, on a thread of its own, keeping up to queue_chunks chunks ahead of
+        whoever reads from this. zlib and zstd let go of the GIL while they decompress, so decompressing the next chunk
+        overlaps with cleaning the last one rather than taking turns with it.
+
+        A read of chunk_size bytes, as the cleaner makes, hands back the chunk the thread read without copying it.
+
+        :param source: Binary file object to read from. It's closed along with this.
+        :param chunk_size: Bytes to read from the source at a time.
+        :param queue_chunks: The most chunks to read ahead.
+        :param metrics: Optional Metrics to record time spent decompressing in.
+        """
+        io.BufferedIOBase.__init__(self)
+        self.source = source
+        self.chunk_size = chunk_size
+        self.metrics = metrics or Metrics()
+        self.chunks = queue.Queue(maxsize=queue_chunks)
+        self.stopped = threading.Event()
+        self.chunk = b''
+        self.offset = 0
+        self.finished = False
+
+        self.reader = threading.Thread(target=self.read_source)
+        self.reader.daemon = True
+        self.reader.start()
+        return
+
+    def read_source(self):
+        """
+        Put each chunk of the source on the queue, then b'' once it's done, or the exception if reading it fails.
+
+        :return:
+        """
+        try:
+            while True:
+                with self.metrics.timer('decompress'):
+                    chunk = self.source.read(self.chunk_size)
+                if not self.put(chunk) or not chunk:
+                    return
+        except Exception as e:
+            self.put(e)
+
+    def put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def readable(self):
+        return True
+
+    def next_chunk(self):
+        """
+        Take the next chunk off the queue, once the current one is used up.
+
+        :return: False at the end of the source.
+        """
+        if self.finished:
+            return False
+        with self.metrics.timer('decompress.wait'):
+            chunk = self.chunks.get()
+        if isinstance(chunk, Exception):
+            self.finished = True
+            raise chunk
+        if not chunk:
+            self.finished = True
+            return False
+        self.chunk = chunk
+        self.offset = 0
+        return True
+
+    def read1(self, size=-1):
+        """
+        :param size: The most bytes to return, or -1 for the rest of the current chunk.
+        :return: Up to size bytes from a single chunk, b'' at the end of the source.
+        """
+        if self.offset == len(self.chunk) and not self.next_chunk():
+            return b''
+        if self.offset == 0 and (size < 0 or size >= len(self.chunk)):
+            self.offset = len(self.chunk)
+            return self.chunk
+
+        end = len(self.chunk) if size < 0 else min(self.offset + size, len(self.chunk))
+        data = self.chunk[self.offset:end]
+        self.offset = end
+        return data
+
+    def read(self, size=-1):
+        """
+        :param size: The most bytes to return, or -1 for all of them.
+        :return: size bytes, fewer only at the end of the source.
+        """
+        pieces = []
+        remaining = size
+        while remaining != 0:
+            data = self.read1(remaining)
+            if not data:
+                break
+            pieces.append(data)
+            if remaining > 0:
+                remaining -= len(data)
+        return pieces[0] if len(pieces) == 1 else b''.join(pieces)
+
+    def close(self):
+        if self.closed:
+            return
+        # Let the thread go if it's waiting for room on the queue.
+        self.stopped.set()
+        self.reader.join()
+        self.source.close()
+        io.BufferedIOBase.close(self)
+        return
+
+
+def open_input(filepath, chunk_size=1048576, metrics=None):
+    """
+    Open a file to read, decompressing it in the background if it ends in .gz or .zst.
+
+    :param filepath: The file.
+    :param chunk_size: Bytes to decompress at a time.
+    :param metrics: Optional Metrics to record time spent decompressing in.
+    :return: Binary file object. Only a plain file can seek.
+    """
+    if compression_of(filepath) is None:
+        return open(filepath, 'rb')
+    return BackgroundReader(open_decompressor(filepath), chunk_size=chunk_size, metrics=metrics)
@@ -0,0 +1,363 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Splits labelled datasets into training, eval and test sets, optionally rebalancing the classes.
+
+import csv
+import hashlib
+import io
+import os
+import random
+from contextlib import ExitStack
+
+from datasettoolkit import compression
+from datasettoolkit.npy_sink import PAD_ID, load_windows
+from datasettoolkit.text_cleaning_and_labelling import TextCleaningAndLabellingClient
+
+SPLITS = ('training', 'eval', 'test')
+
+
+def split_fraction(line, salt=''):
+    """
+    Hash a record's text to a number in [0, 1), the same on every run and every machine.
+
+    :param line: The cleaned line.
+    :param salt: Mixed into the hash, so a different salt gives an independent split of the same data.
+    :return: The fraction.
+    """
+    digest = hashlib.blake2b('{}\n{}'.format(salt, line).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') / float(1 << 64)
+
+
+class Reservoir:
+    def __init__(self, capacity, rng):
+        """
+        A uniform random sample of at most capacity items from a stream of unknown length (Vitter's algorithm R).
+
+        :param capacity: The most items to keep.
+        :param rng: The random.Random to sample with.
+        """
+        self.capacity = capacity
+        self.rng = rng
+        self.items = []
+        self.seen = 0
+        return
+
+    def add(self, item):
+        self.seen += 1
+        if len(self.items) < self.capacity:
+            self.items.append(item)
+        else:
+            position = self.rng.randrange(self.seen)
+            if position < self.capacity:
+                self.items[position] = item
+        return
+
+    def sample(self, count):
+        """
+        :param count: How many items to draw. More than were kept repeats items, drawn with replacement, once every
+        kept item has been used once.
+        :return: List of items.
+        """
+        if count <= len(self.items):
+            return self.rng.sample(self.items, count)
+        if not self.items:
+            return []
+        return self.items + [self.rng.choice(self.items) for _ in range(count - len(self.items))]
+
+
+class DatasetSplitter:
+    def __init__(self, client, ratios=(0.8, 0.1, 0.1), splits=SPLITS, salt='', resample=None, class_ratios=None,
+                 rebalance=('training',), max_class_rows=1000000, seed=0):
+        """
+        Streams through labelled .csv or .npy datasets once and writes each record to one of the splits, i.e.
+        training.csv, eval.csv and test.csv.
+
+        Which split a record goes to depends only on a hash of its text, see split_fraction(). The split is the same
+        every time the data is split, a record that turns up again in a later harvest lands in the same split as
+        before, and identical records can never end up on both sides of a train/eval boundary. Changing the ratios
+        only moves the records near the boundaries between splits.
+
+        The split is by record, not by post. The cleaned datasets don't carry the post a window was cut from, and the
+        cleaner runs posts together before windowing, so the hash is over each window's text: different windows cut
+        from one long post can land in different splits, and a model can still see part of a post in training that
+        it's evaluated on. Split the raw harvests by post first where that matters. Nor are the splits stratified by
+        class: every label gets the given ratios only on average, and a rare class can come out short in a small
+        split. Resampling only evens out the classes within the splits named in rebalance.
+
+        The splits named in rebalance can also be resampled towards class_ratios. Each class in such a split is
+        sampled into a reservoir of at most max_class_rows records while streaming, which bounds memory however big
+        the input is, and once the input is done the reservoirs decide how many of each class to write:
+
+        'down' shrinks every class to the size of the one that's smallest relative to its ratio.
+        'up' grows every class to the size of the one that's largest relative to its ratio, repeating records drawn
+        at random from the smaller ones.
+
+        Either way no class ends up with more than max_class_rows records. Resampled splits are written in the order
+        their records were read. Splits that aren't resampled are written as they're read, without holding anything
+        in memory.
+
+        :param client: The TextCleaningAndLabellingClient to write the splits with. Its output format, buffering and
+        vocabulary settings apply, and with the npy output format every label has to be one of its output_labels.
+        :type client: TextCleaningAndLabellingClient
+        :param ratios: The share of records each split gets, in the same order as splits.
+        :type ratios: tuple
+        :param splits: The names of the splits, which are also their output filenames.
+        :type splits: tuple
+        :param salt: Passed to split_fraction().
+        :type salt: str
+        :param resample: [None, 'down', 'up'] How to rebalance the splits named in rebalance.
+        :type resample: str
+        :param class_ratios: Optional dict of label to the share of a rebalanced split it should have. Labels left out
+        of it are dropped from rebalanced splits. By default every label gets the same share.
+        :type class_ratios: dict
+        :param rebalance: The splits to resample. The others keep the classes as they came.
+        :type rebalance: tuple
+        :param max_class_rows: The most records of one class to keep in memory, and so to write, for a rebalanced
+        split.
+        :type max_class_rows: int
+        :param seed: Seed for the reservoirs, so resampling the same input gives the same output.
+        :type seed: int
+        """
+        if len(ratios) != len(splits):
+            raise ValueError('Got {} ratios for {} splits.'.format(len(ratios), len(splits)))
+        if min(ratios) < 0 or not sum(ratios):
+            raise ValueError('Split ratios must be positive, got {}.'.format(ratios))
+        if resample not in (None, 'down', 'up'):
+            raise ValueError('resample must be None, "down" or "up", not "{}".'.format(resample))
+        unknown = [split for split in rebalance if split not in splits]
+        if unknown:
+            raise ValueError('Cannot rebalance {}, the splits are {}.'.format(', '.join(unknown), ', '.join(splits)))
+
+        self.client = client
+        self.splits = splits
+        # The upper end of each split's range of hash fractions.
+        total = float(sum(ratios))
+        self.boundaries = [sum(ratios[:index + 1]) / total for index in range(len(ratios))]
+        self.salt = salt
+        self.resample = resample
+        self.class_ratios = class_ratios
+        self.rebalance = rebalance if resample else ()
+        self.max_class_rows = max_class_rows
+        self.seed = seed
+        return
+
+    def split_for(self, line):
+        """
+        :param line: A record's cleaned line.
+        :return: The name of the split it belongs in.
+        """
+        fraction = split_fraction(line, self.salt)
+        for split, boundary in zip(self.splits, self.boundaries):
+            if fraction < boundary:
+                return split
+        return self.splits[-1]
+
+    def output_filepaths(self, output_dir):
+        """
+        :param output_dir: The directory to write the splits to.
+        :return: Dict of split name to its absolute output path, in the client's output format and compression.
+        """
+        extension = '.npy' if self.client.output_format == 'npy' else '.csv'
+        if extension == '.csv' and self.client.output_compression:
+            extension += compression.EXTENSIONS[self.client.output_compression]
+        return dict(
+            (split, os.path.abspath(os.path.join(output_dir, '{}{}'.format(split, extension))))
+            for split in self.splits
+        )
+
+    def records(self, filepath, chunk_rows=10000):
+        """
+        Read a labelled dataset a record at a time.
+
+        :param filepath: A labelled .csv file, which can be compressed as .csv.gz or .csv.zst, or a .npy file written by
+        NpySink with its .labels.npy and .vocab. A .npy file's labels are indexes into the client's output_labels.
+        :param chunk_rows: Rows of a .npy file to decode at a time.
+        :return: Generator of (line, label).
+        """
+        if filepath.endswith('.npy'):
+            ids, labels, vocabulary = load_windows(filepath)
+            if labels is None:
+                raise ValueError('{} has no labels to split by.'.format(filepath))
+            output_labels = self.client.output_labels
+            for start in range(0, len(ids), chunk_rows):
+                rows = ids[start:start + chunk_rows].tolist()
+                for row, label in zip(rows, labels[start:start + chunk_rows].tolist()):
+                    yield ' '.join(vocabulary[token_id] for token_id in row if token_id != PAD_ID), output_labels[label]
+            return
+
+        if not compression.strip_compression(filepath).endswith('.csv'):
+            raise ValueError('Can only split labelled .csv and .npy files, not {}.'.format(filepath))
+        with io.TextIOWrapper(compression.open_input(filepath), encoding='utf-8', newline='') as input_file:
+            for row in csv.reader(input_file, dialect='excel'):
+                if len(row) != 2:
+                    raise ValueError('{} has a row that is not [line, label]: {}'.format(filepath, row))
+                yield row[0], row[1]
+
+    def split(self, filepaths, output_dir=None):
+        """
+        Split the given datasets, read one after the other, into one file per split.
+
+        Like the other outputs, every split is written through a sink: if anything goes wrong none of them replace
+        what was there before.
+
+        :param filepaths: List of labelled .csv or .npy files, in self.client.dataset_path unless absolute.
+        :param output_dir: Where to write the splits. Defaults to the directory of the first input.
+        :return: Dict of split name to dict of label to the number of records written.
+        """
+        filepaths = [os.path.join(self.client.dataset_path, filepath) for filepath in filepaths]
+        output_filepaths = self.output_filepaths(output_dir or os.path.dirname(filepaths[0]))
+        clobbered = set(os.path.abspath(path) for path in filepaths) & set(output_filepaths.values())
+        if clobbered:
+            raise ValueError('Splitting would overwrite the input {}.'.format(', '.join(sorted(clobbered))))
+
+        rng = random.Random(self.seed)
+        reservoirs = dict((split, {}) for split in self.rebalance)
+        counts = dict((split, {}) for split in self.splits)
+        build_vocab = self.client.build_vocab and self.client.output_format != 'npy'
+        vocabularies = dict((split, self.client.vocabulary_builder() if build_vocab else None) for split in self.splits)
+
+        with ExitStack() as stack:
+            sinks = dict(
+                (split, stack.enter_context(self.client.sink(output_filepaths[split], append=False)))
+                for split in self.splits
+            )
+
+            def write(split, line, label):
+                sinks[split].write([line, label])
+                if vocabularies[split] is not None:
+                    vocabularies[split].add(line.split())
+                counts[split][label] = counts[split].get(label, 0) + 1
+
+            position = 0
+            for filepath in filepaths:
+                for line, label in self.records(filepath):
+                    split = self.split_for(line)
+                    if split in reservoirs:
+                        if label not in reservoirs[split]:
+                            reservoirs[split][label] = Reservoir(self.max_class_rows, rng)
+                        reservoirs[split][label].add((position, line, label))
+                    else:
+                        write(split, line, label)
+                    position += 1
+
+            for split in self.rebalance:
+                for _, line, label in self.resampled(split, reservoirs[split], rng):
+                    write(split, line, label)
+
+        for split in self.splits:
+            if vocabularies[split] is not None:
+                self.client.write_vocabulary(output_filepaths[split], vocabularies[split])
+            print('{}: {} records, {}'.format(output_filepaths[split], sum(counts[split].values()), ', '.join(
+                '{} {}'.format(count, label) for label, count in sorted(counts[split].items()))))
+        return counts
+
+    def resampled(self, split, reservoirs, rng):
+        """
+        Draw a rebalanced split's records from its reservoirs.
+
+        :param split: The split's name, for messages.
+        :param reservoirs: Dict of label to the Reservoir of that class's records.
+        :param rng: The random.Random to draw with.
+        :return: List of (position, line, label), in the order they were read.
+        """
+        if self.class_ratios is None:
+            class_ratios = dict((label, 1.0) for label in reservoirs)
+        else:
+            class_ratios = dict((label, ratio) for label, ratio in self.class_ratios.items() if ratio > 0)
+
+        missing = sorted(label for label in class_ratios if label not in reservoirs)
+        if missing:
+            # A class with no records can't be grown, and shrinking the rest to match would leave nothing.
+            print('{} has no records labelled {}, rebalancing without them.'.format(split, ', '.join(missing)))
+        present = [label for label in class_ratios if label in reservoirs]
+        if not present:
+            return []
+
+        sizes = [reservoirs[label].seen / class_ratios[label] for label in present]
+        unit = min(sizes) if self.resample == 'down' else max(sizes)
+        unit = min([unit] + [self.max_class_rows / class_ratios[label] for label in present])
+
+        records = []
+        for label in present:
+            target = min(int(round(unit * class_ratios[label])), self.max_class_rows)
+            records.extend(reservoirs[label].sample(target))
+        # Sorting is stable, so a repeated record sits right after its first copy.
+        records.sort(key=lambda record: record[0])
+        return records
+
+
+def main():
+    """
+    Split labelled datasets into training, eval and test sets.
+    :return:
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Split labelled datasets into training, eval and test sets.')
+    parser.add_argument(
+        'filenames',
+        nargs='+',
+        help='Labelled .csv or .npy files in datasettoolkit/datasets/ to split, read one after the other.'
+    )
+    parser.add_argument(
+        '--ratios',
+        type=float,
+        nargs=3,
+        default=[0.8, 0.1, 0.1],
+        metavar=('TRAINING', 'EVAL', 'TEST'),
+        help='The share of records for each split. (default: 0.8 0.1 0.1)'
+    )
+    parser.add_argument(
+        '--salt',
+        default='',
+        help='Hash records with this salt, for a different split of the same data. (default: none)'
+    )
+    parser.add_argument(
+        '--resample',
+        choices=['down', 'up', 'none'],
+        default='none',
+        help='Rebalance the training split\'s classes by shrinking the big ones or growing the small ones. '
+             '(default: none)'
+    )
+    parser.add_argument(
+        '--class-ratio',
+        action='append',
+        default=[],
+        metavar='LABEL=RATIO',
+        help='The share of the training split a label should have when resampling, if not an equal one. Can be '
+             'repeated, labels left out are dropped.'
+    )
+    parser.add_argument(
+        '--max-class-rows',
+        type=int,
+        action='store',
+        default=1000000,
+        help='The most records of one class to hold in memory, and write, when resampling. (default: 1000000)'
+    )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        action='store',
+        default=0,
+        help='Seed for resampling. (default: 0)'
+    )
+    parser.add_argument(
+        '--output-dir',
+        default=None,
+        help='Where to write the splits. (default: alongside the first input)'
+    )
+
+    flags = parser.parse_args()
+    class_ratios = None
+    if flags.class_ratio:
+        class_ratios = dict(
+            (label, float(ratio)) for label, ratio in (item.rsplit('=', 1) for item in flags.class_ratio))
+
+    splitter = DatasetSplitter(TextCleaningAndLabellingClient(), ratios=tuple(flags.ratios), salt=flags.salt,
+                               resample=None if flags.resample == 'none' else flags.resample,
+                               class_ratios=class_ratios, max_class_rows=flags.max_class_rows, seed=flags.seed)
+    splitter.split(flags.filenames, output_dir=flags.output_dir)
+    return
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# A persistent set of post fingerprints, for keeping duplicate posts out of harvested datasets across runs.
+
+import hashlib
+import mmap
+import os
+import re
+import struct
+import threading
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MAGIC = b'DSTKDDP1'
+HEADER = struct.Struct('<8sQQ')  # magic, capacity, count
+SLOT_SIZE = 8
+MAX_LOAD = 0.75
+
+
+class DedupIndex:
+    def __init__(self, filepath, initial_capacity=1 << 20):
+        """
+        An open-addressing hash set of 64-bit fingerprints, kept in a memory-mapped file. Lookups and inserts are O(1)
+        and only touch a slot or two of the file, so the index costs about 11 bytes of disk per key, and only the pages
+        actually being probed need to be in RAM. The table doubles in size once it's 75% full.
+
+        Every post is looked up by two keys, its id and a hash of its normalised text, so the same post read twice and
+        a repost of the same title under a new id are both caught.
+
+        Keys are added in two steps so that the index never runs ahead of what's safely on disk: reserve() claims a
+        post's keys (so other threads see them straight away) and commit() writes them to the table once the post has
+        been saved. Reserved keys that are never committed, i.e. because the run crashed, are simply forgotten.
+
+        :param filepath: The index file, which is created if it doesn't exist.
+        :param initial_capacity: Number of slots for a new index. Rounded up to a power of two.
+        """
+        self.filepath = filepath
+        self.lock = threading.Lock()
+        self.reserved = set()
+
+        if not os.path.isfile(filepath):
+            capacity = 1
+            while capacity < initial_capacity:
+                capacity <<= 1
+            self.create(filepath, capacity)
+
+        self.open()
+        return
+
+    @staticmethod
+    def create(filepath, capacity):
+        """
+        Write an empty index file with the given number of slots.
+
+        :param filepath: The file to create.
+        :param capacity: Number of slots, a power of two.
+        :return:
+        """
+        with open(filepath, 'wb') as index_file:
+            index_file.write(HEADER.pack(MAGIC, capacity, 0))
+            index_file.truncate(HEADER.size + capacity * SLOT_SIZE)
+        return
+
+    def open(self):
+        """
+        Map the index file into memory.
+
+        :return:
+        """
+        self.index_file = open(self.filepath, 'r+b')
+        self.mapped = mmap.mmap(self.index_file.fileno(), 0)
+        magic, self.capacity, self.count = HEADER.unpack_from(self.mapped, 0)
+        if magic != MAGIC:
+            raise ValueError('{} is not a dedup index.'.format(self.filepath))
+        self.slots = memoryview(self.mapped)[HEADER.size:].cast('Q')
+        self.mask = self.capacity - 1
+        return
+
+    def close(self):
+        """
+        Write the header and flush the index to disk.
+
+        :return:
+        """
+        with self.lock:
+            HEADER.pack_into(self.mapped, 0, MAGIC, self.capacity, self.count)
+            self.slots.release()
+            self.mapped.flush()
+            self.mapped.close()
+            self.index_file.close()
+        return
+
+    def flush(self):
+        """
+        Write the header and make sure every committed key is on disk.
+
+        :return:
+        """
+        with self.lock:
+            HEADER.pack_into(self.mapped, 0, MAGIC, self.capacity, self.count)
+            self.mapped.flush()
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def __len__(self):
+        return self.count
+
+    @staticmethod
+    def fingerprint(key):
+        """
+        :param key: A string or bytes key.
+        :return: A nonzero 64-bit fingerprint of the key. Zero marks an empty slot.
+        """
+        if not isinstance(key, bytes):
+            key = key.encode('utf-8')
+        value = struct.unpack('<Q', hashlib.blake2b(key, digest_size=8).digest())[0]
+        return value or 1
+
+    @staticmethod
+    def post_keys(post_id, text):
+        """
+        The keys a post is indexed by: its id, and a hash of its text with case, punctuation and spacing stripped. Text
+        with nothing left once it's stripped, i.e. a title that's all emoji or punctuation, says nothing about whether
+        two posts are the same, so those posts are only indexed by their id.
+
+        :param post_id: The post's id, i.e. reddit's "name" field like "t3_7abcde".
+        :param text: The text of the post that's being saved.
+        :return: List of keys.
+        """
+        normalised = re.sub(r'[\W_]+', ' ', text.lower()).strip()
+        if not normalised:
+            return ['id:{}'.format(post_id)]
+        return ['id:{}'.format(post_id), 'text:{}'.format(normalised)]
+
+    def find(self, fingerprint):
+        """
+        :param fingerprint: A fingerprint from fingerprint().
+        :return: The slot holding the fingerprint, or the empty slot where it would go.
+        """
+        slot = fingerprint & self.mask
+        while True:
+            value = self.slots[slot]
+            if value == fingerprint or value == 0:
+                return slot
+            slot = (slot + 1) & self.mask
+
+    def __contains__(self, key):
+        fingerprint = self.fingerprint(key)
+        with self.lock:
+            return fingerprint in self.reserved or self.slots[self.find(fingerprint)] == fingerprint
+
+    def reserve(self, keys):
+        """
+        Check whether any of a post's keys have been seen before, and if not, claim all of them.
+
+        :param keys: The post's keys, from post_keys().
+        :return: True if the post is new and has been reserved, False if it's a duplicate.
+        """
+        fingerprints = [self.fingerprint(key) for key in keys]
+        with self.lock:
+            for fingerprint in fingerprints:
+                if fingerprint in self.reserved or self.slots[self.find(fingerprint)] == fingerprint:
+                    return False
+            self.reserved.update(fingerprints)
+        return True
+
+    def commit(self, keys):
+        """
+        Move reserved keys into the table.
+
+        :param keys: Keys previously passed to a successful reserve().
+        :return:
+        """
+        self.commit_fingerprints([self.fingerprint(key) for key in keys])
+        return
+
+    def commit_fingerprints(self, fingerprints):
+        """
+        The same as commit(), for callers that keep the keys' fingerprints rather than the keys themselves.
+
+        :param fingerprints: Fingerprints of keys previously passed to a successful reserve().
+        :return:
+        """
+        with self.lock:
+            for fingerprint in fingerprints:
+                self.reserved.discard(fingerprint)
+                self.insert(fingerprint)
+            HEADER.pack_into(self.mapped, 0, MAGIC, self.capacity, self.count)
+        return
+
+    def add(self, key):
+        """
+        Add a key straight to the table.
+
+        :param key: The key to add.
+        :return:
+        """
+        with self.lock:
+            self.insert(self.fingerprint(key))
+            HEADER.pack_into(self.mapped, 0, MAGIC, self.capacity, self.count)
+        return
+
+    def insert(self, fingerprint):
+        """
+        Put a fingerprint in its slot, growing the table first if it's getting full. Call with self.lock held.
+
+        :param fingerprint: A fingerprint from fingerprint().
+        :return:
+        """
+        slot = self.find(fingerprint)
+        if self.slots[slot] == fingerprint:
+            return
+
+        if self.count + 1 > self.capacity * MAX_LOAD:
+            self.grow()
+            slot = self.find(fingerprint)
+
+        self.slots[slot] = fingerprint
+        self.count += 1
+        return
+
+    def grow(self):
+        """
+        Rehash everything into a table twice the size, built in a new file that then replaces the old one. With NumPy
+        the keys are moved in batches, see rehash(), otherwise one at a time. Call with self.lock held.
+
+        :return:
+        """
+        temp_filepath = '{}.tmp'.format(self.filepath)
+        self.create(temp_filepath, self.capacity * 2)
+
+        with open(temp_filepath, 'r+b') as new_file:
+            new_mapped = mmap.mmap(new_file.fileno(), 0)
+            new_slots = memoryview(new_mapped)[HEADER.size:].cast('Q')
+            new_mask = self.capacity * 2 - 1
+
+            if numpy is not None:
+                rehash(numpy.frombuffer(self.slots, dtype=numpy.uint64),
+                       numpy.frombuffer(new_slots, dtype=numpy.uint64), new_mask)
+            else:
+                for value in self.slots:
+                    if value:
+                        slot = value & new_mask
+                        while new_slots[slot]:
+                            slot = (slot + 1) & new_mask
+                        new_slots[slot] = value
+
+            HEADER.pack_into(new_mapped, 0, MAGIC, self.capacity * 2, self.count)
+            new_slots.release()
+            new_mapped.flush()
+            new_mapped.close()
+
+        self.slots.release()
+        self.mapped.close()
+        self.index_file.close()
+        os.replace(temp_filepath, self.filepath)
+        self.open()
+        return
+
+
+def rehash(slots, new_slots, mask):
+    """
+    Move every fingerprint in a table into an empty one with linear probing, in batches rather than one at a time.
+
+    Each round, every fingerprint still waiting is written to the slot it's probing if that slot is empty. Where
+    several land in the same slot only the last write sticks, so reading the slots back tells each fingerprint whether
+    it got one. The rest move on to the next slot for the following round. A fingerprint only moves past a slot once
+    it's filled, so it can be found by probing from its home slot just as if it had been inserted on its own. Most
+    fingerprints are placed in the first round, and the number of rounds is about the longest probe sequence, which
+    stays short with the new table at most 37.5% full.
+
+    :param slots: numpy uint64 array of the old table's slots, 0 for empty.
+    :param new_slots: numpy uint64 array of the new table's slots, all 0.
+    :param mask: The new table's capacity less one.
+    :return:
+    """
+    pending = slots[slots != 0]
+    positions = (pending & numpy.uint64(mask)).astype(numpy.intp)
+    while len(pending):
+        empty = new_slots[positions] == 0
+        new_slots[positions[empty]] = pending[empty]
+        waiting = new_slots[positions] != pending
+        pending = pending[waiting]
+        positions = (positions[waiting] + 1) & mask
+    return
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Shared HTTP plumbing for the reddit readers: a pooled session, a global rate limit and retries.
+
+import email.utils
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from datasettoolkit.listing_parser import LISTING_FIELDS, default_backend, parse_listing, parse_listing_stream
+from datasettoolkit.metrics import Metrics
+from datasettoolkit.response_cache import CacheMiss
+
+
+class RateLimiter:
+    def __init__(self, rate, burst=None):
+        """
+        A token bucket shared by every thread making requests. Tokens refill at rate per second up to burst, and each
+        request takes one, so the overall request rate never goes above rate no matter how many threads are fetching.
+
+        :param rate: Requests per second. 0 or None turns the limit off.
+        :type rate: float
+        :param burst: How many requests can go out back to back after a quiet spell. Defaults to rate, at least 1.
+        :type burst: float
+        """
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate or 0, 1)
+        self.tokens = self.burst
+        self.last_refill = time.time()
+        self.paused_until = 0
+        self.lock = threading.Lock()
+        return
+
+    def acquire(self):
+        """
+        Block until a request is allowed to go out.
+
+        :return:
+        """
+        while True:
+            with self.lock:
+                now = time.time()
+                if now >= self.paused_until:
+                    if not self.rate:
+                        return
+
+                    self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+                    self.last_refill = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                else:
+                    wait = self.paused_until - now
+
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """
+        Hold back every thread for the given number of seconds, i.e. when the server tells us to slow down.
+
+        :param seconds: How long to pause for.
+        :return:
+        """
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.time() + seconds)
+            self.tokens = 0
+        return
+
+
+class Fetcher:
+    def __init__(self, headers, workers=8, rate=10.0, max_retries=5, backoff=1.0, timeout=30, cache=None,
+                 metrics=None, parser=None):
+        """
+        Wraps a requests.Session so connections are kept alive and reused across pages and threads, instead of paying
+        for a new TCP and TLS handshake on every request.
+
+        429 and 5xx responses, along with connection errors, are retried up to max_retries times. If the server sends a
+        Retry-After header that's how long every thread waits, otherwise the wait doubles from backoff on each attempt.
+
+        :param headers: Headers to send with every request, i.e. the User-Agent.
+        :param workers: How many threads will share this fetcher, which sets the size of the connection pool.
+        :param rate: Global limit on requests per second, see RateLimiter.
+        :param max_retries: How many times to retry a request before giving up.
+        :param backoff: Seconds to wait before the first retry when the server doesn't say.
+        :param timeout: Seconds to wait for the server to respond.
+        :param cache: Optional ResponseCache to answer from and revalidate against, see get().
+        :param metrics: Optional Metrics to record request latencies, status codes, retries and cache hits in.
+        :param parser: 'orjson', 'ijson' or 'json', the listing_parser backend get_listing() decodes pages with.
+        Defaults to the fastest one installed. Without a cache, ijson decodes pages as they stream in.
+        """
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.rate_limiter = RateLimiter(rate)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.cache = cache
+        self.metrics = metrics or Metrics()
+        self.parser = parser or default_backend()
+        return
+
+    def get(self, url, stream=False):
+        """
+        GET the url, retrying and backing off as needed.
+
+        With a cache, a fresh cached response is returned without touching the network or the rate limit. A stale one
+        is revalidated with a conditional request, and used as is if the server answers 304 Not Modified. New 200
+        responses are added to the cache. In offline mode, a url that isn't cached raises CacheMiss.
+
+        :param url: The url to fetch.
+        :param stream: If True, leave the body of the response unread, to be read from response.raw. Not with a cache,
+        which has to keep the body.
+        :return: The requests.Response.
+        """
+        if stream and self.cache is not None:
+            raise ValueError('Can\'t stream responses that are being cached.')
+        entry = None
+        if self.cache is not None:
+            entry = self.cache.lookup(url)
+            cached = self.cache.response(entry) if entry is not None else None
+            if cached is None:
+                entry = None
+                if self.cache.offline:
+                    raise CacheMiss('{} is not in the cache, and the cache is offline.'.format(url))
+            elif self.cache.is_fresh(entry):
+                self.metrics.add('http.cache_hits')
+                return cached
+
+        attempt = 0
+        while True:
+            with self.metrics.timer('http.rate_limit'):
+                self.rate_limiter.acquire()
+            started = time.perf_counter()
+            try:
+                response = self.session.get(
+                    url,
+                    headers=self.cache.conditional_headers(entry) if entry is not None else None,
+                    timeout=self.timeout,
+                    stream=stream
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.metrics.error('http', e)
+                if attempt >= self.max_retries:
+                    raise
+                response = None
+            finally:
+                latency = time.perf_counter() - started
+                self.metrics.add_time('http', latency)
+                self.metrics.observe('http.latency', latency)
+
+            if response is not None:
+                self.metrics.add('http.status.{}'.format(response.status_code))
+                if not stream:
+                    self.metrics.add('http.bytes', len(response.content))
+
+            if response is not None and response.status_code == 304 and entry is not None:
+                self.cache.refresh(url, entry)
+                return cached
+
+            if response is not None and response.status_code != 429 and response.status_code < 500:
+                if stream and response.status_code >= 400:
+                    response.close()
+                response.raise_for_status()
+                if self.cache is not None:
+                    self.cache.store(url, response)
+                return response
+
+            if attempt >= self.max_retries:
+                response.raise_for_status()
+            if stream and response is not None:
+                # Hand the connection back to the pool without reading the error page.
+                response.close()
+
+            wait = self.retry_after(response)
+            if wait is None:
+                wait = self.backoff * (2 ** attempt)
+            print('Retrying {} in {:.1f}s ({}).'.format(
+                url, wait, response.status_code if response is not None else 'connection error'))
+            self.metrics.add('http.retries')
+            self.rate_limiter.pause(wait)
+            attempt += 1
+
+    def get_json(self, url):
+        """
+        GET the url and decode the JSON body.
+
+        :param url: The url to fetch.
+        :return: The decoded JSON.
+        """
+        return self.get(url).json()
+
+    def get_listing(self, url, fields=LISTING_FIELDS):
+        """
+        GET a reddit listing page and decode only the fields the readers need, see parse_listing(). With the ijson
+        parser and no cache, the page is decoded straight off the socket as it arrives, so the body is never held in
+        memory whole; the "parse" time then includes the time spent waiting for the body.
+
+        :param url: The url to fetch.
+        :param fields: The post fields to keep.
+        :return: The listing, shaped like response.json()['data'].
+        """
+        if self.parser == 'ijson' and self.cache is None:
+            response = self.get(url, stream=True)
+            try:
+                # Undo any Content-Encoding, as response.content would.
+                response.raw.decode_content = True
+                with self.metrics.timer('parse'):
+                    listing = parse_listing_stream(response.raw, fields)
+                self.metrics.add('http.bytes', response.raw.tell())
+            finally:
+                response.close()
+            return listing
+
+        body = self.get(url).content
+        with self.metrics.timer('parse'):
+            return parse_listing(body, fields, backend=self.parser)
+
+    @staticmethod
+    def retry_after(response):
+        """
+        Read the Retry-After header, which is either a number of seconds or an HTTP date.
+
+        :param response: The requests.Response, or None.
+        :return: Seconds to wait, or None if the header's missing or can't be read.
+        """
+        if response is None or 'Retry-After' not in response.headers:
+            return None
+
+        value = response.headers['Retry-After'].strip()
+        try:
+            return max(float(value), 0)
+        except ValueError:
+            pass
+
+        try:
+            return max(email.utils.mktime_tz(email.utils.parsedate_tz(value)) - time.time(), 0)
+        except (TypeError, ValueError, OverflowError):
+            return None
@@ -0,0 +1,378 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Harvests reddit posts and cleans them into a labelled dataset in one go, without the intermediate .txt files.
+
+import io
+import os
+import queue
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+from datasettoolkit.compression import EXTENSIONS
+from datasettoolkit.dataset_splitter import DatasetSplitter
+from datasettoolkit.dedup_index import DedupIndex
+from datasettoolkit.metrics import open_metrics
+from datasettoolkit.multi_reddit_reader import MultiRedditReader, response_cache
+from datasettoolkit.text_cleaning_and_labelling import TextCleaningAndLabellingClient
+
+
+class HarvestPipeline:
+    def __init__(self, reader, client, labels=None, queue_pages=64):
+        """
+        Connects a MultiRedditReader to a TextCleaningAndLabellingClient. The reader's workers fetch pages and put them
+        on a queue, and the cleaner takes them off as they arrive, windows each category's words and writes every
+        window, labelled with its category, straight to the final dataset. Nothing is written to disk in between, and
+        cleaning runs alongside harvesting rather than after it.
+
+        The queue holds at most queue_pages pages. When the cleaner falls behind, the workers block on it until it
+        catches up, so memory stays flat however many posts are harvested.
+
+        Each category's windows come out just as cleaner() would cut them from that category's .txt file, with the
+        category's pages in the order they arrived. With one worker that's the same order read() writes them in.
+
+        :param reader: The MultiRedditReader to harvest with. Its stage, post limit, workers and dedup setting apply.
+        :type reader: MultiRedditReader
+        :param client: The TextCleaningAndLabellingClient to clean with. Its tokenizer, output format and buffering
+        apply.
+        :type client: TextCleaningAndLabellingClient
+        :param labels: Optional dict of category to the output label its windows are given. By default a category's
+        windows are labelled with the category's name. With the npy output format every label has to be one of the
+        client's output_labels.
+        :type labels: dict
+        :param queue_pages: The most fetched pages to hold before the workers wait for the cleaner.
+        :type queue_pages: int
+        """
+        self.reader = reader
+        self.client = client
+        self.labels = dict((category, category) for category in reader.subreddits)
+        self.labels.update(labels or {})
+        self.queue_pages = queue_pages
+
+        if client.output_format == 'npy':
+            unknown = [label for label in self.labels.values() if label not in client.output_labels]
+            if unknown:
+                raise ValueError('Labels {} are not in output_labels, which the npy output format needs.'.format(
+                    ', '.join(unknown)))
+        return
+
+    def output_filepath(self):
+        """
+        The labelled dataset goes in the reader's destination_dir if it has one, so it doesn't have to be copied there
+        afterwards, or the client's dataset_path if not.
+
+        :return: The path to the dataset file.
+        """
+        extension = '.npy' if self.client.output_format == 'npy' else '.csv'
+        if extension == '.csv' and self.client.output_compression:
+            extension += EXTENSIONS[self.client.output_compression]
+        directory = self.reader.destination_dir or self.client.dataset_path
+        # Absolute, since the client's sink() and write_vocabulary() take paths relative to its dataset_path.
+        return os.path.abspath(os.path.join(directory, '{}{}'.format(self.reader.stage, extension)))
+
+    def run(self):
+        """
+        Harvest every subreddit in the reader's config and write the labelled dataset.
+
+        The dataset is written through a sink, so it only replaces the previous version once every subreddit has been
+        read and cleaned. If anything fails the old dataset is left as it was, and none of the harvested posts go in
+        the dedup index, so running again fetches them all afresh. The pipeline doesn't checkpoint; use read() and
+        cleanall() for harvests that need to survive being interrupted.
+
+        :return: The path to the dataset file.
+        """
+        output_filepath = self.output_filepath()
+        pages = queue.Queue(maxsize=self.queue_pages)
+        stopped = threading.Event()
+        failures = []
+
+        # The dataset is replaced, so its posts aren't duplicates of the ones in the version before.
+        self.reader.open_dedup_index(clobber=True, scope='{}.pipeline'.format(self.reader.stage))
+        try:
+            harvester = threading.Thread(target=self.harvest, args=(pages, stopped, failures))
+            harvester.daemon = True
+            harvester.start()
+
+            try:
+                fingerprints = self.clean(pages, output_filepath, failures)
+            finally:
+                # Let the workers go if the cleaner stopped early, then wait for them.
+                stopped.set()
+                harvester.join()
+
+            if self.reader.dedup_index is not None:
+                self.reader.dedup_index.commit_fingerprints(fingerprints)
+            self.reader.close_dedup_index(replace=True)
+
+        finally:
+            self.reader.close_dedup_index()
+
+        print('Harvested and cleaned "{}" into {}.'.format(self.reader.stage, output_filepath))
+        return output_filepath
+
+    def harvest(self, pages, stopped, failures):
+        """
+        Read every subreddit on the reader's workers, putting each page on the queue, then put None on it.
+
+        :param pages: The queue to put (category, lines, keys) on, one per page.
+        :param stopped: Event set once the cleaner stops taking pages.
+        :param failures: List to add (subreddit, exception) to if reading a subreddit fails. The other subreddits stop
+        at their next page once it isn't empty.
+        :return:
+        """
+
+        metrics = self.reader.metrics
+
+        def put(item):
+            # Time spent blocked here is time the cleaner is holding the workers up.
+            with metrics.timer('pipeline.blocked'):
+                while not stopped.is_set():
+                    try:
+                        pages.put(item, timeout=0.1)
+                        metrics.gauge('pipeline.queue', pages.qsize())
+                        return True
+                    except queue.Full:
+                        pass
+            return False
+
+        def read_subreddit(category, subreddit_name):
+            print('Reading /r/{}.'.format(subreddit_name))
+            for reddit_post_list, _, _ in self.reader.pages(subreddit_name):
+                if failures:
+                    return
+                lines, page_keys, _ = self.reader.page_lines(reddit_post_list)
+                if not put((category, lines, page_keys)):
+                    return
+
+        def run_subreddit(category, subreddit_name):
+            try:
+                read_subreddit(category, subreddit_name)
+            except Exception as e:
+                # One missing subreddit would skew the dataset, so the other workers give up too.
+                metrics.error('read', e)
+                failures.append((subreddit_name, e))
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.reader.workers) as executor:
+                for category in self.reader.subreddits:
+                    for subreddit_name in self.reader.subreddits[category]:
+                        executor.submit(run_subreddit, category, subreddit_name)
+        finally:
+            put(None)
+
+    def clean(self, pages, output_filepath, failures):
+        """
+        Take pages off the queue until the harvest is done, and write each category's windows to the dataset as soon
+        as there are enough words for them.
+
+        :param pages: The queue of (category, lines, keys), ending with None.
+        :param output_filepath: The dataset file.
+        :param failures: The harvest's failures, checked once the queue is done.
+        :return: array of the fingerprints of every reserved dedup key, to commit once the dataset is written.
+        """
+        client = self.client
+        metrics = self.reader.metrics
+        width = client.max_sentence_length
+        # As in windows(), the raw cleaner only emits a window once there's at least one more word after it.
+        lookahead = 1 if client.tokenizer == 'raw' else 0
+
+        pending = dict((category, []) for category in self.reader.subreddits)
+        fingerprints = array('Q')
+        vocabulary = client.vocabulary_builder() if client.build_vocab and client.output_format != 'npy' else None
+        window_counter = 0
+
+        def next_page():
+            # Time spent waiting here is time the cleaner is waiting on the network.
+            with metrics.timer('pipeline.wait'):
+                page = pages.get()
+            metrics.gauge('pipeline.queue', pages.qsize())
+            return page
+
+        duplicate_filter = client.near_duplicate_filter(output_filepath)
+        with client.sink(output_filepath, append=False) as sink, duplicate_filter as near_duplicates:
+            for category, lines, page_keys in iter(next_page, None):
+                fingerprints.extend(DedupIndex.fingerprint(key) for key in page_keys)
+                if not lines:
+                    # Every post on the page was a duplicate. An empty page mustn't count as an empty word.
+                    continue
+
+                with metrics.timer('pipeline.clean'):
+                    # Every line ends in a newline, so a page splits into the same words on its own as it would part
+                    # way through the category's .txt file.
+                    text = b''.join(lines)
+                    metrics.add('clean.bytes', len(text))
+                    words = pending[category]
+                    for block in client.word_blocks(io.BytesIO(text)):
+                        words.extend(block)
+
+                    windows = []
+                    position = 0
+                    while len(words) - position >= width + lookahead:
+                        windows.append(client.clean_window(words[position:position + width]))
+                        position += width
+                    del words[:position]
+                    # One page's windows are filtered as a batch, against every category's earlier windows.
+                    if near_duplicates is not None:
+                        windows = near_duplicates.filter(windows)
+
+                    written = 0
+                    for line in windows:
+                        if vocabulary is not None:
+                            vocabulary.add(line.split())
+                        sink.write([line, self.labels[category]])
+                        written += 1
+                    window_counter += written
+                    metrics.add('clean.windows', written)
+
+            if failures:
+                subreddit_name, e = failures[0]
+                # Raising inside the with block aborts the sink.
+                raise RuntimeError('Reading /r/{} failed, the dataset was not written: {}'.format(subreddit_name, e))
+
+        if vocabulary is not None:
+            client.write_vocabulary(output_filepath, vocabulary)
+
+        print('{} labelled windows written.'.format(window_counter))
+        return fingerprints
+
+
+def main():
+    """
+    Harvest every subreddit once, straight into a labelled dataset, and split that into training, eval and test sets.
+    :return:
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Retrieve reddit posts and clean them into labelled datasets.')
+    parser.add_argument(
+        '--stage',
+        default='dataset',
+        help='The config to harvest, datasettoolkit/configs/config.STAGE.json. (default: dataset)'
+    )
+    parser.add_argument(
+        '--posts',
+        type=int,
+        action='store',
+        default=10000,
+        help='The number of posts to retrieve for each subreddit. (default: 10000)'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        action='store',
+        default=8,
+        help='The number of subreddits to read at once. (default: 8)'
+    )
+    parser.add_argument(
+        '--rate',
+        type=float,
+        action='store',
+        default=10.0,
+        help='The most requests per second to send to reddit, or 0 for no limit. (default: 10)'
+    )
+    parser.add_argument(
+        '--dedup',
+        choices=['global', 'stage', 'none'],
+        default='global',
+        help='Skip posts already saved by any stage, only by the same stage, or keep duplicates. (default: global)'
+    )
+    parser.add_argument(
+        '--queue-pages',
+        type=int,
+        action='store',
+        default=64,
+        help='The most fetched pages to hold in memory waiting to be cleaned. (default: 64)'
+    )
+    parser.add_argument(
+        '--cache',
+        nargs='?',
+        const='datasettoolkit/cache/',
+        default=None,
+        help='Keep fetched pages in an on-disk cache, in the given directory. (default: no cache, or '
+             'datasettoolkit/cache/ if no directory is given)'
+    )
+    parser.add_argument(
+        '--cache-size',
+        type=int,
+        action='store',
+        default=1024,
+        help='The most MB of pages to keep in the cache. (default: 1024)'
+    )
+    parser.add_argument(
+        '--cache-max-age',
+        type=float,
+        action='store',
+        default=3600,
+        help='Seconds to use a cached page for before checking with reddit that it has not changed. (default: 3600)'
+    )
+    parser.add_argument(
+        '--offline',
+        action='store_true',
+        help='Only replay pages from the cache, never fetch from reddit.'
+    )
+    parser.add_argument(
+        '--label',
+        action='append',
+        default=[],
+        metavar='CATEGORY=LABEL',
+        help='The output label to give a category\'s windows, if not the category name. Can be repeated.'
+    )
+
+    parser.add_argument(
+        '--ratios',
+        type=float,
+        nargs=3,
+        default=[0.8, 0.1, 0.1],
+        metavar=('TRAINING', 'EVAL', 'TEST'),
+        help='The share of the harvest for each split, see dataset_splitter. (default: 0.8 0.1 0.1)'
+    )
+    parser.add_argument(
+        '--resample',
+        choices=['down', 'up', 'none'],
+        default='none',
+        help='Rebalance the training split\'s categories by shrinking the big ones or growing the small ones. '
+             '(default: none)'
+    )
+
+    parser.add_argument(
+        '--metrics',
+        nargs='?',
+        const='datasettoolkit/metrics.jsonl',
+        default=None,
+        help='Append counters, stage timings and latency histograms to this file as JSON lines, and print a summary '
+             'at the end. (default: off, or datasettoolkit/metrics.jsonl if no file is given)'
+    )
+    parser.add_argument(
+        '--metrics-interval',
+        type=float,
+        action='store',
+        default=10.0,
+        help='Seconds between --metrics lines. (default: 10)'
+    )
+    parser.add_argument(
+        '--profile',
+        choices=['cpu', 'memory'],
+        default=None,
+        help='Also run cProfile or tracemalloc, and write what they find next to the --metrics file.'
+    )
+
+    flags = parser.parse_args()
+    labels = dict(label.split('=', 1) for label in flags.label)
+    client = TextCleaningAndLabellingClient()
+    cache = response_cache(flags)
+    metrics = open_metrics(flags)
+    client.metrics = metrics
+
+    with metrics:
+        reddit_client = MultiRedditReader(stage=flags.stage, posts=flags.posts, workers=flags.workers, rate=flags.rate,
+                                          dedup=None if flags.dedup == 'none' else flags.dedup, cache=cache,
+                                          metrics=metrics)
+        output_filepath = HarvestPipeline(reddit_client, client, labels=labels, queue_pages=flags.queue_pages).run()
+
+        splitter = DatasetSplitter(client, ratios=tuple(flags.ratios),
+                                   resample=None if flags.resample == 'none' else flags.resample)
+        splitter.split([output_filepath])
+    return
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,542 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Runs the fetch, clean, label, split and export steps described in a jobs config, rebuilding only what changed.
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from shutil import copyfile
+
+from datasettoolkit.dataset_splitter import DatasetSplitter
+from datasettoolkit.line_index import index_filepath_for
+from datasettoolkit.metrics import Metrics, open_metrics
+from datasettoolkit.multi_reddit_reader import MultiRedditReader, response_cache
+from datasettoolkit.text_cleaning_and_labelling import TextCleaningAndLabellingClient
+
+STEP_TYPES = ('fetch', 'clean', 'label', 'split', 'export')
+
+# Files a dataset can have alongside it, copied along with it by export steps.
+COMPANION_SUFFIXES = ('.vocab', '.labels.npy')
+
+
+def file_digest(filepath, chunk_size=1048576):
+    """
+    :param filepath: The file.
+    :param chunk_size: Bytes to read at a time.
+    :return: The SHA-256 of its contents, as hex.
+    """
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as input_file:
+        for chunk in iter(lambda: input_file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class JobRunner:
+    def __init__(self, config_path='datasettoolkit/configs/jobs.json', workers=4, cache=None, metrics=None):
+        """
+        Runs the steps of a jobs config as a DAG. The config is a JSON object with a "steps" object, mapping each
+        step's name to what it does:
+
+        {"type": "fetch", "config": "dataset", "category": "interest", "posts": 1000}
+            Harvests the category's subreddits from config.<config>.json ("dataset" by default) with a
+            MultiRedditReader into datasets/<name>-<category>.txt. A "subreddits" list can be given instead, for a
+            category that isn't in any reader config. Also takes "workers", "rate" and "dedup" (null, the default, or
+            "stage"; steps run at once so they can't share the global index).
+        {"type": "clean", "inputs": ["fetch-interest"], "label": 0}
+            Cleans .txt files into .csv files labelled with output_labels[label], or .txc files without a label. Also
+            takes "workers".
+        {"type": "label", "inputs": ["clean-unlabelled"]}
+            Labels .txc files by hand into .csv files, see labeler(). Takes "active", "target" and "confidence" to use
+            active_labeler() instead. Only one label step prompts at a time.
+        {"type": "split", "inputs": ["clean-interest", "clean-avoid"], "ratios": [0.8, 0.1, 0.1]}
+            Splits labelled files into training, eval and test files, see DatasetSplitter. Also takes "salt",
+            "resample", "class_ratios", "max_class_rows", "seed" and "output_dir".
+        {"type": "export", "inputs": ["split"], "destination_dir": "/path/to/data/"}
+            Copies files, with their .vocab and .labels.npy files, to destination_dir.
+
+        A step's "inputs" are the names of the steps whose outputs it reads, which is what makes the DAG. Steps can
+        also read files in datasets/ that no step makes, listed in "files".
+
+        Before running a step, its config, the cleaner's singleconfig.json (or for a fetch step, its category's
+        subreddits) and the contents of its input files are hashed together. If the hash matches the one from the
+        step's last successful run and its outputs are still as that run left them, the step is skipped, and otherwise
+        its outputs are rebuilt from scratch. So editing one category's subreddit list only refetches that category,
+        then re-cleans its file and redoes the steps downstream of it. A fetch step has no input files, so it only runs
+        again when its config or subreddits change or it's forced. File hashes are cached by size and mtime, so
+        unchanged files aren't read again to check them.
+
+        Steps run on a pool of workers as soon as every step they depend on is done. If a step fails, the steps
+        depending on it are skipped and the rest carry on. The entry points log errors rather than raising them, so a
+        step also counts as failed if it didn't rewrite every one of its outputs, or for a label step, if the file
+        wasn't labelled to the end (or to its target).
+
+        What each step last built is kept in the checkpoints directory, in <config name>.state.json.
+
+        :param config_path: The jobs config.
+        :param workers: The most steps to run at once.
+        :param cache: Optional ResponseCache for the fetch steps to share.
+        :param metrics: Optional Metrics for the steps to record in. Each step's time is recorded as "job.<name>".
+        """
+        with open(config_path, 'r') as config_file:
+            self.steps = json.load(config_file)['steps']
+        self.workers = workers
+        self.cache = cache
+        self.metrics = metrics or Metrics()
+
+        self.client = TextCleaningAndLabellingClient()
+        self.client.metrics = self.metrics
+        self.state_path = os.path.join(
+            'datasettoolkit', 'checkpoints', '{}.state.json'.format(os.path.splitext(os.path.basename(config_path))[0]))
+        self.state = self.load_state()
+        self.lock = threading.Lock()
+        self.label_lock = threading.Lock()
+
+        self.validate()
+        self.order = self.topological_order()
+        return
+
+    def validate(self):
+        """
+        Check every step has a known type and only depends on steps that exist.
+
+        :return:
+        """
+        for name, step in self.steps.items():
+            if step.get('type') not in STEP_TYPES:
+                raise ValueError('Step "{}" has type {}, expected one of: {}'.format(
+                    name, step.get('type'), ', '.join(STEP_TYPES)))
+            unknown = [dependency for dependency in step.get('inputs', []) if dependency not in self.steps]
+            if unknown:
+                raise ValueError('Step "{}" reads from unknown steps: {}'.format(name, ', '.join(unknown)))
+            if step['type'] == 'fetch' and step.get('dedup') not in (None, 'stage'):
+                raise ValueError('Step "{}" can only use dedup null or "stage".'.format(name))
+            if step['type'] == 'fetch' and not self.subreddits(step):
+                raise ValueError('Step "{}" has no subreddits for category "{}".'.format(name, step['category']))
+        return
+
+    def subreddits(self, step):
+        """
+        :param step: A fetch step.
+        :return: The step's "subreddits", or else its category's subreddits in the reader config it names.
+        """
+        if 'subreddits' in step:
+            return step['subreddits']
+        config_path = os.path.join(self.client.configs_path, 'config.{}.json'.format(step.get('config', 'dataset')))
+        with open(config_path, 'r') as config_file:
+            return json.load(config_file)['subreddit_labels'].get(step['category'], [])
+
+    def topological_order(self):
+        """
+        :return: The step names, each after every step it reads from.
+        """
+        remaining = dict((name, set(step.get('inputs', []))) for name, step in self.steps.items())
+        order = []
+        while remaining:
+            ready = sorted(name for name, dependencies in remaining.items() if not dependencies)
+            if not ready:
+                raise ValueError('Steps {} depend on each other in a cycle.'.format(', '.join(sorted(remaining))))
+            for name in ready:
+                del remaining[name]
+                order.append(name)
+            for dependencies in remaining.values():
+                dependencies.difference_update(ready)
+        return order
+
+    def load_state(self):
+        if not os.path.isfile(self.state_path):
+            return {'steps': {}, 'files': {}, 'labelling': {}}
+        with open(self.state_path, 'r') as state_file:
+            state = json.load(state_file)
+        state.setdefault('labelling', {})
+        return state
+
+    def save_state(self):
+        """
+        Write the state to a temp file and move it into place, like the reader's checkpoints.
+
+        :return:
+        """
+        with self.lock:
+            with open('{}.tmp'.format(self.state_path), 'w') as state_file:
+                json.dump(self.state, state_file, indent=2, sort_keys=True)
+                state_file.flush()
+                os.fsync(state_file.fileno())
+            os.replace('{}.tmp'.format(self.state_path), self.state_path)
+        return
+
+    def file_hash(self, filepath):
+        """
+        :param filepath: The file.
+        :return: Its SHA-256, read from the cache if its size and mtime haven't changed since it was last hashed.
+        """
+        stat = os.stat(filepath)
+        with self.lock:
+            cached = self.state['files'].get(filepath)
+        if cached is not None and cached['size'] == stat.st_size and cached['mtime_ns'] == stat.st_mtime_ns:
+            return cached['sha256']
+
+        digest = file_digest(filepath)
+        with self.lock:
+            self.state['files'][filepath] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest}
+        return digest
+
+    @staticmethod
+    def file_identity(filepath):
+        """
+        :param filepath: The file.
+        :return: Its inode, mtime and size, which change when it's replaced or written to, or None if it doesn't exist.
+        """
+        if not os.path.isfile(filepath):
+            return None
+        stat = os.stat(filepath)
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def outputs(self, name):
+        """
+        :param name: The step.
+        :return: List of the paths of the files the step writes.
+        """
+        step = self.steps[name]
+        inputs = self.inputs(name)
+        dataset_path = self.client.dataset_path
+
+        if step['type'] == 'fetch':
+            return [os.path.join(dataset_path, '{}-{}.txt'.format(name, step['category']))]
+        if step['type'] == 'clean':
+            return [
+                os.path.join(dataset_path, self.client.output_filename(os.path.basename(path), step.get('label', -1)))
+                for path in inputs
+            ]
+        if step['type'] == 'label':
+            return [os.path.join(dataset_path, '{}.csv'.format(os.path.splitext(os.path.basename(path))[0]))
+                    for path in inputs]
+        if step['type'] == 'split':
+            return sorted(self.splitter(step).output_filepaths(step.get('output_dir', dataset_path)).values())
+        return [os.path.join(step['destination_dir'], os.path.basename(path)) for path in inputs]
+
+    def inputs(self, name):
+        """
+        :param name: The step.
+        :return: List of the paths of the files the step reads: the outputs of the steps it reads from, then its
+        "files".
+        """
+        step = self.steps[name]
+        paths = []
+        for dependency in step.get('inputs', []):
+            paths.extend(self.outputs(dependency))
+        paths.extend(os.path.join(self.client.dataset_path, filename) for filename in step.get('files', []))
+        return paths
+
+    def step_hash(self, name):
+        """
+        :param name: The step.
+        :return: The hash of everything the step's outputs depend on.
+        """
+        step = self.steps[name]
+        digest = hashlib.sha256(json.dumps(step, sort_keys=True).encode('utf-8'))
+        if step['type'] == 'fetch':
+            # Only this category's list, so editing another category in the same reader config doesn't refetch this one.
+            digest.update(json.dumps(self.subreddits(step)).encode('utf-8'))
+        else:
+            digest.update(self.file_hash(os.path.join(self.client.configs_path, 'singleconfig.json')).encode('ascii'))
+        for path in self.inputs(name):
+            digest.update('{}\0{}\0'.format(path, self.file_hash(path)).encode('utf-8'))
+        return digest.hexdigest()
+
+    def is_current(self, name, step_hash):
+        """
+        :param name: The step.
+        :param step_hash: Its step_hash().
+        :return: True if the step's last successful run had the same hash and its outputs haven't changed since.
+        """
+        with self.lock:
+            record = self.state['steps'].get(name)
+        if record is None or record['hash'] != step_hash:
+            return False
+        for path in self.outputs(name):
+            if not os.path.isfile(path) or self.file_hash(path) != record['outputs'].get(path):
+                return False
+        return True
+
+    def run(self, targets=None, force=()):
+        """
+        Run the given steps and every step they read from, skipping the ones that are up to date.
+
+        :param targets: Optional list of step names. Defaults to every step.
+        :param force: Names of steps to run even if they're up to date.
+        :return: Dict of step name to "built", "current", "failed" or "skipped" (because a step it reads from failed).
+        """
+        wanted = set()
+        pending = list(targets or self.steps)
+        while pending:
+            name = pending.pop()
+            if name not in self.steps:
+                raise ValueError('No step named "{}".'.format(name))
+            if name not in wanted:
+                wanted.add(name)
+                pending.extend(self.steps[name].get('inputs', []))
+
+        results = {}
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while True:
+                for name in self.order:
+                    if name not in wanted or name in results or name in running.values():
+                        continue
+                    dependencies = self.steps[name].get('inputs', [])
+                    if any(results.get(dependency) in ('failed', 'skipped') for dependency in dependencies):
+                        results[name] = 'skipped'
+                        print('[{}] skipped, a step it reads from failed.'.format(name))
+                    elif all(dependency in results for dependency in dependencies):
+                        running[executor.submit(self.run_step, name, name in force)] = name
+
+                if not running:
+                    break
+                finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    if future.exception() is not None:
+                        self.metrics.error('job', future.exception())
+                        print('[{}] failed: {}'.format(name, future.exception()))
+                        results[name] = 'failed'
+                    else:
+                        results[name] = future.result()
+
+        for name in self.order:
+            if name in results:
+                print('{:<30}{}'.format(name, results[name]))
+        return results
+
+    def run_step(self, name, force=False):
+        """
+        Run one step, unless it's up to date, and record what it built.
+
+        :param name: The step.
+        :param force: Run it even if it's up to date.
+        :return: "built" or "current".
+        """
+        step_hash = self.step_hash(name)
+        if not force and self.is_current(name, step_hash):
+            print('[{}] up to date.'.format(name))
+            return 'current'
+
+        print('[{}] running.'.format(name))
+        started = time.time()
+        outputs = self.outputs(name)
+        before = dict((path, self.file_identity(path)) for path in outputs)
+        with self.metrics.timer('job.{}'.format(name)):
+            getattr(self, 'run_{}'.format(self.steps[name]['type']))(name, self.steps[name], self.inputs(name))
+
+        stale = [path for path in outputs if not os.path.isfile(path) or self.file_identity(path) == before[path]]
+        if stale:
+            raise RuntimeError('{} was not written.'.format(', '.join(stale)))
+
+        record = {'hash': step_hash, 'outputs': dict((path, self.file_hash(path)) for path in outputs),
+                  'built': time.time()}
+        with self.lock:
+            self.state['steps'][name] = record
+        self.save_state()
+        print('[{}] built in {:.1f}s.'.format(name, time.time() - started))
+        return 'built'
+
+    def run_fetch(self, name, step, inputs):
+        reader = MultiRedditReader(
+            posts=step.get('posts', 1000),
+            stage=name,
+            workers=step.get('workers', 8),
+            rate=step.get('rate', 10.0),
+            dedup=step.get('dedup'),
+            cache=self.cache,
+            metrics=self.metrics,
+            config={'subreddit_labels': {step['category']: self.subreddits(step)}}
+        )
+        reader.read(noclobber=False, resume=True)
+        return
+
+    def run_clean(self, name, step, inputs):
+        self.client.cleanall(
+            filenames=[os.path.basename(path) for path in inputs],
+            label=step.get('label', -1),
+            workers=step.get('workers'),
+            append=False
+        )
+        return
+
+    def run_label(self, name, step, inputs):
+        # Prompts from two steps at once would be impossible to follow.
+        with self.label_lock:
+            for path in inputs:
+                filename = os.path.basename(path)
+                self.restart_labelling_if_changed(path)
+                if step.get('active'):
+                    self.client.active_labeler(filename, target_size=step.get('target'),
+                                               confidence=step.get('confidence', 0.95))
+                else:
+                    self.client.labeler(filename)
+                if not self.labelling_finished(filename, step):
+                    raise RuntimeError('{} is not labelled to the end yet, run again to carry on.'.format(filename))
+        return
+
+    def restart_labelling_if_changed(self, path):
+        """
+        Throw away the labels and checkpoint for a .txc file if the file has been rebuilt since labelling it began,
+        since the checkpoint's offset and the rows already written belong to the old version.
+
+        :param path: The .txc file.
+        :return:
+        """
+        digest = self.file_hash(path)
+        with self.lock:
+            labelled = self.state['labelling'].get(path)
+            self.state['labelling'][path] = digest
+        if labelled is not None and labelled != digest:
+            filename = os.path.basename(path)
+            base_path = os.path.splitext(path)[0]
+            for stale_path in (self.client.labeler_checkpoint_path(filename), '{}.csv'.format(base_path),
+                               '{}.model.npz'.format(path)):
+                if os.path.isfile(stale_path):
+                    os.remove(stale_path)
+            print('{} has changed since it was labelled, starting over.'.format(filename))
+        self.save_state()
+        return
+
+    def labelling_finished(self, filename, step):
+        """
+        :param filename: The .txc file being labelled.
+        :param step: The label step.
+        :return: True if its checkpoint has reached the end of the file, or every label has its share of the target.
+        """
+        checkpoint = self.client.load_labeler_checkpoint(filename)
+        if checkpoint['offset'] >= os.path.getsize(os.path.join(self.client.dataset_path, filename)):
+            return not checkpoint.get('pending')
+        if step.get('target') and 'counts' in checkpoint:
+            return min(checkpoint['counts']) * len(self.client.output_labels) >= step['target']
+        return False
+
+    def splitter(self, step):
+        return DatasetSplitter(
+            self.client,
+            ratios=tuple(step.get('ratios', (0.8, 0.1, 0.1))),
+            salt=step.get('salt', ''),
+            resample=step.get('resample'),
+            class_ratios=step.get('class_ratios'),
+            max_class_rows=step.get('max_class_rows', 1000000),
+            seed=step.get('seed', 0)
+        )
+
+    def run_split(self, name, step, inputs):
+        # split() takes relative paths to be in dataset_path already.
+        self.splitter(step).split([os.path.abspath(path) for path in inputs],
+                                  output_dir=step.get('output_dir', self.client.dataset_path))
+        return
+
+    def run_export(self, name, step, inputs):
+        destination_dir = step['destination_dir']
+        if not os.path.isdir(destination_dir):
+            os.makedirs(destination_dir)
+        for path in inputs:
+            base_path = os.path.splitext(path)[0]
+            companions = [path, index_filepath_for(path)]
+            companions += ['{}{}'.format(base_path, suffix) for suffix in COMPANION_SUFFIXES]
+            for companion in companions:
+                if os.path.isfile(companion):
+                    copyfile(companion, os.path.join(destination_dir, os.path.basename(companion)))
+        return
+
+
+def main():
+    """
+    Run the steps in a jobs config.
+    :return:
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Build datasets from a jobs config, rebuilding only what changed.')
+    parser.add_argument(
+        'steps',
+        nargs='*',
+        help='The steps to bring up to date, along with the steps they read from. (default: every step)'
+    )
+    parser.add_argument(
+        '--config',
+        default='datasettoolkit/configs/jobs.json',
+        help='The jobs config. (default: datasettoolkit/configs/jobs.json)'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        action='store',
+        default=4,
+        help='The most steps to run at once. (default: 4)'
+    )
+    parser.add_argument(
+        '--force',
+        action='append',
+        default=[],
+        metavar='STEP',
+        help='Run this step even if it is up to date, i.e. to fetch newer posts. Can be repeated.'
+    )
+    parser.add_argument(
+        '--cache',
+        nargs='?',
+        const='datasettoolkit/cache/',
+        default=None,
+        help='Keep fetched pages in an on-disk cache, in the given directory. (default: no cache, or '
+             'datasettoolkit/cache/ if no directory is given)'
+    )
+    parser.add_argument(
+        '--cache-size',
+        type=int,
+        action='store',
+        default=1024,
+        help='The most MB of pages to keep in the cache. (default: 1024)'
+    )
+    parser.add_argument(
+        '--cache-max-age',
+        type=float,
+        action='store',
+        default=3600,
+        help='Seconds to use a cached page for before checking with reddit that it has not changed. (default: 3600)'
+    )
+    parser.add_argument(
+        '--offline',
+        action='store_true',
+        help='Only replay pages from the cache, never fetch from reddit.'
+    )
+    parser.add_argument(
+        '--metrics',
+        nargs='?',
+        const='datasettoolkit/metrics.jsonl',
+        default=None,
+        help='Append counters, stage timings and latency histograms to this file as JSON lines, and print a summary '
+             'at the end. (default: off, or datasettoolkit/metrics.jsonl if no file is given)'
+    )
+    parser.add_argument(
+        '--metrics-interval',
+        type=float,
+        action='store',
+        default=10.0,
+        help='Seconds between --metrics lines. (default: 10)'
+    )
+    parser.add_argument(
+        '--profile',
+        choices=['cpu', 'memory'],
+        default=None,
+        help='Also run cProfile or tracemalloc, and write what they find next to the --metrics file.'
+    )
+
+    flags = parser.parse_args()
+    with open_metrics(flags) as metrics:
+        runner = JobRunner(flags.config, workers=flags.workers, cache=response_cache(flags), metrics=metrics)
+        results = runner.run(targets=flags.steps or None, force=set(flags.force))
+
+    if any(result in ('failed', 'skipped') for result in results.values()):
+        raise SystemExit(1)
+    return
+
+if __name__ == '__main__':
+    main()
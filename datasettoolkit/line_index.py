@@ -0,0 +1,474 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Line offset indexes for .txc and .csv datasets, for reading any line, or every line in a shuffled order, in O(1).
+
+import csv
+import io
+import mmap
+import os
+import random
+import sys
+
+from datasettoolkit.compression import compression_of
+from datasettoolkit.metrics import Metrics
+from datasettoolkit.npy_sink import NPY_HEADER_SIZE, NPY_MAGIC, npy_header
+from datasettoolkit.output_sink import temp_filepath_for
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+INDEX_SUFFIX = '.idx'
+OFFSET_SIZE = 8
+MASK_64 = (1 << 64) - 1
+
+# Odd multipliers for the Feistel round function, from splitmix64.
+ROUND_MULTIPLIERS = (0x9E3779B97F4A7C15, 0xBF58476D1CE4E5B9)
+
+
+def index_filepath_for(filepath):
+    """
+    :param filepath: A .txc or .csv file, i.e. "dataset.csv".
+    :return: The path of its index, i.e. "dataset.csv.idx".
+    """
+    return filepath + INDEX_SUFFIX
+
+
+def read_header(index_file):
+    """
+    Check an index file's .npy header, leaving the file at the start of its offsets.
+
+    :param index_file: Binary file object of an index, at its start.
+    :return: Number of offsets in it.
+    """
+    magic = index_file.read(len(NPY_MAGIC))
+    header = index_file.read(int.from_bytes(index_file.read(2), 'little')).decode('latin1')
+    descr = "'descr': '{}u8'".format('<' if sys.byteorder == 'little' else '>')
+    if magic != NPY_MAGIC or descr not in header:
+        raise ValueError('{} is not a line index.'.format(getattr(index_file, 'name', 'File')))
+    return int(header.split("'shape': (", 1)[1].split(',', 1)[0])
+
+
+def line_starts(data_file, start, end, chunk_size=1048576):
+    """
+    Find where each line in a stretch of a file starts.
+
+    :param data_file: Binary file object to scan.
+    :param start: Byte offset to scan from. A line starts there, unless it's the end.
+    :param end: Byte offset to stop scanning at, the size of the file.
+    :param chunk_size: Bytes to read at a time.
+    :return: Generator of bytes of the native uint64 offsets, a chunk at a time.
+    """
+    if start < end:
+        yield start.to_bytes(OFFSET_SIZE, sys.byteorder)
+
+    data_file.seek(start)
+    position = start
+    while position < end:
+        chunk = data_file.read(min(chunk_size, end - position))
+        if not chunk:
+            break
+        if numpy is not None:
+            starts = numpy.flatnonzero(numpy.frombuffer(chunk, dtype=numpy.uint8) == 10).astype(numpy.uint64)
+            starts += numpy.uint64(position + 1)
+            # A newline at the very end of the file doesn't start a line.
+            yield starts[starts < end].tobytes()
+        else:
+            starts = io.BytesIO()
+            newline = chunk.find(b'\n')
+            while newline != -1:
+                if position + newline + 1 < end:
+                    starts.write((position + newline + 1).to_bytes(OFFSET_SIZE, sys.byteorder))
+                newline = chunk.find(b'\n', newline + 1)
+            yield starts.getvalue()
+        position += len(chunk)
+
+
+def index_is_current(filepath, index_filepath=None):
+    """
+    :param filepath: A .txc or .csv file.
+    :param index_filepath: Its index, by default index_filepath_for(filepath).
+    :return: True if the index exists, is no older than the file and ends at the file's size.
+    """
+    index_filepath = index_filepath or index_filepath_for(filepath)
+    if not os.path.isfile(index_filepath) or not os.path.isfile(filepath):
+        return False
+    if os.stat(index_filepath).st_mtime_ns < os.stat(filepath).st_mtime_ns:
+        return False
+    try:
+        with open(index_filepath, 'rb') as index_file:
+            count = read_header(index_file)
+            if count < 1:
+                return False
+            index_file.seek((count - 1) * OFFSET_SIZE, io.SEEK_CUR)
+            last = index_file.read(OFFSET_SIZE)
+    except (ValueError, IndexError):
+        return False
+    return len(last) == OFFSET_SIZE and int.from_bytes(last, sys.byteorder) == os.path.getsize(filepath)
+
+
+def write_index(filepath, index_filepath=None, reuse=False, chunk_size=1048576, metrics=None):
+    """
+    Write the index of a .txc or .csv file: a .npy array of the uint64 byte offset at which each line starts, followed
+    by the size of the file, so line i is bytes offsets[i] to offsets[i + 1]. That's 8 bytes a line, and it can be
+    loaded with numpy.load(index_filepath, mmap_mode='r') as well as read by IndexedDataset.
+
+    The index is written to a temp file next to it and moved into place, like the sinks' output.
+
+    :param filepath: The file to index.
+    :param index_filepath: Where to write the index, by default index_filepath_for(filepath).
+    :param reuse: If True, and there's an existing index, assume the file still starts with the lines it covers, i.e.
+    because the file has only been appended to since, and only scan the bytes after them.
+    :param chunk_size: Bytes to read at a time.
+    :param metrics: Optional Metrics to record the time spent indexing in.
+    :return: Number of lines in the file.
+    """
+    index_filepath = index_filepath or index_filepath_for(filepath)
+    metrics = metrics or Metrics()
+    if compression_of(filepath) is not None:
+        raise ValueError('Compressed files can\'t be indexed: {}'.format(filepath))
+
+    size = os.path.getsize(filepath)
+    temp_filepath = temp_filepath_for(index_filepath)
+    with metrics.timer('disk.index'):
+        with open(filepath, 'rb') as data_file, open(temp_filepath, 'wb') as index_file:
+            index_file.write(npy_header((0,), 'u8'))
+            start = 0
+            if reuse and os.path.isfile(index_filepath):
+                start = copy_offsets(index_filepath, index_file, data_file, size)
+
+            for starts in line_starts(data_file, start, size, chunk_size):
+                index_file.write(starts)
+            index_file.write(size.to_bytes(OFFSET_SIZE, sys.byteorder))
+
+            count = (index_file.tell() - NPY_HEADER_SIZE) // OFFSET_SIZE
+            index_file.seek(0)
+            index_file.write(npy_header((count,), 'u8'))
+            index_file.flush()
+            os.fsync(index_file.fileno())
+        os.replace(temp_filepath, index_filepath)
+    return count - 1
+
+
+def copy_offsets(index_filepath, index_file, data_file, size):
+    """
+    Copy the line offsets from an existing index, all but its final end of file offset, if they can be used for a file
+    that has grown since.
+
+    :param index_filepath: The existing index.
+    :param index_file: Binary file object of the new index, to copy them to.
+    :param data_file: Binary file object of the file being indexed.
+    :param size: Size of that file.
+    :return: Byte offset to scan the file from, after the lines copied. 0 if the existing index can't be used.
+    """
+    with open(index_filepath, 'rb') as old_file:
+        try:
+            count = read_header(old_file)
+        except ValueError:
+            return 0
+        if count < 1:
+            return 0
+        lines_start = old_file.tell()
+        old_file.seek((count - 1) * OFFSET_SIZE, io.SEEK_CUR)
+        end = int.from_bytes(old_file.read(OFFSET_SIZE), sys.byteorder)
+
+        # The lines must have ended in a newline for the next line to start after them.
+        if end == 0 or end > size:
+            return 0
+        data_file.seek(end - 1)
+        if data_file.read(1) != b'\n':
+            return 0
+
+        old_file.seek(lines_start)
+        remaining = (count - 1) * OFFSET_SIZE
+        while remaining:
+            chunk = old_file.read(min(remaining, 1048576))
+            if not chunk:
+                raise ValueError('{} is truncated.'.format(index_filepath))
+            index_file.write(chunk)
+            remaining -= len(chunk)
+    return end
+
+
+class Permutation:
+    def __init__(self, size, seed=0, rounds=4):
+        """
+        A pseudorandom permutation of range(size) that can be indexed, so the i-th position of a shuffle is computed in
+        O(1) time and memory, rather than shuffling a list of size indices. A shuffle can then be resumed part way
+        through an epoch, and the shuffle of a billion lines takes no more memory than the shuffle of ten.
+
+        It's a Feistel network, a bijection on the integers of an even number of bits, with enough bits to cover size.
+        Values of size or more are encrypted again until they fall in range ("cycle walking"). The domain is under 4
+        times size, so that takes 4 rounds at most on average.
+
+        :param size: Number of items to permute.
+        :param seed: Seed for the round keys. The same size and seed always give the same permutation.
+        :param rounds: Number of Feistel rounds. 4 is enough for shuffling, this isn't a cipher.
+        """
+        self.size = size
+        bits = max(2, (size - 1).bit_length())
+        self.half_bits = (bits + 1) // 2
+        self.half_mask = (1 << self.half_bits) - 1
+        rng = random.Random(seed)
+        self.keys = [rng.getrandbits(64) for _ in range(rounds)]
+        return
+
+    def __len__(self):
+        return self.size
+
+    def round_value(self, value, key):
+        """
+        :param value: Half of a Feistel block.
+        :param key: The round's key.
+        :return: The round function of it, a half block's worth of bits of a 64-bit mix of value and key.
+        """
+        value = (value * ROUND_MULTIPLIERS[0] + key) & MASK_64
+        value = ((value ^ (value >> 29)) * ROUND_MULTIPLIERS[1]) & MASK_64
+        return (value ^ (value >> 32)) & self.half_mask
+
+    def encrypt(self, value):
+        left, right = value >> self.half_bits, value & self.half_mask
+        for key in self.keys:
+            left, right = right, left ^ self.round_value(right, key)
+        return (left << self.half_bits) | right
+
+    def __getitem__(self, position):
+        """
+        :param position: A position in the shuffle, from 0 to size - 1.
+        :return: The item at it.
+        """
+        if not 0 <= position < self.size:
+            raise IndexError('Position {} is outside a permutation of {}.'.format(position, self.size))
+        value = self.encrypt(position)
+        while value >= self.size:
+            value = self.encrypt(value)
+        return value
+
+    def take(self, start, stop):
+        """
+        :param start: First position in the shuffle.
+        :param stop: Position after the last one.
+        :return: List of the items at positions start to stop. With NumPy they're worked out together, which is about
+        20x faster than one at a time.
+        """
+        stop = min(stop, self.size)
+        if numpy is None:
+            return [self[position] for position in range(start, stop)]
+
+        values = numpy.arange(start, max(start, stop), dtype=numpy.uint64)
+        pending = numpy.ones(len(values), dtype=bool)
+        with numpy.errstate(over='ignore'):
+            while pending.any():
+                values[pending] = self.encrypt_all(values[pending])
+                pending = values >= self.size
+        return values.tolist()
+
+    def encrypt_all(self, values):
+        """
+        encrypt() for a uint64 array of values, where arithmetic wraps at 64 bits by itself.
+        """
+        half_bits = numpy.uint64(self.half_bits)
+        half_mask = numpy.uint64(self.half_mask)
+        left, right = values >> half_bits, values & half_mask
+        for key in self.keys:
+            mixed = right * numpy.uint64(ROUND_MULTIPLIERS[0]) + numpy.uint64(key)
+            mixed = (mixed ^ (mixed >> numpy.uint64(29))) * numpy.uint64(ROUND_MULTIPLIERS[1])
+            left, right = right, left ^ ((mixed ^ (mixed >> numpy.uint64(32))) & half_mask)
+        return (left << half_bits) | right
+
+    def __iter__(self):
+        for start in range(0, self.size, 65536):
+            for value in self.take(start, start + 65536):
+                yield value
+
+
+class IndexedDataset:
+    def __init__(self, filepath, build=True, metrics=None):
+        """
+        Random access to the lines of a .txc or .csv file through its line index (see write_index()), without reading
+        the file into memory. Both are memory-mapped, so get(i) is a couple of slices of the maps whatever i is, and
+        only the pages actually read are in RAM. That's enough to shuffle a multi-GB dataset every epoch, sample it to
+        spot-check labels, or pick up from line N.
+
+        Lines are decoded as the file's sink wrote them: .txc lines as strings and .csv lines as lists of strings. A
+        .csv record is one line, which holds for everything the toolkit writes, as cleaned text has no newlines in it.
+
+        :param filepath: The .txc or .csv file. It can't be compressed.
+        :param build: If True, (re)build the index if it's missing or older than the file. If False, raise a ValueError.
+        :param metrics: Optional Metrics to record the time spent building the index in.
+        """
+        if compression_of(filepath) is not None:
+            raise ValueError('Compressed files can\'t be read by line, decompress {} first.'.format(filepath))
+        self.filepath = filepath
+        self.index_filepath = index_filepath_for(filepath)
+        self.is_csv = os.path.splitext(filepath)[1] == '.csv'
+
+        if not index_is_current(filepath, self.index_filepath):
+            if not build:
+                raise ValueError('{} has no up to date index, see write_index().'.format(filepath))
+            write_index(filepath, self.index_filepath, metrics=metrics)
+
+        self.index_file = open(self.index_filepath, 'rb')
+        read_header(self.index_file)
+        self.index_map = mmap.mmap(self.index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.offsets = memoryview(self.index_map)[self.index_file.tell():].cast('Q')
+
+        self.data_file = open(filepath, 'rb')
+        # An empty file can't be mapped, and has no lines to read anyway.
+        size = self.offsets[len(self.offsets) - 1]
+        self.data_map = mmap.mmap(self.data_file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        self.offsets.release()
+        self.index_map.close()
+        self.index_file.close()
+        if self.data_map:
+            self.data_map.close()
+        self.data_file.close()
+        return
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def advise(self, pattern):
+        """
+        Tell the kernel how the file is about to be read, so it reads ahead for a scan but not for a shuffle, where
+        reading ahead would only fill the page cache with lines that aren't wanted yet.
+
+        :param pattern: mmap.MADV_SEQUENTIAL or mmap.MADV_RANDOM, or None where there's no madvise().
+        :return:
+        """
+        if self.data_map and pattern is not None:
+            self.data_map.madvise(pattern)
+        return
+
+    def line_offset(self, index):
+        """
+        :param index: A line number, from 0. len(self) gives the size of the file.
+        :return: The byte offset the line starts at, i.e. to seek() to it.
+        """
+        return self.offsets[index]
+
+    def line(self, index):
+        """
+        :param index: A line number, from 0.
+        :return: The line as bytes, without its line ending.
+        """
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('Line {} is outside {} lines.'.format(index, len(self)))
+        return self.data_map[self.offsets[index]:self.offsets[index + 1]].rstrip(b'\r\n')
+
+    def get(self, index):
+        """
+        :param index: A line number, from 0, or from the end if negative.
+        :return: The line, decoded.
+        """
+        line = self.line(index).decode('utf-8')
+        if self.is_csv:
+            return next(csv.reader([line], dialect='excel'))
+        return line
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self.get(index) for index in range(*key.indices(len(self)))]
+        return self.get(key)
+
+    def __iter__(self):
+        self.advise(getattr(mmap, 'MADV_SEQUENTIAL', None))
+        for index in range(len(self)):
+            yield self.get(index)
+
+    def shuffled(self, seed=0, start=0):
+        """
+        Every line in a seeded random order, see Permutation. Use a different seed for each epoch, i.e. seed + epoch,
+        and pass the number of lines already read as start to pick up part way through one.
+
+        :param seed: Seed for the shuffle.
+        :param start: Position in the shuffle to start from.
+        :return: Generator of lines.
+        """
+        self.advise(getattr(mmap, 'MADV_RANDOM', None))
+        permutation = Permutation(len(self), seed)
+        for block in range(start, len(self), 65536):
+            for index in permutation.take(block, block + 65536):
+                yield self.get(index)
+
+    def sample(self, count, seed=0):
+        """
+        :param count: Number of lines to pick.
+        :param seed: Seed for picking them.
+        :return: List of count distinct lines picked at random, or all of them in a random order if there aren't that
+        many.
+        """
+        permutation = Permutation(len(self), seed)
+        return [self.get(index) for index in permutation.take(0, count)]
+
+
+def main():
+    """
+    Index .txc and .csv files, and print lines from them.
+    :return:
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Index .txc and .csv files for random access, and print lines.')
+    parser.add_argument(
+        'filenames',
+        nargs='+',
+        help='.txc or .csv files to index, as paths or names in datasettoolkit/datasets/.'
+    )
+    parser.add_argument(
+        '--line',
+        type=int,
+        action='append',
+        default=[],
+        help='Print this line, counted from 0. Can be repeated.'
+    )
+    parser.add_argument(
+        '--sample',
+        type=int,
+        action='store',
+        default=0,
+        help='Print this many lines picked at random, i.e. to spot-check labels. (default: 0)'
+    )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        action='store',
+        default=0,
+        help='Seed for --sample. (default: 0)'
+    )
+    parser.add_argument(
+        '--rebuild',
+        action='store_true',
+        help='Rebuild the index even if it\'s up to date.'
+    )
+
+    flags = parser.parse_args()
+    for filename in flags.filenames:
+        filepath = filename if os.path.isfile(filename) else os.path.join('datasettoolkit', 'datasets', filename)
+        if flags.rebuild:
+            write_index(filepath)
+        with IndexedDataset(filepath) as dataset:
+            print('{}: {} lines'.format(filepath, len(dataset)))
+            for index in flags.line:
+                print('{}\t{}'.format(index, dataset.get(index)))
+            if flags.sample:
+                permutation = Permutation(len(dataset), flags.seed)
+                for index in permutation.take(0, flags.sample):
+                    print('{}\t{}'.format(index, dataset.get(index)))
+    return
+
+if __name__ == '__main__':
+    main()
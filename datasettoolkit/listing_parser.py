@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Decodes reddit listing pages, keeping only the fields the readers use.
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# The post fields the readers look at. Everything else in a listing (previews, awards, media, flair...) is dropped.
+LISTING_FIELDS = ('id', 'name', 'title', 'selftext', 'is_self')
+
+BACKENDS = [backend for backend, module in (('orjson', orjson), ('ijson', ijson), ('json', json)) if module]
+
+
+def default_backend():
+    """
+    :return: The fastest backend that's installed. orjson decodes the whole page in C faster than anything can pick
+    through it, and ijson's streaming comes last since it hands every token back to Python.
+    """
+    if orjson is not None:
+        return 'orjson'
+    return 'json'
+
+
+def parse_listing(body, fields=LISTING_FIELDS, backend=None):
+    """
+    Decode a listing page into the same shape as response.json()['data'], but with only the given fields in each
+    post's data. That keeps far less in memory per page.
+
+    {'after': 't3_abc', 'children': [{'data': {'title': ..., 'selftext': ..., ...}}, ...]}
+
+    :param body: The response body as bytes.
+    :param fields: The post fields to keep.
+    :param backend: 'orjson', 'ijson' or 'json'. Defaults to default_backend().
+    :return: The projected listing.
+    """
+    backend = backend or default_backend()
+    if backend == 'ijson':
+        return parse_listing_stream(body, fields)
+
+    listing = (orjson.loads(body) if backend == 'orjson' else json.loads(body))['data']
+    return {
+        'after': listing.get('after'),
+        'children': [
+            {'data': dict((field, child['data'][field]) for field in fields if field in child['data'])}
+            for child in listing['children']
+        ]
+    }
+
+
+def parse_listing_stream(body, fields=LISTING_FIELDS):
+    """
+    parse_listing() with ijson: walk the page's parse events and only build values for the projected fields, so the
+    rest of each post is never turned into Python objects at all.
+
+    :param body: The response body as bytes, or a file-like object to stream it from.
+    :param fields: The post fields to keep.
+    :return: The projected listing.
+    """
+    prefixes = dict(('data.children.item.data.{}'.format(field), field) for field in fields)
+    listing = {'after': None, 'children': []}
+    data = None
+
+    for prefix, event, value in ijson.parse(body):
+        if prefix in prefixes:
+            # Projected fields are scalars, so the value comes in the one event.
+            data[prefixes[prefix]] = value
+        elif prefix == 'data.children.item.data' and event == 'start_map':
+            data = {}
+            listing['children'].append({'data': data})
+        elif prefix == 'data.after':
+            listing['after'] = value
+    return listing
@@ -0,0 +1,380 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Counters, timers and latency histograms shared by the readers and the cleaner, written out as JSON lines.
+
+import bisect
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Upper bounds, in seconds, of the latency histogram buckets. Anything slower goes in the last, open-ended one.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        """
+        Counts of observations falling into fixed buckets, so percentiles can be estimated without keeping every
+        observation.
+
+        :param bounds: Sorted upper bounds of the buckets.
+        """
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        return
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        return
+
+    def percentile(self, fraction):
+        """
+        :param fraction: i.e. 0.99 for the 99th percentile.
+        :return: An estimate, interpolated within the bucket the percentile falls in, or None if nothing has been
+        observed.
+        """
+        if not self.count:
+            return None
+        wanted = fraction * self.count
+        seen = 0
+        lower = self.min
+        for bound, count in zip(self.bounds + (self.max,), self.counts):
+            if count and seen + count >= wanted:
+                upper = min(bound, self.max)
+                return lower + (upper - lower) * (wanted - seen) / count
+            seen += count
+            lower = max(bound, self.min)
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(0.5),
+            'p90': self.percentile(0.9),
+            'p99': self.percentile(0.99),
+            'buckets': dict(
+                ('le_{}'.format(bound), count) for bound, count in zip(self.bounds + ('inf',), self.counts) if count
+            )
+        }
+
+
+class Metrics:
+    def __init__(self, path=None, interval=10.0, profile=None):
+        """
+        A thread-safe registry of what a run is doing, so a slow run can be put down to the network, the CPU or the
+        disk. It keeps:
+
+        counters, i.e. records, bytes, retries and errors, with their rates per second,
+        gauges, i.e. queue depths, with the highest value each has reached,
+        timers, the total seconds spent in each stage of the run and how often it was entered, summed across threads,
+        histograms of latencies, i.e. each HTTP request's.
+
+        Recording anything is cheap, and does nothing more than update a dict, so the toolkit always records. Once
+        started with a path, a snapshot of everything is appended to it as a JSON line every interval seconds, and once
+        more when it's stopped, with "final": true. Use it as a context manager to do both.
+
+        Stage times are wall time spent inside the stage, so a run where "http" dominates is waiting on the network,
+        one where "clean" or "parse" does and cpu_seconds keeps up with elapsed is CPU bound, and one where
+        "disk.write" or "disk.fsync" does is waiting on the disk.
+
+        Worker processes (i.e. cleanall()'s pool) get their own empty registry that's never written out, so what they
+        do is counted by the parent as their results come back.
+
+        :param path: The JSON lines file to append snapshots to, or None to only keep them in memory.
+        :param interval: Seconds between snapshots.
+        :param profile: Optional "cpu" to run cProfile, or "memory" to run tracemalloc, while started. cProfile only
+        sees the thread that calls start(). The results go next to path, in <path>.prof (read it with pstats) or
+        <path>.tracemalloc.txt.
+        """
+        if profile not in (None, 'cpu', 'memory'):
+            raise ValueError('profile must be None, "cpu" or "memory", not "{}".'.format(profile))
+        self.path = path
+        self.interval = interval
+        self.profile = profile
+
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.gauge_maxima = {}
+        self.timers = {}
+        self.histograms = {}
+        self.errors = deque(maxlen=20)
+
+        self.started = time.time()
+        self.started_times = os.times()
+        self.last_snapshot = (self.started, {})
+        self.output_file = None
+        self.stopped = threading.Event()
+        self.writer = None
+        self.profiler = None
+        return
+
+    def __getstate__(self):
+        # Sent to a worker process: it gets an empty registry of its own, that isn't written anywhere.
+        return {'interval': self.interval}
+
+    def __setstate__(self, state):
+        self.__init__(interval=state['interval'])
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_value is not None:
+            self.error('run', exc_value)
+        self.stop()
+        return False
+
+    def add(self, name, value=1):
+        """
+        Add to a counter.
+
+        :param name: The counter, i.e. "http.bytes".
+        :param value: How much to add.
+        :return:
+        """
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        return
+
+    def gauge(self, name, value):
+        """
+        Set a gauge, i.e. how many pages are waiting on a queue.
+
+        :param name: The gauge.
+        :param value: Its current value.
+        :return:
+        """
+        with self.lock:
+            self.gauges[name] = value
+            self.gauge_maxima[name] = max(self.gauge_maxima.get(name, value), value)
+        return
+
+    def observe(self, name, value):
+        """
+        Add an observation to a histogram.
+
+        :param name: The histogram, i.e. "http.latency".
+        :param value: The observation, in seconds.
+        :return:
+        """
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].observe(value)
+        return
+
+    def add_time(self, name, seconds):
+        """
+        Add to a stage's time, see timer().
+
+        :param name: The stage.
+        :param seconds: Seconds spent in it.
+        :return:
+        """
+        with self.lock:
+            total, calls = self.timers.get(name, (0.0, 0))
+            self.timers[name] = (total + seconds, calls + 1)
+        return
+
+    @contextmanager
+    def timer(self, name):
+        """
+        Time the block as part of a stage:
+
+        with metrics.timer('clean'):
+            ...
+
+        :param name: The stage.
+        :return:
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - started)
+
+    def error(self, name, e):
+        """
+        Count an exception, and keep it with the latest few for the snapshots.
+
+        :param name: Where it happened, i.e. "http" or "read".
+        :param e: The exception.
+        :return:
+        """
+        self.add('errors.{}'.format(name))
+        with self.lock:
+            self.errors.append({'time': time.time(), 'where': name, 'type': type(e).__name__, 'message': str(e)})
+        return
+
+    def snapshot(self, final=False):
+        """
+        :param final: Whether this is the last snapshot of the run.
+        :return: Dict of everything recorded so far, with each counter's rate since the previous snapshot.
+        """
+        now = time.time()
+        with self.lock:
+            counters = dict(self.counters)
+            previous_time, previous_counters = self.last_snapshot
+            self.last_snapshot = (now, counters)
+            elapsed = max(now - previous_time, 1e-9)
+
+            record = {
+                'time': now,
+                'elapsed': now - self.started,
+                'final': final,
+                'counters': counters,
+                'rates': dict(
+                    (name, (value - previous_counters.get(name, 0)) / elapsed) for name, value in counters.items()
+                ),
+                'gauges': dict(
+                    (name, {'value': value, 'max': self.gauge_maxima[name]}) for name, value in self.gauges.items()
+                ),
+                'stages': dict(
+                    (name, {'seconds': seconds, 'calls': calls}) for name, (seconds, calls) in self.timers.items()
+                ),
+                'histograms': dict((name, histogram.snapshot()) for name, histogram in self.histograms.items()),
+                'errors': list(self.errors)
+            }
+
+        times = [now - then for now, then in zip(os.times(), self.started_times)]
+        record['cpu_seconds'] = {
+            'user': times[0],
+            'system': times[1],
+            'children': times[2] + times[3]
+        }
+        if resource is not None:
+            record['max_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if self.profile == 'memory':
+            import tracemalloc
+            if tracemalloc.is_tracing():
+                record['traced_memory'] = dict(zip(('current', 'peak'), tracemalloc.get_traced_memory()))
+        return record
+
+    def write_snapshot(self, final=False):
+        record = self.snapshot(final)
+        if self.output_file is not None:
+            self.output_file.write(json.dumps(record, sort_keys=True))
+            self.output_file.write('\n')
+            self.output_file.flush()
+        return record
+
+    def start(self):
+        """
+        Start the profiler if one was asked for, and writing snapshots if there's a path.
+
+        :return:
+        """
+        self.started = time.time()
+        self.started_times = os.times()
+        self.last_snapshot = (self.started, {})
+
+        if self.profile == 'cpu':
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        elif self.profile == 'memory':
+            import tracemalloc
+            tracemalloc.start()
+
+        if self.path is None:
+            return
+        self.output_file = open(self.path, 'a')
+        self.stopped.clear()
+        self.writer = threading.Thread(target=self.write_snapshots)
+        self.writer.daemon = True
+        self.writer.start()
+        return
+
+    def write_snapshots(self):
+        while not self.stopped.wait(self.interval):
+            self.write_snapshot()
+
+    def stop(self):
+        """
+        Write the final snapshot and the profile, and print a summary of where the time went.
+
+        :return:
+        """
+        if self.writer is not None:
+            self.stopped.set()
+            self.writer.join()
+            self.writer = None
+
+        record = self.write_snapshot(final=True)
+        if self.output_file is not None:
+            self.output_file.close()
+            self.output_file = None
+        profile_base = self.path or 'metrics'
+
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats('{}.prof'.format(profile_base))
+            self.profiler = None
+            print('CPU profile written to {}.prof.'.format(profile_base))
+        elif self.profile == 'memory':
+            import tracemalloc
+            if tracemalloc.is_tracing():
+                statistics = tracemalloc.take_snapshot().statistics('lineno')
+                tracemalloc.stop()
+                with open('{}.tracemalloc.txt'.format(profile_base), 'w') as profile_file:
+                    for statistic in statistics[:50]:
+                        profile_file.write('{}\n'.format(statistic))
+                print('Memory profile written to {}.tracemalloc.txt.'.format(profile_base))
+
+        if self.path is not None:
+            for line in self.summary(record):
+                print(line)
+        return
+
+    @staticmethod
+    def summary(record):
+        """
+        :param record: A snapshot.
+        :return: List of lines describing where the run's time went.
+        """
+        elapsed = max(record['elapsed'], 1e-9)
+        cpu = record['cpu_seconds']
+        lines = ['{:.1f}s elapsed, {:.1f}s of CPU ({:.0f}%), {:.1f}s in worker processes.'.format(
+            elapsed, cpu['user'] + cpu['system'], 100.0 * (cpu['user'] + cpu['system']) / elapsed, cpu['children'])]
+
+        for name, stage in sorted(record['stages'].items(), key=lambda item: -item[1]['seconds']):
+            lines.append('  {:<20}{:>10.2f}s {:>8} calls'.format(name, stage['seconds'], stage['calls']))
+        for name, histogram in sorted(record['histograms'].items()):
+            lines.append('  {:<20} p50 {:.3f}s  p90 {:.3f}s  p99 {:.3f}s  max {:.3f}s'.format(
+                name, histogram['p50'], histogram['p90'], histogram['p99'], histogram['max']))
+        for name, value in sorted(record['counters'].items()):
+            lines.append('  {:<20}{:>12} ({:.1f}/s)'.format(name, value, value / elapsed))
+        return lines
+
+
+def open_metrics(flags):
+    """
+    Set up the Metrics asked for by the --metrics, --metrics-interval and --profile flags.
+
+    :param flags: The parsed arguments.
+    :return: The Metrics, to be started and stopped around the run.
+    """
+    if flags.profile and not flags.metrics:
+        flags.metrics = 'datasettoolkit/metrics.jsonl'
+    return Metrics(path=flags.metrics, interval=flags.metrics_interval, profile=flags.profile)
@@ -4,23 +4,61 @@
 
 import json
 import os
-import requests
-import time
+from glob import glob
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pprint import pprint
 from shutil import copyfile
 
+from datasettoolkit.compression import EXTENSIONS, require
+from datasettoolkit.dedup_index import DedupIndex
+from datasettoolkit.fetcher import Fetcher
+from datasettoolkit.listing_parser import BACKENDS
+from datasettoolkit.metrics import Metrics, open_metrics
+from datasettoolkit.output_sink import TextSink
+from datasettoolkit.response_cache import ResponseCache
+
 
 class MultiRedditReader:
-    def __init__(self, posts, stage='training'):
+    def __init__(self, posts, stage='training', workers=8, rate=10.0, dedup='global', cache=None, metrics=None,
+                 config=None, compression=None, parser=None):
         """
         A class for handling both the retrieval of text data from the reddit website, and for passing that to files.
         Use querystrings for limiting response, i.e. /r/subreddit/new/.json?limit=100
 
-        :param stage: ['training', 'eval'] Choose one for setting aside what portion of your data is to be used for training purposes, and which is to be used as evaluation.
+        :param stage: ['dataset', 'training', 'eval'] Which config.<stage>.json to read. 'dataset' harvests everything
+        at once, to be split into training, eval and test sets by dataset_splitter afterwards. 'training' and 'eval'
+        harvest the two halves separately, from their own subreddits.
         :type stage: str
+        :param workers: How many subreddits to read at once.
+        :type workers: int
+        :param rate: The most requests per second to send to reddit, across all workers.
+        :type rate: float
+        :param dedup: ['global', 'stage', None] Skip posts that are already in any stage's files, only in this stage's,
+        or don't check at all. Each stage's index of its posts is kept in the checkpoints directory and carries across
+        runs, see open_dedup_index().
+        :type dedup: str
+        :param cache: Optional ResponseCache to serve listing pages from, i.e. shared by the training and eval runs.
+        :type cache: ResponseCache
+        :param metrics: Optional Metrics to record pages, posts and timings in, shared with the fetcher.
+        :type metrics: Metrics
+        :param config: Optional dict to use instead of reading config.<stage>.json, with the same keys. The stage still
+        names the output, checkpoint and dedup files.
+        :type config: dict
+        :param compression: Optional "gzip" or "zstd" to compress the category files with, as <stage>-<category>.txt.gz
+        or .txt.zst. The cleaner reads them as they are.
+        :type compression: str
+        :param parser: Optional listing_parser backend to decode pages with, see Fetcher.
+        :type parser: str
         """
+        if compression is not None:
+            require(compression)
+        self.compression = compression
         self.stage = stage
-        config_contents = json.load(open('datasettoolkit/configs/config.{}.json'.format(self.stage)))
+        if config is not None:
+            config_contents = config
+        else:
+            with open('datasettoolkit/configs/config.{}.json'.format(self.stage)) as config_file:
+                config_contents = json.load(config_file)
 
         self.subreddits = config_contents['subreddit_labels']
         self.subreddit_url_prefix = r'http://www.reddit.com/r/'
@@ -31,7 +69,14 @@ class MultiRedditReader:
         self.checkpoint_filepath = 'datasettoolkit/checkpoints/'
         self.output_filepath = 'datasettoolkit/datasets/'
         self.post_limit = posts
-        self.current_after = ''
+        self.workers = workers
+        self.metrics = metrics or Metrics()
+        self.fetcher = Fetcher(headers=self.headers, workers=workers, rate=rate, cache=cache, metrics=self.metrics,
+                               parser=parser)
+        self.dedup = dedup
+        self.dedup_index = None
+        self.dedup_index_filepath = None
+        self.other_dedup_indexes = []
 
         if 'destination_dir' in config_contents and config_contents['destination_dir']:
             # If the destination dir is present and not empty, let the function copy the new datasets to the
@@ -45,115 +90,442 @@ class MultiRedditReader:
 
         return
 
-    def read(self, noclobber=False):
+    def read(self, noclobber=False, resume=True):
         """
-        Go through each of the interest/avoid lists and read posts from each sub. Create a checkpoint file containing
-        keys of "", "done", or a token for continuing. If none, assume it hasn't been done yet. If "done", skip it.
-        Else, read token and continue where you left off, as well as checking the counter of how many posts we've
-        already read in.
-
-        :param noclobber: If set to True, will not remove existing output files, and will cause new lines to append.
+        Go through each of the interest/avoid lists and read posts from each sub. Each subreddit has a checkpoint file
+        in self.checkpoint_filepath holding the "after" token for continuing, how many posts we've already read in, how
+        far into its part file those posts go, and whether it's done. If there's no checkpoint, assume it hasn't been
+        started yet. If it's done, skip it. Else, carry on from where it left off.
+
+        Pages from one subreddit have to be fetched in order since each one needs the previous page's "after" token, so
+        up to self.workers subreddits are read at once instead. Each subreddit goes to its own part file, and once a
+        category's subreddits are all done their parts are joined in config order, so the category file comes out the
+        same as if they'd been read one after the other.
+
+        An interrupted run (network error, Ctrl-C, crash) leaves its part files and checkpoints behind, and the next
+        call to read() picks up from them without fetching any page a second time. Once every category has been
+        written, the checkpoints are cleared so the next run starts from the newest posts again.
+
+        :param noclobber: If set to True, will not remove existing output files, and will cause new lines to append. Posts
+        already in them are then skipped as duplicates. Otherwise the files are replaced, and posts are only compared
+        with each other and, with dedup "global", with other stages' files.
         :type noclobber: bool
+        :param resume: If set to False, throw away any checkpoints from an unfinished run and start over.
+        :type resume: bool
         :return:
         """
 
+        finished = False
         try:
-            for category, values in self.subreddits.iteritems():
-                print('Now working on category "{}".'.format(category))
-
-                # If a file exists for this category, remove it, else we'll append to old data and possibly introduce
-                # duplicate entries, skewing our training results later on.
-                category_filename = '{}-{}.txt'.format(self.stage, category)
-                category_filepath = '{}{}'.format(self.output_filepath, category_filename)
-                if not noclobber and os.path.isfile(category_filepath):
-                    os.remove(category_filepath)
-
-                for subreddit_name in (self.subreddits[category]):
-                    print('Reading /r/{}.'.format(subreddit_name))
-                    post_count = 0
-                    post_counter = 0
-                    self.current_after = ''
-
-                    # Adhere to 50ms artificial delay to go easy on the Reddit API.
-                    time.sleep(0.05)
-
-                    while post_counter < self.post_limit:
-                        # Build the target URL.
-                        subreddit_url = '{}{}{}'.format(
-                            self.subreddit_url_prefix,
-                            subreddit_name,
-                            self.subreddit_url_suffix
-                        )
-
-                        if not self.current_after:
-                            reddit_response = requests.get(
-                                subreddit_url,
-                                headers=self.headers
-                            ).json()['data']
-                        else:
-                            reddit_response = requests.get(
-                                '{}&after={}'.format(
-                                    subreddit_url,
-                                    self.current_after
-                                ),
-                                headers=self.headers
-                            ).json()['data']
-
-                        reddit_post_list = reddit_response['children']
-                        post_count += len(reddit_post_list)
-                        self.current_after = reddit_response['after']
-
-                        # Save the self.current_after value to a checkpoint file to pick up from this point later if
-                        # you leave and return to classify more posts.
-                        # This is a candidate for deletion as new executions of the script will start from the latest
-                        # posts and work backward - no need to maintain chronology across multiple executions.
-                        #with open('{}{}'.format(self.checkpoint_filepath, subreddit_name), 'wb+') as checkpoint:
-                        #    json.dump(self.current_after, checkpoint)
-
-                        for reddit_post in reddit_post_list:
-                            post_counter += 1
-
-                            # This is a self-post. Save the text, ommitting newlines.
-                            candidate_text = '{}'.format(
-                                reddit_post['data']['title'].encode('utf-8')
-                            )
-                            candidate_text = candidate_text.replace('\n', ' ').replace('\r', '')
-
-                            # Write to appropriate file.
-                            outfile = open(category_filepath, 'ab+')
-                            # Don't forget that final newline character - that's how the cleaner knows to separate training examples!
-                            outfile.write('{}\n'.format(candidate_text))
-
-                            if post_counter % 100 == 0:
-                                # Only print this every 100 iters. Reduces time spent writing to buffer.
-                                print('[{}/{} posts from /r/{} classed as "{}".]'.format(
-                                    post_counter,
-                                    self.post_limit,
-                                    subreddit_name,
-                                    category)
-                                )
-
-                print('Dataset retrieval for category "{}" is finished.'.format(category))
-
-                # If a destination_dir has been set, copy the files over.
-                if self.destination_dir:
-                    print('Destination directory set - copying "{}" category file.'.format(category))
-                    copyfile_result = copyfile(
-                        category_filepath,
-                        '{}{}'.format(self.destination_dir, category_filename)
-                    )
+            if not resume:
+                self.clear_checkpoints()
+
+            # Carry on with the dedup index an interrupted run left, if there's one to resume.
+            fresh = not glob('{}{}-*.json*'.format(self.checkpoint_filepath, self.stage))
+            self.open_dedup_index(clobber=not noclobber, fresh=fresh)
+
+            categories = [
+                category for category in self.subreddits
+                if not self.load_checkpoint(self.checkpoint_path(category)).get('done')
+            ]
+            tasks = [
+                (category, subreddit_name)
+                for category in categories
+                for subreddit_name in self.subreddits[category]
+            ]
+            remaining = dict((category, len(self.subreddits[category])) for category in categories)
+            failed = set()
+
+            for category in self.subreddits:
+                if category not in categories:
+                    print('Category "{}" was already written by an earlier run, skipping it.'.format(category))
+
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = dict(
+                    (executor.submit(self.read_subreddit, category, subreddit_name), (category, subreddit_name))
+                    for category, subreddit_name in tasks
+                )
+
+                for future in as_completed(futures):
+                    category, subreddit_name = futures[future]
+                    remaining[category] -= 1
+
+                    if future.exception() is not None:
+                        print('Reading /r/{} failed, category "{}" will not be written. Run again to resume.'.format(
+                            subreddit_name, category))
+                        self.exception_handling(future.exception())
+                        failed.add(category)
+                    elif remaining[category] == 0 and category not in failed:
+                        self.write_category(category, noclobber)
+
+            if not failed:
+                self.clear_checkpoints()
+                finished = True
 
             return
 
         except Exception as e:
             self.exception_handling(e)
 
+        finally:
+            self.close_dedup_index(replace=finished)
+
+    def open_dedup_index(self, clobber=False, fresh=True, scope=None):
+        """
+        Open the dedup index self.dedup asks for, if any, as self.dedup_index, and the indexes of other stages it's
+        checked against as self.other_dedup_indexes.
+
+        Each stage keeps an index of the posts in its own files, dedup-<stage>.idx in the checkpoints directory. "stage"
+        checks new posts against that one, and "global" against every stage's. When appending to the files, new posts
+        go in the stage's index. When the files are being replaced, the posts in them mustn't count as duplicates, or
+        a second run would replace every file with an empty one. The stage's index is then rebuilt from nothing in a
+        .new file, which only replaces it once all of the files have been written, see close_dedup_index().
+
+        :param clobber: If True, the stage's files are about to be replaced.
+        :param fresh: With clobber, start the new index over, rather than carrying on with the one an interrupted run
+        left.
+        :param scope: Optional name for the index in place of the stage, for files of the stage's written some other
+        way, i.e. by the harvest pipeline.
+        :return:
+        """
+        if self.dedup is None:
+            return
+
+        self.dedup_index_filepath = '{}dedup-{}.idx'.format(self.checkpoint_filepath, scope or self.stage)
+        index_filepath = self.dedup_index_filepath
+        if clobber:
+            index_filepath = '{}.new'.format(self.dedup_index_filepath)
+            if fresh and os.path.isfile(index_filepath):
+                os.remove(index_filepath)
+        self.dedup_index = DedupIndex(index_filepath)
+
+        if self.dedup == 'global':
+            self.other_dedup_indexes = [
+                DedupIndex(filepath)
+                for filepath in sorted(glob('{}dedup-*.idx'.format(self.checkpoint_filepath)))
+                if filepath != self.dedup_index_filepath
+            ]
+        return
+
+    def close_dedup_index(self, replace=False):
+        """
+        Close the indexes open_dedup_index() opened.
+
+        :param replace: If True, the files have all been written, so an index rebuilt for replacing them takes the
+        place of the old one.
+        :return:
+        """
+        if self.dedup_index is None:
+            return
+
+        self.dedup_index.close()
+        if replace and self.dedup_index.filepath != self.dedup_index_filepath:
+            os.replace(self.dedup_index.filepath, self.dedup_index_filepath)
+        for other_index in self.other_dedup_indexes:
+            other_index.close()
+        self.dedup_index = None
+        self.other_dedup_indexes = []
+        return
+
+    def checkpoint_path(self, category, subreddit_name=None):
+        """
+        Where the checkpoint for a subreddit, or for a whole category if subreddit_name is None, is kept.
+
+        :param category: The category.
+        :param subreddit_name: The subreddit, if this is a subreddit's checkpoint.
+        :return: The path to the checkpoint file.
+        """
+        if subreddit_name is None:
+            return '{}{}-{}.json'.format(self.checkpoint_filepath, self.stage, category)
+        return '{}{}-{}-{}.json'.format(self.checkpoint_filepath, self.stage, category, subreddit_name)
+
     @staticmethod
-    def exception_handling(e):
+    def load_checkpoint(path):
+        """
+        :param path: The path to the checkpoint file.
+        :return: The checkpoint's contents, or an empty dict if there isn't one.
+        """
+        if not os.path.isfile(path):
+            return {}
+        with open(path, 'r') as checkpoint:
+            return json.load(checkpoint)
+
+    @staticmethod
+    def save_checkpoint(path, contents):
+        """
+        Write a checkpoint to a temp file and move it into place, so there's always either the old checkpoint or the
+        new one on disk, never half of one.
+
+        :param path: The path to the checkpoint file.
+        :param contents: Dict to save as JSON.
+        :return:
+        """
+        with open('{}.tmp'.format(path), 'w') as checkpoint:
+            json.dump(contents, checkpoint)
+            checkpoint.flush()
+            os.fsync(checkpoint.fileno())
+        os.replace('{}.tmp'.format(path), path)
+        return
+
+    def clear_checkpoints(self):
+        """
+        Remove every checkpoint and leftover part file for this stage. Posts from thrown away part files stay in the
+        dedup index.
+
+        :return:
+        """
+        # Along with any page still being committed to the dedup index, see recover_page().
+        for path in glob('{}{}-*.json*'.format(self.checkpoint_filepath, self.stage)):
+            os.remove(path)
+        for path in glob('{}.{}-*.txt.part'.format(self.output_filepath, self.stage)):
+            os.remove(path)
+        return
+
+    def part_filepath(self, category, subreddit_name):
+        """
+        Where a single subreddit's posts are collected before being joined into the category file.
+
+        :param category: The category the subreddit is listed under.
+        :param subreddit_name: The subreddit.
+        :return: The path to the part file.
+        """
+        return '{}.{}-{}.{}.txt.part'.format(self.output_filepath, self.stage, category, subreddit_name)
+
+    def read_subreddit(self, category, subreddit_name):
+        """
+        Read up to self.post_limit posts from a subreddit, a page at a time, into its part file.
+
+        :param category: The category the subreddit is listed under.
+        :param subreddit_name: The subreddit.
+        :return:
+        """
+        checkpoint_path = self.checkpoint_path(category, subreddit_name)
+        pending_path = '{}.pending'.format(checkpoint_path)
+        self.recover_page(checkpoint_path)
+        checkpoint = self.load_checkpoint(checkpoint_path)
+        part_filepath = self.part_filepath(category, subreddit_name)
+        if not os.path.isfile(part_filepath):
+            # Without the part file there's nothing to resume.
+            checkpoint = {}
+
+        if checkpoint.get('done'):
+            print('/r/{} was already read by an earlier run, skipping it.'.format(subreddit_name))
+            return
+
+        post_counter = checkpoint.get('posts', 0)
+        duplicate_counter = 0
+        current_after = checkpoint.get('after', '')
+        if checkpoint:
+            print('Resuming /r/{} from after={} ({} posts already read).'.format(
+                subreddit_name, current_after, post_counter))
+        else:
+            print('Reading /r/{}.'.format(subreddit_name))
+
+        with open(part_filepath, 'r+b' if checkpoint else 'wb') as outfile:
+            # Anything past the checkpointed offset is from a page that was cut off part way through being written, and
+            # will be fetched again.
+            outfile.truncate(checkpoint.get('offset', 0))
+            outfile.seek(0, os.SEEK_END)
+
+            for reddit_post_list, current_after, done in self.pages(subreddit_name, current_after, post_counter):
+                post_counter += len(reddit_post_list)
+
+                lines, page_keys, duplicates = self.page_lines(reddit_post_list)
+                duplicate_counter += duplicates
+                print('[{}/{} posts from /r/{} classed as "{}", {} duplicates skipped.]'.format(
+                    post_counter,
+                    self.post_limit,
+                    subreddit_name,
+                    category,
+                    duplicate_counter)
+                )
+
+                # Write the whole page to the file at once, and make sure it's on disk before the checkpoint says so.
+                with self.metrics.timer('disk.write'):
+                    outfile.write(b''.join(lines))
+                    outfile.flush()
+                    os.fsync(outfile.fileno())
+
+                # Save the current_after value to a checkpoint file to pick up from this point later if the run is
+                # interrupted.
+                next_checkpoint = {
+                    'after': current_after,
+                    'posts': post_counter,
+                    'offset': outfile.tell(),
+                    'done': done
+                }
+
+                # Now that the page is safely saved its posts go in the dedup index, and are on disk before the
+                # checkpoint moves past them. The checkpoint it leads to is written down first with the page's keys:
+                # if we crashed part way through committing them, the page mustn't be fetched again on resume and
+                # look like a duplicate of itself, so the resume finishes the commit instead, see recover_page().
+                if self.dedup_index is not None:
+                    self.save_checkpoint(pending_path, dict(next_checkpoint, keys=page_keys))
+                    self.dedup_index.commit(page_keys)
+                    self.dedup_index.flush()
+                self.save_checkpoint(checkpoint_path, next_checkpoint)
+                if self.dedup_index is not None:
+                    os.remove(pending_path)
+
+        return
+
+    def recover_page(self, checkpoint_path):
+        """
+        Finish saving a page that was written to its part file, but whose keys were still being committed to the dedup
+        index when the run stopped: commit them all (committing a key twice does nothing) and move the checkpoint on
+        past the page, as read_subreddit() would have.
+
+        :param checkpoint_path: The subreddit's checkpoint.
+        :return:
+        """
+        pending_path = '{}.pending'.format(checkpoint_path)
+        if not os.path.isfile(pending_path):
+            return
+
+        pending = self.load_checkpoint(pending_path)
+        page_keys = pending.pop('keys')
+        if self.dedup_index is not None:
+            self.dedup_index.commit(page_keys)
+            self.dedup_index.flush()
+        self.save_checkpoint(checkpoint_path, pending)
+        os.remove(pending_path)
+        return
+
+    def pages(self, subreddit_name, current_after='', post_counter=0):
+        """
+        Fetch a subreddit's listing a page at a time, newest posts first.
+
+        :param subreddit_name: The subreddit.
+        :param current_after: The "after" token to carry on from, or '' to start from the newest post.
+        :param post_counter: How many posts have already been read, counting towards self.post_limit.
+        :return: Generator of (posts, after, done): the page's posts, the token for the next page and whether that was
+        the last page to read.
+        """
+        # Build the target URL.
+        subreddit_url = '{}{}{}'.format(
+            self.subreddit_url_prefix,
+            subreddit_name,
+            self.subreddit_url_suffix
+        )
+
+        while post_counter < self.post_limit:
+            if not current_after:
+                reddit_response = self.fetcher.get_listing(subreddit_url)
+            else:
+                reddit_response = self.fetcher.get_listing(
+                    '{}&after={}'.format(
+                        subreddit_url,
+                        current_after
+                    )
+                )
+
+            reddit_post_list = reddit_response['children']
+            post_counter += len(reddit_post_list)
+            current_after = reddit_response['after']
+            self.metrics.add('reddit.pages')
+            self.metrics.add('reddit.posts', len(reddit_post_list))
+
+            # Reddit stops handing out "after" tokens once you've reached the end of the listing.
+            done = post_counter >= self.post_limit or not current_after or not reddit_post_list
+            yield reddit_post_list, current_after, done
+
+            if done:
+                return
+
+    def page_lines(self, reddit_post_list):
+        """
+        Turn a page of posts into lines of text, one per post, leaving out posts the dedup index has already seen. The
+        new posts' keys are reserved in the index, and are only committed by the caller once the lines are saved.
+
+        :param reddit_post_list: The posts on the page.
+        :return: Tuple of (lines, keys, duplicates): the lines as bytes, each ending in a newline, the reserved keys,
+        and how many posts were skipped as duplicates.
+        """
+        lines = []
+        page_keys = []
+        duplicates = 0
+        for reddit_post in reddit_post_list:
+            # Save the title, ommitting newlines.
+            candidate_text = reddit_post['data']['title'].replace('\n', ' ').replace('\r', '')
+
+            if self.dedup_index is not None:
+                # Skip posts that are already in a dataset, i.e. from another subreddit, another stage or an earlier
+                # run being appended to.
+                post_keys = DedupIndex.post_keys(
+                    reddit_post['data'].get('name', reddit_post['data'].get('id')),
+                    candidate_text
+                )
+                seen = any(key in other_index for other_index in self.other_dedup_indexes for key in post_keys)
+                if seen or not self.dedup_index.reserve(post_keys):
+                    duplicates += 1
+                    continue
+                page_keys.extend(post_keys)
+
+            # Don't forget that final newline character - that's how the cleaner knows to separate training examples!
+            lines.append('{}\n'.format(candidate_text).encode('utf-8'))
+
+        self.metrics.add('reddit.duplicates', duplicates)
+        self.metrics.add('reddit.bytes', sum(len(line) for line in lines))
+        return lines, page_keys, duplicates
+
+    def write_category(self, category, noclobber=False):
+        """
+        Join the part files for each of a category's subreddits into the category file, then copy it to
+        destination_dir if one is set.
+
+        :param category: The category to write.
+        :param noclobber: If set to True, append to the existing category file rather than replacing it.
+        :return:
+        """
+        # If a file exists for this category, replace it, else we'll append to old data and possibly introduce
+        # duplicate entries, skewing our training results later on.
+        category_filename = '{}-{}.txt{}'.format(self.stage, category, EXTENSIONS.get(self.compression, ''))
+        category_filepath = '{}{}'.format(self.output_filepath, category_filename)
+
+        # Without noclobber the new file is built next to the old one and swapped in, so an interrupted join can simply
+        # be run again. With it, the parts are appended in place, and an interrupted append is cut off the next time.
+        # Appending to a compressed file adds a new gzip member or zstd frame after the old ones.
+        with TextSink(category_filepath, append=noclobber, metrics=self.metrics, compression=self.compression) as sink:
+            for subreddit_name in self.subreddits[category]:
+                sink.append_file(self.part_filepath(category, subreddit_name))
+        self.save_checkpoint(self.checkpoint_path(category), {'done': True})
+
+        for subreddit_name in self.subreddits[category]:
+            os.remove(self.part_filepath(category, subreddit_name))
+
+        print('Dataset retrieval for category "{}" is finished.'.format(category))
+
+        # If a destination_dir has been set, copy the files over.
+        if self.destination_dir:
+            print('Destination directory set - copying "{}" category file.'.format(category))
+            copyfile(
+                category_filepath,
+                '{}{}'.format(self.destination_dir, category_filename)
+            )
+
+        return
+
+    def exception_handling(self, e):
+        self.metrics.error('read', e)
         print('Exception: {}'.format(e))
         return
 
 
+def response_cache(flags):
+    """
+    Open the ResponseCache asked for by the --cache, --cache-size, --cache-max-age and --offline flags.
+
+    :param flags: The parsed arguments.
+    :return: The ResponseCache, or None if --cache wasn't given.
+    """
+    if flags.offline and not flags.cache:
+        flags.cache = 'datasettoolkit/cache/'
+    if not flags.cache:
+        return None
+    return ResponseCache(flags.cache, max_bytes=flags.cache_size * 1024 * 1024, max_age=flags.cache_max_age,
+                         offline=flags.offline)
+
+
 def main():
     """
     Generally this is what invokes the actual reading from reddit.
@@ -162,6 +534,11 @@ def main():
     import argparse
 
     parser = argparse.ArgumentParser(description='Retrieve thousands of reddit posts and write them to files!')
+    parser.add_argument(
+        '--stage',
+        default='dataset',
+        help='The config to harvest, datasettoolkit/configs/config.STAGE.json. (default: dataset)'
+    )
     parser.add_argument(
         '--posts',
         type=int,
@@ -169,14 +546,104 @@ def main():
         default=10000,
         help='The number of posts to retrieve for each subreddit. (default: 10000)'
     )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        action='store',
+        default=8,
+        help='The number of subreddits to read at once. (default: 8)'
+    )
+    parser.add_argument(
+        '--rate',
+        type=float,
+        action='store',
+        default=10.0,
+        help='The most requests per second to send to reddit, or 0 for no limit. (default: 10)'
+    )
+    parser.add_argument(
+        '--dedup',
+        choices=['global', 'stage', 'none'],
+        default='global',
+        help='Skip posts already saved by any stage, only by the same stage, or keep duplicates. (default: global)'
+    )
+    parser.add_argument(
+        '--fresh',
+        action='store_true',
+        help='Ignore checkpoints left by an interrupted run and start over.'
+    )
+    parser.add_argument(
+        '--cache',
+        nargs='?',
+        const='datasettoolkit/cache/',
+        default=None,
+        help='Keep fetched pages in an on-disk cache, in the given directory. (default: no cache, or '
+             'datasettoolkit/cache/ if no directory is given)'
+    )
+    parser.add_argument(
+        '--cache-size',
+        type=int,
+        action='store',
+        default=1024,
+        help='The most MB of pages to keep in the cache. (default: 1024)'
+    )
+    parser.add_argument(
+        '--cache-max-age',
+        type=float,
+        action='store',
+        default=3600,
+        help='Seconds to use a cached page for before checking with reddit that it has not changed. (default: 3600)'
+    )
+    parser.add_argument(
+        '--offline',
+        action='store_true',
+        help='Only replay pages from the cache, never fetch from reddit.'
+    )
+
+    parser.add_argument(
+        '--metrics',
+        nargs='?',
+        const='datasettoolkit/metrics.jsonl',
+        default=None,
+        help='Append counters, stage timings and latency histograms to this file as JSON lines, and print a summary '
+             'at the end. (default: off, or datasettoolkit/metrics.jsonl if no file is given)'
+    )
+    parser.add_argument(
+        '--metrics-interval',
+        type=float,
+        action='store',
+        default=10.0,
+        help='Seconds between --metrics lines. (default: 10)'
+    )
+    parser.add_argument(
+        '--profile',
+        choices=['cpu', 'memory'],
+        default=None,
+        help='Also run cProfile or tracemalloc, and write what they find next to the --metrics file.'
+    )
+    parser.add_argument(
+        '--compress',
+        choices=['gzip', 'zstd'],
+        default=None,
+        help='Compress the category files, as .txt.gz or .txt.zst. (default: off)'
+    )
+    parser.add_argument(
+        '--parser',
+        choices=BACKENDS,
+        default=None,
+        help='How to decode listing pages. ijson streams them as they arrive when there is no --cache. (default: '
+             'orjson if installed, else json)'
+    )
 
     flags = parser.parse_args()
     print('Will retrieve {} posts per subreddit.'.format(flags.posts))
-
-    reddit_client = MultiRedditReader(stage='training', posts=flags.posts)
-    reddit_client.read(noclobber=False)
-    reddit_client = MultiRedditReader(stage='eval', posts=flags.posts)
-    reddit_client.read(noclobber=False)
+    cache = response_cache(flags)
+
+    with open_metrics(flags) as metrics:
+        # One harvest for everything. Clean and label the category files, then split them with dataset_splitter.
+        reddit_client = MultiRedditReader(stage=flags.stage, posts=flags.posts, workers=flags.workers, rate=flags.rate,
+                                          dedup=None if flags.dedup == 'none' else flags.dedup, cache=cache,
+                                          metrics=metrics, compression=flags.compress, parser=flags.parser)
+        reddit_client.read(noclobber=False, resume=not flags.fresh)
     return
 
 if __name__ == '__main__':
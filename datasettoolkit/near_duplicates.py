@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Finds cleaned windows that are near copies of earlier ones, i.e. reposts and templated titles, with MinHash and LSH.
+
+import zlib
+
+import numpy
+
+from datasettoolkit.metrics import Metrics
+from datasettoolkit.output_sink import open_sink
+
+# Odd multipliers for mixing word hashes into shingle hashes, and minhashes into band keys. Overflow just wraps.
+SHINGLE_MULTIPLIER = numpy.uint64(0x9E3779B97F4A7C15)
+BAND_MULTIPLIER = numpy.uint64(0xC2B2AE3D27D4EB4F)
+
+
+def lsh_bands(threshold, permutations):
+    """
+    Pick how to cut a signature into bands. Two windows become candidates if every row of any one band matches, which
+    for windows with Jaccard similarity s happens with probability 1 - (1 - s ** rows) ** bands. That's an S curve, and
+    this picks the bands and rows that put its step closest to threshold, weighing the near duplicates it would miss
+    and the dissimilar pairs it would have to check equally.
+
+    :param threshold: The Jaccard similarity that counts as a near duplicate.
+    :param permutations: Number of minhashes in a signature.
+    :return: Tuple of (bands, rows). bands * rows may be a little less than permutations, the rest go unused.
+    """
+    similarities = numpy.linspace(0.0, 1.0, 201)
+    below = similarities < threshold
+    best = None
+    for rows in range(1, permutations + 1):
+        bands = permutations // rows
+        candidate = 1.0 - (1.0 - similarities ** rows) ** bands
+        error = candidate[below].sum() + (1.0 - candidate[~below]).sum()
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+class NearDuplicateFilter:
+    def __init__(self, threshold=0.8, permutations=128, shingle_words=3, memory_windows=100000, batch_rows=512,
+                 seed=1, flag_filepath=None, metrics=None):
+        """
+        Drops, or flags, windows whose word shingles have a Jaccard similarity of at least threshold with an earlier
+        window's. Exact dedup only catches a post seen twice; this also catches a repost with a word changed, a
+        crosspost with a different signature, or a meme title with a different punchline.
+
+        Each window's set of shingle_words-word shingles is summarised by a MinHash signature of permutations 32-bit
+        minhashes, the share of which two signatures agree on estimates the two windows' Jaccard similarity. Signatures
+        are computed for batch_rows windows at a time as one NumPy array operation. The signature is cut into bands
+        (see lsh_bands()), and each band is hashed into a bucket, so a window is only compared with the few earlier
+        windows that share a bucket with it, rather than with all of them. That keeps the cost per window flat however
+        big the corpus gets.
+
+        Only the latest memory_windows windows that were kept are remembered, in a ring buffer, so memory is bounded
+        at roughly 1.5KB per remembered window, about 150MB for the default. A near duplicate further back than that
+        gets through.
+
+        Windows that are flagged rather than dropped are still written. Each one is listed, as row, duplicate_of and
+        similarity, in a .csv at flag_filepath, which like the other sinks only appears once the filter is closed. Rows
+        are counted from 0 for the first row that went through the filter.
+
+        :param threshold: Estimated Jaccard similarity at or above which a window counts as a near duplicate.
+        :param permutations: Number of minhashes in each signature. More is more accurate, and slower.
+        :param shingle_words: Number of consecutive words in a shingle. Windows with fewer words are one shingle.
+        :param memory_windows: Number of kept windows to remember and compare against.
+        :param batch_rows: Number of windows to compute signatures for at a time.
+        :param seed: Seed for the hash functions, so the same windows are dropped every run.
+        :param flag_filepath: Optional .csv file to list near duplicates in, keeping them in the output rather than
+        dropping them.
+        :param metrics: Optional Metrics to count near duplicates and time the filter in.
+        """
+        if not 0.0 < threshold <= 1.0:
+            raise ValueError('threshold must be above 0 and at most 1, not {}.'.format(threshold))
+        self.threshold = threshold
+        self.permutations = permutations
+        self.shingle_words = shingle_words
+        self.memory_windows = memory_windows
+        self.batch_rows = batch_rows
+        self.metrics = metrics or Metrics()
+
+        # Each permutation is a multiply-shift hash, the top 32 bits of (a * x + b) mod 2**64 for an odd a, which needs
+        # no division, unlike the usual (a * x + b) mod p.
+        random = numpy.random.RandomState(seed)
+        self.multipliers = random.randint(0, 1 << 63, size=(permutations, 1), dtype=numpy.uint64) * 2 + 1
+        self.increments = random.randint(0, 1 << 63, size=(permutations, 1), dtype=numpy.uint64)
+        self.bands, self.rows = lsh_bands(threshold, permutations)
+
+        # Ring buffer of the remembered windows: their signatures, band keys and output rows. Each band's table maps a
+        # band key to the slot of the latest window with it.
+        self.signatures = numpy.zeros((memory_windows, permutations), dtype=numpy.uint32)
+        self.slot_keys = [None] * memory_windows
+        self.slot_rows = [None] * memory_windows
+        self.tables = [{} for _ in range(self.bands)]
+        self.remembered = 0
+
+        self.rows_written = 0
+        self.duplicates = 0
+        self.flagged = open_sink(flag_filepath, append=False, metrics=self.metrics) if flag_filepath else None
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.flagged is not None:
+            self.flagged.__exit__(exc_type, exc_value, traceback)
+        return False
+
+    def close(self):
+        if self.flagged is not None:
+            self.flagged.close()
+        return
+
+    def shingle_hashes(self, lines):
+        """
+        :param lines: List of cleaned lines, as strings.
+        :return: Tuple of (hashes, offsets): a 32-bit hash of every shingle of every line, in a uint64 array, and the
+        index in it of each line's first shingle. Every line has at least one shingle.
+        """
+        word_hashes = []
+        lengths = []
+        for line in lines:
+            words = line.encode('utf-8').split()
+            word_hashes.extend([zlib.crc32(word) for word in words])
+            lengths.append(len(words))
+        # A sentinel, so a line with no words still has something to index.
+        word_hashes.append(0)
+        word_hashes = numpy.array(word_hashes, dtype=numpy.uint64)
+
+        lengths = numpy.array(lengths, dtype=numpy.int64)
+        line_starts = numpy.concatenate(([0], numpy.cumsum(lengths)[:-1]))
+        counts = numpy.maximum(lengths - self.shingle_words + 1, 1)
+        offsets = numpy.concatenate(([0], numpy.cumsum(counts)[:-1]))
+
+        # Where each shingle starts, and where its line ends.
+        line_ends = numpy.repeat(line_starts + lengths, counts)
+        starts = numpy.repeat(line_starts - offsets, counts) + numpy.arange(counts.sum())
+
+        hashes = numpy.zeros(len(starts), dtype=numpy.uint64)
+        for position in range(self.shingle_words):
+            words = starts + position
+            # Shingles of a line shorter than shingle_words run past its end, and past the end of the array.
+            in_line = numpy.where(words < line_ends, word_hashes[numpy.minimum(words, len(word_hashes) - 1)], 0)
+            hashes = hashes * SHINGLE_MULTIPLIER + in_line
+        return (hashes ^ (hashes >> numpy.uint64(32))) & numpy.uint64(0xFFFFFFFF), offsets
+
+    def signatures_for(self, lines):
+        """
+        :param lines: List of cleaned lines, as strings.
+        :return: uint32 array of one MinHash signature per line.
+        """
+        hashes, offsets = self.shingle_hashes(lines)
+        # One row per permutation, so each line's minimum is taken over a contiguous run of shingles.
+        permuted = self.multipliers * hashes
+        permuted += self.increments
+        permuted >>= numpy.uint64(32)
+        return numpy.minimum.reduceat(permuted, offsets, axis=1).T.astype(numpy.uint32)
+
+    def band_keys(self, signatures):
+        """
+        :param signatures: uint32 array of signatures.
+        :return: List with a list of band keys, as ints, for each signature.
+        """
+        bands = signatures[:, :self.bands * self.rows].astype(numpy.uint64).reshape(-1, self.bands, self.rows)
+        keys = numpy.zeros(bands.shape[:2], dtype=numpy.uint64)
+        for row in range(self.rows):
+            keys = keys * BAND_MULTIPLIER + bands[:, :, row]
+        return keys.tolist()
+
+    def match(self, signature, keys):
+        """
+        :param signature: A window's signature.
+        :param keys: Its band keys.
+        :return: The remembered window most similar to it at or above threshold, as (row, similarity), or None.
+        """
+        candidates = set()
+        for table, key in zip(self.tables, keys):
+            slot = table.get(key)
+            if slot is not None:
+                candidates.add(slot)
+        if not candidates:
+            return None
+
+        candidates = sorted(candidates)
+        similarities = (self.signatures[candidates] == signature).mean(axis=1)
+        best = int(similarities.argmax())
+        if similarities[best] < self.threshold:
+            return None
+        return self.slot_rows[candidates[best]], float(similarities[best])
+
+    def remember(self, signature, keys, row):
+        """
+        Add a kept window to the ring buffer, forgetting the oldest one if it's full.
+
+        :param signature: The window's signature.
+        :param keys: Its band keys.
+        :param row: Its row in the output.
+        :return:
+        """
+        slot = self.remembered % self.memory_windows
+        if self.slot_keys[slot] is not None:
+            for table, key in zip(self.tables, self.slot_keys[slot]):
+                if table.get(key) == slot:
+                    del table[key]
+
+        self.signatures[slot] = signature
+        self.slot_keys[slot] = keys
+        self.slot_rows[slot] = row
+        for table, key in zip(self.tables, keys):
+            table[key] = slot
+        self.remembered += 1
+        return
+
+    def filter(self, rows, key=None):
+        """
+        Drop near duplicates from the rows, or flag them if there's a flag_filepath. Rows are compared with the earlier
+        ones a batch at a time, and only the ones kept without a flag are remembered.
+
+        :param rows: Iterable of rows.
+        :param key: Optional function that picks the cleaned line out of a row, i.e. the first column of a labelled row.
+        By default each row is the line.
+        :return: Generator of the rows to write.
+        """
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_rows:
+                for kept in self.filter_batch(batch, key):
+                    yield kept
+                batch = []
+        if batch:
+            for kept in self.filter_batch(batch, key):
+                yield kept
+
+    def filter_batch(self, batch, key):
+        """
+        :param batch: List of rows.
+        :param key: As for filter().
+        :return: List of the rows to write.
+        """
+        with self.metrics.timer('near_duplicates'):
+            signatures = self.signatures_for([key(row) for row in batch] if key else batch)
+            band_keys = self.band_keys(signatures)
+
+            kept = []
+            for row, signature, keys in zip(batch, signatures, band_keys):
+                match = self.match(signature, keys)
+                if match is None:
+                    self.remember(signature, keys, self.rows_written)
+                else:
+                    self.duplicates += 1
+                    if self.flagged is None:
+                        continue
+                    self.flagged.write([str(self.rows_written), str(match[0]), '{:.3f}'.format(match[1])])
+                kept.append(row)
+                self.rows_written += 1
+
+        self.metrics.add('clean.near_duplicates', len(batch) - len(kept) if self.flagged is None else 0)
+        return kept
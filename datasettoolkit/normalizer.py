@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# Block-at-a-time text normalisation and tokenising for the cleaner.
+
+# Maps A-Z to a-z, keeps a-z and 0-9, and turns every other byte (punctuation, whitespace, underscores, anything
+# non-ASCII) into a space. One bytes.translate() with this table does the work of .lower() plus re.sub(r'[\W_]+', ' ')
+# a byte at a time, apart from squashing runs of spaces.
+NORMALIZE_TABLE = bytes(
+    byte + 32 if 65 <= byte <= 90 else byte if 97 <= byte <= 122 or 48 <= byte <= 57 else 32
+    for byte in range(256)
+)
+
+
+def normalize(data):
+    """
+    Lowercase the given bytes and turn everything but letters and digits into spaces, in a single pass.
+
+    :param data: Bytes to normalise.
+    :return: Normalised bytes, the same length as data.
+    """
+    return data.translate(NORMALIZE_TABLE)
+
+
+def clean_line(line):
+    """
+    Exactly line.lower() followed by re.sub(r'[\\W_]+', ' ', line), but done with a translate table and a split rather
+    than a regex.
+
+    :param line: Bytes to clean.
+    :return: Cleaned bytes.
+    """
+    normalized = line.translate(NORMALIZE_TABLE)
+    words = normalized.split()
+    if not words:
+        return b' ' if normalized else b''
+
+    cleaned = b' '.join(words)
+    if normalized.startswith(b' '):
+        cleaned = b' ' + cleaned
+    if normalized.endswith(b' '):
+        cleaned += b' '
+    return cleaned
+
+
+def read_chunks(raw_text_file, chunk_size, length=None):
+    """
+    :param raw_text_file: File object opened in binary mode.
+    :param chunk_size: Number of bytes to read at a time.
+    :param length: If set, stop after this many bytes rather than at the end of the file.
+    :return: Generator of chunks of bytes.
+    """
+    while length is None or length > 0:
+        chunk = raw_text_file.read(chunk_size if length is None else min(chunk_size, length))
+        if not chunk:
+            return
+        if length is not None:
+            length -= len(chunk)
+        yield chunk
+
+
+def raw_word_blocks(raw_text_file, chunk_size):
+    """
+    Split the raw file into words a chunk at a time, the way the cleaner always has.
+
+    Gives exactly what ' '.join(raw_text_file.read().splitlines()).split(' ') used to: every line break (LF, CR or
+    CRLF) counts as a single space, except for one right at the end of the file, and runs of spaces produce empty
+    words. The word after the last separator in a chunk is carried over to the next one, along with a trailing CR
+    that may turn out to be the first half of a CRLF.
+
+    :param raw_text_file: File object opened in binary mode.
+    :param chunk_size: Number of bytes to read at a time.
+    :return: Generator of lists of words as bytes, one list per chunk.
+    """
+    carry = b''
+    ended_on_line_break = False
+
+    for chunk in read_chunks(raw_text_file, chunk_size):
+        data = carry + chunk
+        end = len(data) - 1 if data.endswith(b'\r') else len(data)
+        last_separator = max(data.rfind(b' ', 0, end), data.rfind(b'\n', 0, end), data.rfind(b'\r', 0, end))
+        if last_separator == -1:
+            carry = data
+            continue
+
+        complete, carry = data[:last_separator], data[last_separator + 1:]
+        ended_on_line_break = data[last_separator:last_separator + 1] != b' '
+        if data[last_separator:last_separator + 1] == b'\n' and complete.endswith(b'\r'):
+            complete = complete[:-1]
+
+        yield complete.replace(b'\r\n', b' ').replace(b'\r', b' ').replace(b'\n', b' ').split(b' ')
+
+    if carry.endswith(b'\r'):
+        # The file finished on a CR, which isn't a separator.
+        yield [carry[:-1]]
+    elif carry or not ended_on_line_break:
+        yield [carry]
+
+
+def normalized_word_blocks(raw_text_file, chunk_size, length=None):
+    """
+    Normalise the raw file a chunk at a time and split it into words, skipping the empty words that runs of spaces
+    and punctuation leave behind. Every word is a run of lowercase letters and digits.
+
+    :param raw_text_file: File object opened in binary mode.
+    :param chunk_size: Number of bytes to read at a time.
+    :param length: If set, stop after this many bytes rather than at the end of the file.
+    :return: Generator of lists of words as bytes, one list per chunk.
+    """
+    carry = b''
+
+    for chunk in read_chunks(raw_text_file, chunk_size, length):
+        data = carry + chunk.translate(NORMALIZE_TABLE)
+        last_separator = data.rfind(b' ')
+        if last_separator == -1:
+            carry = data
+            continue
+
+        carry = data[last_separator + 1:]
+        yield data[:last_separator].split()
+
+    if carry:
+        yield [carry]
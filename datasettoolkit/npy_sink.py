@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+# Writes cleaned windows as a fixed-width matrix of token ids in NumPy's .npy format, for loaders to memory-map.
+
+import logging
+import os
+import sys
+from array import array
+
+from datasettoolkit.metrics import Metrics
+from datasettoolkit.output_sink import temp_filepath_for
+from datasettoolkit.vocabulary import RESERVED_TOKENS, VocabularyBuilder, token_fingerprint
+
+NPY_MAGIC = b'\x93NUMPY\x01\x00'
+NPY_HEADER_SIZE = 128  # Total size of magic, header length and header, a multiple of 64 as NumPy prefers.
+
+PAD_ID = 0
+UNKNOWN_ID = 1
+
+
+def npy_header(shape, dtype='i4'):
+    """
+    Build a version 1.0 .npy header for a little- or big-endian (whichever this machine is) array of the given shape,
+    padded to NPY_HEADER_SIZE so it can be rewritten in place once the final shape is known.
+
+    :param shape: Tuple of dimensions.
+    :param dtype: The array's type code without its byte order, i.e. "i4" for int32 or "u8" for uint64.
+    :return: The header as bytes.
+    """
+    descr = ('<' if sys.byteorder == 'little' else '>') + dtype
+    header = "{{'descr': '{}', 'fortran_order': False, 'shape': {}, }}".format(descr, repr(tuple(shape)))
+    padding = NPY_HEADER_SIZE - len(NPY_MAGIC) - 2 - len(header) - 1
+    if padding < 0:
+        raise ValueError('Shape {} does not fit in the .npy header.'.format(shape))
+    header = (header + ' ' * padding + '\n').encode('latin1')
+    return NPY_MAGIC + len(header).to_bytes(2, 'little') + header
+
+
+class NpySink():
+    """
+    The columnar counterpart of CsvSink. Rather than text, each window is written as a row of max_sentence_length int32
+    token ids to <name>.npy, with the vocabulary that maps ids back to words in <name>.vocab (see
+    VocabularyBuilder.write()) and, for labelled rows, each row's label index in <name>.labels.npy. Ids 0 and 1 are
+    reserved for padding and unknown words. Windows with fewer words than max_sentence_length are padded with 0, and
+    ones with more (the raw tokenizer can split "don't" into "don t") are cut short. The tokens cut off are counted in
+    the "npy.truncated_tokens" metric and reported with a warning on close(); the normalized tokenizer never makes
+    windows longer than max_sentence_length, so use it to lose nothing.
+
+    Training jobs can then load the matrix with numpy.load(..., mmap_mode='r') and slice it directly, without parsing
+    or tokenising anything. See load_windows().
+
+    The vocabulary isn't known until every window has been seen, so while writing, each token is stored as a 64-bit
+    fingerprint in a temp file and counted by a VocabularyBuilder. On close() the builder prunes its counts into the
+    vocabulary, and the fingerprints are mapped to ids (or the unknown id, for pruned tokens) a chunk at a time. That
+    reads the temp file once more, but never the corpus, and only the kept tokens need to be held in memory.
+
+    Like the other sinks, everything goes to temp files that replace the targets on close(), and abort() leaves the
+    targets as they were. Unlike them, it always replaces the existing dataset rather than appending to it.
+    """
+
+    def __init__(self, filepath, width, labels, vocabulary, buffer_rows=10000, metrics=None, **kwargs):
+        """
+        :param filepath: The .npy file to write. The .vocab and .labels.npy files go next to it.
+        :param width: Number of token ids per row, i.e. max_sentence_length.
+        :param labels: The output labels, so a row's label can be stored as its index in this list.
+        :param vocabulary: A VocabularyBuilder to count tokens with, set up with the pruning to apply.
+        :param buffer_rows: Write to the temp files every this many rows.
+        :param metrics: Optional Metrics to record rows written and time spent writing in.
+        """
+        self.filepath = filepath
+        self.base_filepath = filepath[:-len('.npy')] if filepath.endswith('.npy') else filepath
+        self.width = width
+        self.labels = labels
+        self.vocabulary = vocabulary
+        self.buffer_rows = buffer_rows
+        self.rows_written = 0
+        self.truncated_tokens = 0
+        self.metrics = metrics or Metrics()
+        self.closed = False
+
+        self.temp_filepaths = dict(
+            (suffix, temp_filepath_for('{}{}'.format(self.base_filepath, suffix)))
+            for suffix in ('.npy', '.labels.npy', '.vocab', '.fingerprints')
+        )
+
+        self.fingerprints_file = open(self.temp_filepaths['.fingerprints'], 'wb')
+        self.labels_file = open(self.temp_filepaths['.labels.npy'], 'wb')
+        self.labels_file.write(npy_header((0,)))
+        self.has_labels = False
+
+        self.fingerprints_buffer = array('Q')
+        self.labels_buffer = array('i')
+        if self.fingerprints_buffer.itemsize != 8 or self.labels_buffer.itemsize != 4:
+            raise RuntimeError('NpySink needs 8-byte unsigned long longs and 4-byte ints.')
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+    def write(self, row):
+        """
+        Add a window to the buffer.
+
+        :param row: Either a cleaned line, or a list of [line, label] like CsvSink takes.
+        :return:
+        """
+        if isinstance(row, (list, tuple)):
+            line, label = row
+            self.labels_buffer.append(self.labels.index(label))
+            self.has_labels = True
+        else:
+            line = row
+
+        tokens = line.split()
+        self.vocabulary.add(tokens)
+
+        if len(tokens) > self.width:
+            self.truncated_tokens += len(tokens) - self.width
+            self.metrics.add('npy.truncated_tokens', len(tokens) - self.width)
+            tokens = tokens[:self.width]
+        self.fingerprints_buffer.extend([token_fingerprint(token) for token in tokens])
+        if len(tokens) < self.width:
+            self.fingerprints_buffer.extend([0] * (self.width - len(tokens)))
+
+        self.rows_written += 1
+        if len(self.fingerprints_buffer) >= self.buffer_rows * self.width:
+            self.flush()
+        return
+
+    def writerows(self, rows):
+        for row in rows:
+            self.write(row)
+        return
+
+    def flush(self):
+        """
+        Write the buffered fingerprints and labels to the temp files.
+
+        :return:
+        """
+        with self.metrics.timer('disk.write'):
+            self.fingerprints_file.write(self.fingerprints_buffer.tobytes())
+            self.labels_file.write(self.labels_buffer.tobytes())
+        self.metrics.add('sink.rows', len(self.fingerprints_buffer) // self.width)
+        self.fingerprints_buffer = array('Q')
+        self.labels_buffer = array('i')
+        return
+
+    def close(self):
+        """
+        Build the vocabulary, turn the fingerprints into ids, fill in the real shapes and move everything into place.
+
+        :return:
+        """
+        if self.closed:
+            return
+
+        self.flush()
+        self.fingerprints_file.close()
+        if self.truncated_tokens:
+            logging.getLogger(__name__).warning(
+                '{}: {} tokens were cut off windows longer than {}. The normalized tokenizer keeps every one.'.format(
+                    self.filepath, self.truncated_tokens, self.width))
+
+        entries = self.vocabulary.finish()
+        self.vocabulary.write(self.temp_filepaths['.vocab'], entries)
+        # Padding was written as a fingerprint of 0. The reserved tokens themselves never come out of the cleaner.
+        ids_by_fingerprint = dict(
+            (token_fingerprint(token), index)
+            for index, (token, _) in enumerate(entries)
+            if index >= len(RESERVED_TOKENS)
+        )
+        ids_by_fingerprint[0] = PAD_ID
+
+        with open(self.temp_filepaths['.fingerprints'], 'rb') as fingerprints_file:
+            with open(self.temp_filepaths['.npy'], 'wb') as ids_file:
+                ids_file.write(npy_header((self.rows_written, self.width)))
+                with self.metrics.timer('npy.encode'):
+                    encode_fingerprints(fingerprints_file, ids_file, ids_by_fingerprint, self.buffer_rows * self.width)
+                    ids_file.flush()
+                with self.metrics.timer('disk.fsync'):
+                    os.fsync(ids_file.fileno())
+        os.remove(self.temp_filepaths['.fingerprints'])
+
+        self.labels_file.seek(0)
+        self.labels_file.write(npy_header((self.rows_written,)))
+        self.labels_file.flush()
+        os.fsync(self.labels_file.fileno())
+        self.labels_file.close()
+
+        os.replace(self.temp_filepaths['.npy'], self.filepath)
+        os.replace(self.temp_filepaths['.vocab'], '{}.vocab'.format(self.base_filepath))
+        if self.has_labels:
+            os.replace(self.temp_filepaths['.labels.npy'], '{}.labels.npy'.format(self.base_filepath))
+        else:
+            # Don't leave labels from an earlier version of the dataset lying around next to this one.
+            os.remove(self.temp_filepaths['.labels.npy'])
+            if os.path.isfile('{}.labels.npy'.format(self.base_filepath)):
+                os.remove('{}.labels.npy'.format(self.base_filepath))
+
+        self.vocabulary.close()
+        self.closed = True
+        return
+
+    def abort(self):
+        """
+        Throw away the temp files, leaving the targets as they were.
+
+        :return:
+        """
+        if self.closed:
+            return
+
+        self.fingerprints_file.close()
+        self.labels_file.close()
+        for temp_filepath in self.temp_filepaths.values():
+            if os.path.isfile(temp_filepath):
+                os.remove(temp_filepath)
+        self.vocabulary.close()
+        self.closed = True
+        return
+
+
+def encode_fingerprints(fingerprints_file, ids_file, ids_by_fingerprint, chunk_size):
+    """
+    Map a file of 64-bit token fingerprints to int32 ids, a chunk at a time. Fingerprints that aren't in
+    ids_by_fingerprint become UNKNOWN_ID. Uses NumPy to do it a whole chunk at once if it's installed.
+
+    :param fingerprints_file: File to read fingerprints from.
+    :param ids_file: File to write ids to.
+    :param ids_by_fingerprint: Dict of fingerprint to id.
+    :param chunk_size: Number of fingerprints to read at a time.
+    :return:
+    """
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+
+    if numpy is not None:
+        keys = numpy.array(sorted(ids_by_fingerprint), dtype=numpy.uint64)
+        values = numpy.array([ids_by_fingerprint[key] for key in keys.tolist()], dtype=numpy.int32)
+
+    while True:
+        chunk = fingerprints_file.read(chunk_size * 8)
+        if not chunk:
+            return
+
+        if numpy is not None:
+            fingerprints = numpy.frombuffer(chunk, dtype=numpy.uint64)
+            positions = numpy.minimum(numpy.searchsorted(keys, fingerprints), len(keys) - 1)
+            ids = numpy.where(keys[positions] == fingerprints, values[positions], UNKNOWN_ID).astype(numpy.int32)
+            ids_file.write(ids.tobytes())
+        else:
+            fingerprints = array('Q')
+            fingerprints.frombytes(chunk)
+            ids_file.write(array('i', [ids_by_fingerprint.get(value, UNKNOWN_ID) for value in fingerprints]).tobytes())
+
+
+def load_windows(filepath):
+    """
+    Memory-map a dataset written by NpySink, without copying or parsing it. Needs NumPy.
+
+    :param filepath: The .npy file.
+    :return: Tuple of (ids, labels, vocabulary): an int32 array of shape [N, max_sentence_length], an int32 array of
+    label indexes or None if the dataset is unlabelled, and the list of words indexed by id.
+    """
+    import numpy
+
+    base_filepath = filepath[:-len('.npy')] if filepath.endswith('.npy') else filepath
+    ids = numpy.load(filepath, mmap_mode='r')
+
+    labels = None
+    if os.path.isfile('{}.labels.npy'.format(base_filepath)):
+        labels = numpy.load('{}.labels.npy'.format(base_filepath), mmap_mode='r')
+
+    return ids, labels, VocabularyBuilder.read('{}.vocab'.format(base_filepath))
@@ -0,0 +1,372 @@
+#!/usr/bin/env python
+# Buffered, atomic writers for the .txc and .csv files produced by the cleaner.
+
+import csv
+import io
+import os
+import shutil
+import tempfile
+
+from datasettoolkit.compression import compression_of, open_compressor, strip_compression
+from datasettoolkit.metrics import Metrics
+
+
+def temp_filepath_for(filepath):
+    """
+    Create an empty temp file in the same directory as filepath, so it can later be renamed over it atomically. It gets
+    the same permissions as filepath if that exists, or the ones open() would give a new file if not.
+
+    :param filepath: The file the temp file will eventually replace.
+    :return: The path to the temp file.
+    """
+    directory, basename = os.path.split(os.path.abspath(filepath))
+    handle, temp_filepath = tempfile.mkstemp(prefix='.{}.'.format(basename), suffix='.tmp', dir=directory)
+    os.close(handle)
+
+    if os.path.isfile(filepath):
+        shutil.copymode(filepath, temp_filepath)
+    else:
+        # mkstemp() creates the file as 0600.
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(temp_filepath, 0o666 & ~umask)
+    return temp_filepath
+
+
+def marker_filepath_for(filepath):
+    """
+    :param filepath: A file being appended to.
+    :return: The path of the marker recording where the file's committed contents end while it's appended to.
+    """
+    return '{}.appending'.format(filepath)
+
+
+def write_marker(filepath, size):
+    """
+    Record, durably, where the committed contents of a file being appended to end. The marker is replaced atomically,
+    so it always holds either the old size or the new one.
+
+    :param filepath: The file being appended to.
+    :param size: Its committed size in bytes, or None if it didn't exist before the append.
+    :return:
+    """
+    marker_filepath = marker_filepath_for(filepath)
+    temp_filepath = '{}.tmp'.format(marker_filepath)
+    with open(temp_filepath, 'w') as marker_file:
+        marker_file.write('new' if size is None else str(size))
+        marker_file.flush()
+        os.fsync(marker_file.fileno())
+    os.replace(temp_filepath, marker_filepath)
+    sync_directory(marker_filepath)
+    return
+
+
+def sync_directory(filepath):
+    """
+    fsync the directory holding filepath, so a file created, renamed or removed in it survives a power loss.
+
+    :param filepath: A file in the directory.
+    :return:
+    """
+    handle = os.open(os.path.dirname(os.path.abspath(filepath)), os.O_RDONLY)
+    try:
+        os.fsync(handle)
+    finally:
+        os.close(handle)
+    return
+
+
+def recover_append(filepath):
+    """
+    Undo an append that never finished because the process was killed, by cutting the file back to the size in its
+    marker (or removing it, if the append created it) and removing the marker.
+
+    :param filepath: A file that may have been left part way through an append.
+    :return: True if there was an append to undo.
+    """
+    marker_filepath = marker_filepath_for(filepath)
+    if not os.path.isfile(marker_filepath):
+        return False
+
+    with open(marker_filepath, 'r') as marker_file:
+        size = marker_file.read()
+    if os.path.isfile(filepath):
+        if size == 'new':
+            os.remove(filepath)
+        else:
+            os.truncate(filepath, int(size))
+    os.remove(marker_filepath)
+    sync_directory(filepath)
+    return True
+
+
+class OutputSink():
+    """
+    Keeps one output file open for a whole run and writes to it through an in-memory buffer, rather than reopening the
+    file for every line.
+
+    Without append, everything is written to a temp file next to the target, which only replaces the target when the
+    sink is closed. A run that crashes part way leaves the previous version of the target untouched, never a
+    half-written dataset.
+
+    Appending writes straight to the end of the target, creating it if need be, so opening a sink costs the same however
+    big the target is. Before anything is written, the target's size is recorded in a marker file next to it
+    (<target>.appending) and synced. An abort() truncates the target back to that size, or removes it if the sink
+    created it, and so does the next sink opened on the target if the process was killed outright, so a crash never
+    leaves half-written rows behind. Closing the sink removes the marker. sync() commits what's been written so far
+    by moving the marker up to the current end of the target, for callers that checkpoint as they go, except for
+    compressed output, whose gzip member or zstd frame is only complete once the sink is closed.
+
+    Use it as a context manager: leaving the block normally commits the file, leaving it with an exception discards
+    everything written since the sink was opened.
+
+    With compression the output goes through gzip or zstd on its way to the file. Appending starts a new gzip member
+    or zstd frame after the existing compressed data, which both formats read back as one stream, so nothing has to be
+    decompressed.
+
+    With index, a line index (see line_index.write_index()) is written next to the target once it's in place. When
+    appending to a target whose index is up to date, only the lines added are scanned.
+    """
+
+    def __init__(self, filepath, buffer_bytes=1048576, buffer_rows=10000, append=True, metrics=None, compression=None,
+                 compression_level=None, index=False):
+        """
+        :param filepath: The file to (eventually) write to.
+        :param buffer_bytes: Flush the buffer to the file once it holds at least this many bytes.
+        :param buffer_rows: Flush the buffer to the file once it holds at least this many rows.
+        :param append: If True, keep the target's existing contents and add to the end of them.
+        :param metrics: Optional Metrics to record rows written and time spent writing in.
+        :param compression: Optional "gzip" or "zstd" to compress the output with.
+        :param compression_level: Optional compression level, see compression.open_compressor().
+        :param index: If True, also write a line index of the target, for random access with line_index.IndexedDataset.
+        Compressed output can't be indexed.
+        """
+        if index and compression is not None:
+            raise ValueError('Compressed output can\'t be indexed: {}'.format(filepath))
+        self.filepath = filepath
+        self.buffer_bytes = buffer_bytes
+        self.buffer_rows = buffer_rows
+        self.rows_written = 0
+        self.metrics = metrics or Metrics()
+
+        # A marker left by a sink that never finished appending means the target ends in rows nobody committed.
+        recover_append(filepath)
+
+        self.index = index
+        self.reuse_index = False
+        if append:
+            if index and os.path.isfile(filepath):
+                # Imported here as line_index itself writes through temp_filepath_for().
+                from datasettoolkit.line_index import index_is_current
+                self.reuse_index = index_is_current(filepath)
+            # Write to the target itself, remembering where its old contents end, if it has any.
+            self.temp_filepath = None
+            self.original_size = os.path.getsize(filepath) if os.path.isfile(filepath) else None
+            write_marker(filepath, self.original_size)
+            write_filepath = filepath
+        else:
+            self.temp_filepath = temp_filepath_for(filepath)
+            self.original_size = None
+            write_filepath = self.temp_filepath
+
+        if compression is None:
+            self.raw_file = None
+            self.output_file = io.open(write_filepath, 'a', encoding='utf-8', newline='')
+        else:
+            self.raw_file = io.open(write_filepath, 'ab')
+            self.output_file = io.TextIOWrapper(
+                open_compressor(self.raw_file, compression, compression_level), encoding='utf-8', newline='')
+        self.compression = compression
+        self.buffer = io.StringIO()
+        self.buffered_rows = 0
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+    def format_row(self, row):
+        """
+        Write a single row to self.buffer. Implemented by each output format.
+
+        :param row: The row to write.
+        :return:
+        """
+        raise NotImplementedError
+
+    def write(self, row):
+        """
+        Add a row to the buffer, flushing it to the file if it's full.
+
+        :param row: The row to write, in whatever shape the output format expects.
+        :return:
+        """
+        self.format_row(row)
+        self.buffered_rows += 1
+        self.rows_written += 1
+
+        if self.buffered_rows >= self.buffer_rows or self.buffer.tell() >= self.buffer_bytes:
+            self.flush()
+        return
+
+    def writerows(self, rows):
+        """
+        Add every row in the given iterable to the buffer.
+
+        :param rows: Iterable of rows.
+        :return:
+        """
+        for row in rows:
+            self.write(row)
+        return
+
+    def append_file(self, filepath):
+        """
+        Copy the contents of a file that's already in this sink's format, i.e. one written by another sink, straight
+        to the end of the output.
+
+        :param filepath: The file to copy from.
+        :return:
+        """
+        self.flush()
+        with io.open(filepath, 'r', encoding='utf-8', newline='') as input_file:
+            shutil.copyfileobj(input_file, self.output_file, self.buffer_bytes)
+        return
+
+    def flush(self):
+        """
+        Write the whole buffer to the file in a single call and empty it.
+
+        :return:
+        """
+        if self.buffered_rows:
+            with self.metrics.timer('disk.write'):
+                self.output_file.write(self.buffer.getvalue())
+                self.output_file.flush()
+            self.metrics.add('sink.rows', self.buffered_rows)
+            self.buffer.seek(0)
+            self.buffer.truncate()
+            self.buffered_rows = 0
+        return
+
+    def sync(self):
+        """
+        Flush the buffer and make sure everything written so far is on disk. For an uncompressed appending sink this
+        also commits it: it stays in the target even if the process dies, or the sink is aborted, before it's closed.
+
+        :return:
+        """
+        self.flush()
+        # Also pushes a compressor's pending output through as a complete block.
+        self.output_file.flush()
+        raw_file = self.output_file if self.raw_file is None else self.raw_file
+        raw_file.flush()
+        with self.metrics.timer('disk.fsync'):
+            os.fsync(raw_file.fileno())
+        if self.temp_filepath is None and self.compression is None:
+            self.original_size = os.fstat(raw_file.fileno()).st_size
+            write_marker(self.filepath, self.original_size)
+        return
+
+    def close(self):
+        """
+        Flush anything left in the buffer, make sure it's on disk, and move the temp file, if there is one, over the
+        target.
+
+        :return:
+        """
+        if self.closed:
+            return
+
+        self.flush()
+        raw_file = self.output_file
+        if self.raw_file is not None:
+            # Closing a compressor finishes its member or frame, but leaves the file it writes to open.
+            self.output_file.close()
+            raw_file = self.raw_file
+            raw_file.flush()
+        with self.metrics.timer('disk.fsync'):
+            os.fsync(raw_file.fileno())
+        raw_file.close()
+        if self.temp_filepath is not None:
+            os.replace(self.temp_filepath, self.filepath)
+        else:
+            os.remove(marker_filepath_for(self.filepath))
+        if self.index:
+            from datasettoolkit.line_index import write_index
+            write_index(self.filepath, reuse=self.reuse_index, metrics=self.metrics)
+        self.closed = True
+        return
+
+    def abort(self):
+        """
+        Throw away the temp file, or cut what was appended off the end of the target, leaving the target as it was
+        before the sink was opened (or last synced, when appending).
+
+        :return:
+        """
+        if self.closed:
+            return
+
+        self.output_file.close()
+        if self.raw_file is not None:
+            self.raw_file.close()
+        if self.temp_filepath is not None:
+            os.remove(self.temp_filepath)
+        else:
+            # The marker holds original_size, so this is exactly the recovery a crash would get.
+            recover_append(self.filepath)
+        self.closed = True
+        return
+
+
+class TextSink(OutputSink):
+    """
+    Writes .txc files: each row is a cleaned line, written with a trailing newline.
+    """
+
+    def format_row(self, row):
+        self.buffer.write(row)
+        self.buffer.write(u'\n')
+
+
+class CsvSink(OutputSink):
+    """
+    Writes excel-dialect .csv files: each row is a list of strings, i.e. ['A positive sentence.', '1.0'].
+    """
+
+    def __init__(self, filepath, **kwargs):
+        OutputSink.__init__(self, filepath, **kwargs)
+        self.csv_writer = csv.writer(self.buffer, dialect='excel')
+
+    def format_row(self, row):
+        self.csv_writer.writerow(row)
+
+
+SINKS = {
+    '.txc': TextSink,
+    '.csv': CsvSink
+}
+
+
+def open_sink(filepath, **kwargs):
+    """
+    Open the right kind of sink for the file's extension. A further .gz or .zst, i.e. "dataset.csv.gz", compresses the
+    output.
+
+    :param filepath: Path of the file to write, ending in one of the extensions in SINKS.
+    :param kwargs: Passed through to the sink, i.e. buffer_bytes, buffer_rows, append, metrics, compression_level,
+    index.
+    :return: An OutputSink.
+    """
+    extension = os.path.splitext(strip_compression(filepath))[1]
+    if extension not in SINKS:
+        raise ValueError('No output sink for "{}" files, expected one of: {}'.format(extension, ', '.join(SINKS)))
+
+    return SINKS[extension](filepath, compression=compression_of(filepath), **kwargs)
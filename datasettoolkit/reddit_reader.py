@@ -3,27 +3,49 @@
 # Reads reddit self-text posts and writes them to a file!
 
 import os
-import requests
 from pprint import pprint
 
+from datasettoolkit.compression import EXTENSIONS, require
+from datasettoolkit.fetcher import Fetcher
+from datasettoolkit.multi_reddit_reader import response_cache
+from datasettoolkit.output_sink import TextSink
+
 
 class RedditReader():
-    def __init__(self):
+    def __init__(self, active=False, confidence=0.95, cache=None, compression=None):
         """
         A class for handling both the retrieval of text data from the reddit website, and for passing that to files
         per interactive user instruction. Use querystrings for limiting response, i.e. /r/subreddit/new/.json?limit=1
 
+        :param active: If True, a model learns from each answer, the posts on a page are asked about in order of how
+        unsure it is of them, and posts it's confident about are sent to their class without asking. See ActiveLearner.
+        :param confidence: With active, the probability above which posts are classed without asking.
+        :param cache: Optional ResponseCache to serve listing pages from.
+        :param compression: Optional "gzip" or "zstd" to compress the class files with, as .txt.gz or .txt.zst. Each
+        post is appended as a gzip member or zstd frame of its own, so every answer is on disk as soon as it's given,
+        at the cost of compressing each post on its own.
         """
+        if compression is not None:
+            require(compression)
+        self.compression = compression
 
         self.subreddit_url = r'http://www.reddit.com/r/learnmachinelearning/new/.json'
         self.headers = {
             'User-Agent': r'DSTK-RedditReader/0.1'
         }
+        self.fetcher = Fetcher(headers=self.headers, workers=1, cache=cache)
         self.classes = {
-            '1': 'datasettoolkit/datasets/Exp02-reddit-learnmachinelearning-faqs.txt',
-            '2': 'datasettoolkit/datasets/Exp02-reddit-learnmachinelearning-nonfaqs.txt'
+            '1': 'datasettoolkit/datasets/Exp02-reddit-learnmachinelearning-faqs.txt{}'.format(
+                EXTENSIONS.get(compression, '')),
+            '2': 'datasettoolkit/datasets/Exp02-reddit-learnmachinelearning-nonfaqs.txt{}'.format(
+                EXTENSIONS.get(compression, ''))
         }
         self.checkpoint_file = 'datasettoolkit/datasets/Exp02-checkpoint.txt'
+        self.class_keys = sorted(self.classes)
+        self.learner = None
+        if active:
+            from datasettoolkit.active_learner import ActiveLearner
+            self.learner = ActiveLearner(len(self.class_keys), confidence=confidence)
 
         if os.path.isfile(self.checkpoint_file):
             with open(self.checkpoint_file, 'r') as checkpoint:
@@ -47,73 +69,115 @@ class RedditReader():
 
             while post_counter < 1000:
                 if not self.current_after:
-                    reddit_response = requests.get(
-                        self.subreddit_url,
-                        headers=self.headers
-                    ).json()['data']
+                    reddit_response = self.fetcher.get_listing(self.subreddit_url)
                 else:
-                    reddit_response = requests.get(
+                    reddit_response = self.fetcher.get_listing(
                         '{}?after={}'.format(
                             self.subreddit_url,
                             self.current_after
-                        ),
-                        headers=self.headers
-                    ).json()['data']
+                        )
+                    )
                 reddit_post_list = reddit_response['children']
 
                 post_count += len(reddit_post_list)
                 self.current_after = reddit_response['after']
 
                 # Also save the self.current_after value to a checkpoint file to pick up from this point later if you
-                # leave and return to classify more posts.
-                with open(self.checkpoint_file, 'wb+') as checkpoint:
-                    checkpoint.write(self.current_after)
+                # leave and return to classify more posts. It's None on the last page, which starts the next run over.
+                with open(self.checkpoint_file, 'w', encoding='utf-8') as checkpoint:
+                    checkpoint.write(self.current_after or '')
 
+                candidates = []
                 for reddit_post in reddit_post_list:
                     post_counter += 1
                     if reddit_post['data']['is_self']:
                         # This is a self-post. Save the text, ommitting newlines.
-                        candidate_text = '{} {}'.format(
-                            reddit_post['data']['title'].encode('utf-8'),
-                            reddit_post['data']['selftext'].encode('utf-8'))
+                        candidate_text = '{} {}'.format(reddit_post['data']['title'], reddit_post['data']['selftext'])
                         candidate_text = candidate_text.replace('\n', ' ').replace('\r', '')
+                        candidates.append(candidate_text)
 
-                        # Can prompt the user now about which class this should be sent to.
-                        self.prompt_and_write(candidate_text)
-                    print('[{}/{} posts evaluated.]'.format(post_counter, post_count))
+                # Can prompt the user now about which class each of these should be sent to.
+                self.classify_page(candidates)
+                print('[{}/{} posts evaluated.]'.format(post_counter, post_count))
+                if not self.current_after:
+                    break
             return
 
         except Exception as e:
             self.exception_handling(e)
 
+    def classify_page(self, candidates):
+        """
+        Ask the user about each self-post on a page. With an active learner, the post it's least sure of is asked about
+        first, and posts it's confident about are written to their class straight away.
+
+        :param candidates: List of post texts.
+        :return:
+        """
+        if self.learner is None:
+            for candidate_text in candidates:
+                self.prompt_and_write(candidate_text)
+            return
+
+        pending = [(candidate_text, self.learner.features(candidate_text)) for candidate_text in candidates]
+        while pending:
+            confident, order, probabilities = self.learner.rank([features for _, features in pending])
+            for index, label in sorted(confident.items()):
+                print('Classed as {} without asking: {}'.format(
+                    self.classes[self.class_keys[label]], pending[index][0]))
+                self.write_to_class(self.class_keys[label], pending[index][0])
+
+            if order:
+                candidate_text, features = pending[order[0]]
+                user_class_choice = self.prompt_and_write(candidate_text)
+                if user_class_choice in self.class_keys:
+                    self.learner.update(features, self.class_keys.index(user_class_choice))
+
+            answered = set(confident)
+            answered.update(order[:1])
+            pending = [item for index, item in enumerate(pending) if index not in answered]
+        return
+
     def prompt_and_write(self, candidate_text):
         """
         When items are passed in, you can ask the viewer to classify the text for writing to one file, or another, based
         on what the text is about. i.e. a selftext post from reddit is shown to the user, and they're asked if it should
         be categorized as type A or type B. Based on the response, the text is appended to a file for type A or B text.
-        :return:
+        :return: The class the user chose, or '0' if they skipped it.
         """
         try:
             # Present the class options to the user.
             print('\n====\n{}\n====\n'.format(candidate_text))
             prompt_string = 'This text can be classified as one of the following, or 0 to skip: \n'
-            for key, value in self.classes.iteritems():
-                prompt_string = '{}{} for {}\n'.format(prompt_string, key, value)
+            for key in self.class_keys:
+                prompt_string = '{}{} for {}\n'.format(prompt_string, key, self.classes[key])
 
             print(prompt_string)
             user_class_choice = str(input("Which class does this text belong to? \n>"))
 
             if user_class_choice != '0':
-                outfile = open(self.classes[user_class_choice], 'ab+')
-                # Don't forget that final newline character - that's how the cleaner knows to separate training examples!
-                outfile.write('{}\n'.format(candidate_text))
+                self.write_to_class(user_class_choice, candidate_text)
                 print('\nWrote to {}\n'.format(self.classes[user_class_choice]))
 
-            return
+            return user_class_choice
 
         except Exception as e:
             self.exception_handling(e)
 
+    def write_to_class(self, class_key, candidate_text):
+        """
+        Append a post's text to a class's file.
+
+        :param class_key: The class, a key of self.classes.
+        :param candidate_text: The post's text.
+        :return:
+        """
+        # Appending through a sink means a crash part way through a post never leaves half of it in the file.
+        with TextSink(self.classes[class_key], append=True, compression=self.compression) as sink:
+            # TextSink ends each row with a newline - that's how the cleaner knows to separate training examples!
+            sink.write(candidate_text)
+        return
+
     @staticmethod
     def exception_handling(e):
         print('Exception: {}'.format(e))
@@ -124,7 +188,61 @@ def main():
     Generally this is what invokes the actual reading from reddit.
     :return:
     """
-    reddit_client = RedditReader()
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Read reddit self-posts and sort them into class files by hand.')
+    parser.add_argument(
+        '--active',
+        action='store_true',
+        default=False,
+        help='Ask about the posts a model trained on your answers is least sure of first, and class the ones it is '
+             'sure of automatically.'
+    )
+    parser.add_argument(
+        '--confidence',
+        type=float,
+        action='store',
+        default=0.95,
+        help='With --active, the probability above which posts are classed automatically. (default: 0.95)'
+    )
+    parser.add_argument(
+        '--cache',
+        nargs='?',
+        const='datasettoolkit/cache/',
+        default=None,
+        help='Keep fetched pages in an on-disk cache, in the given directory. (default: no cache, or '
+             'datasettoolkit/cache/ if no directory is given)'
+    )
+    parser.add_argument(
+        '--cache-size',
+        type=int,
+        action='store',
+        default=1024,
+        help='The most MB of pages to keep in the cache. (default: 1024)'
+    )
+    parser.add_argument(
+        '--cache-max-age',
+        type=float,
+        action='store',
+        default=3600,
+        help='Seconds to use a cached page for before checking with reddit that it has not changed. (default: 3600)'
+    )
+    parser.add_argument(
+        '--offline',
+        action='store_true',
+        help='Only replay pages from the cache, never fetch from reddit.'
+    )
+    parser.add_argument(
+        '--compress',
+        choices=['gzip', 'zstd'],
+        default=None,
+        help='Compress the class files, as .txt.gz or .txt.zst. (default: off)'
+    )
+
+    flags = parser.parse_args()
+
+    reddit_client = RedditReader(active=flags.active, confidence=flags.confidence, cache=response_cache(flags),
+                                 compression=flags.compress)
     reddit_client.read()
     return
 
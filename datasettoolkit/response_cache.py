@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# An on-disk cache of HTTP responses for the reddit readers, so rebuilding a dataset doesn't mean fetching it again.
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+# Response headers worth keeping with a cached body.
+KEPT_HEADERS = ['Content-Type', 'ETag', 'Last-Modified', 'Date']
+
+
+class CacheMiss(Exception):
+    """
+    Raised in offline mode for a url that isn't in the cache.
+    """
+    pass
+
+
+class ResponseCache:
+    def __init__(self, directory, max_bytes=1 << 30, max_age=0, offline=False):
+        """
+        A size-bounded cache of GET responses, keyed by url (which includes the "after" cursor for listing pages).
+
+        Bodies are stored content-addressed, under objects/ by the SHA-256 of the body, so identical pages fetched
+        from different urls are only kept once. Each url has a small JSON entry under entries/ pointing at its body,
+        along with the ETag and Last-Modified the server sent, which are used to revalidate it: Fetcher sends them back
+        as If-None-Match and If-Modified-Since, and a 304 means the cached body can be used without downloading it
+        again. Entries younger than max_age seconds are used without asking the server at all.
+
+        Once the bodies add up to more than max_bytes, the least recently used entries are evicted. Recency is kept in
+        each entry file's mtime, so it carries across runs.
+
+        In offline mode the network is never used: cached responses are replayed whatever their age and anything else
+        raises CacheMiss. A cache filled by one run then serves as a fixed, repeatable copy of reddit for benchmarking
+        or rebuilding datasets.
+
+        :param directory: Where to keep the cache. Created if it doesn't exist.
+        :param max_bytes: The most bytes of response bodies to keep.
+        :param max_age: Seconds for which a cached response is used without revalidating it.
+        :param offline: If True, only ever answer from the cache.
+        """
+        self.directory = directory
+        self.entries_directory = os.path.join(directory, 'entries')
+        self.objects_directory = os.path.join(directory, 'objects')
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.offline = offline
+        self.lock = threading.Lock()
+
+        for path in (self.entries_directory, self.objects_directory):
+            if not os.path.isdir(path):
+                os.makedirs(path)
+
+        # Entry key to (object, size), least recently used first, and how many entries share each object.
+        self.lru = OrderedDict()
+        self.references = {}
+        self.total_bytes = 0
+        self.load()
+        return
+
+    def load(self):
+        """
+        Rebuild the in-memory LRU order and object reference counts from the entry files.
+
+        :return:
+        """
+        entries = []
+        for filename in os.listdir(self.entries_directory):
+            if not filename.endswith('.json'):
+                continue
+            path = os.path.join(self.entries_directory, filename)
+            try:
+                with open(path, 'r') as entry_file:
+                    entry = json.load(entry_file)
+                entries.append((os.path.getmtime(path), filename[:-len('.json')], entry['object'], entry['size']))
+            except (OSError, ValueError, KeyError):
+                # Half-written or unreadable, treat it as missing.
+                os.remove(path)
+
+        for _, key, object_name, size in sorted(entries):
+            self.add_reference(key, object_name, size)
+        return
+
+    @staticmethod
+    def key(url):
+        """
+        :param url: The url.
+        :return: The name its entry is stored under.
+        """
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.entries_directory, '{}.json'.format(key))
+
+    def object_path(self, object_name):
+        return os.path.join(self.objects_directory, object_name[:2], object_name)
+
+    def lookup(self, url):
+        """
+        Find the cached entry for a url, and mark it as recently used.
+
+        :param url: The url.
+        :return: The entry as a dict (url, object, size, etag, last_modified, headers, stored), or None.
+        """
+        key = self.key(url)
+        with self.lock:
+            if key not in self.lru:
+                return None
+            try:
+                with open(self.entry_path(key), 'r') as entry_file:
+                    entry = json.load(entry_file)
+            except (OSError, ValueError):
+                return None
+            self.lru.move_to_end(key)
+            os.utime(self.entry_path(key), None)
+        return entry
+
+    def is_fresh(self, entry):
+        """
+        :param entry: An entry from lookup().
+        :return: True if the entry can be used without revalidating it.
+        """
+        return self.offline or time.time() - entry['stored'] < self.max_age
+
+    @staticmethod
+    def conditional_headers(entry):
+        """
+        :param entry: An entry from lookup().
+        :return: Dict of the If-None-Match and If-Modified-Since headers to revalidate it with.
+        """
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def response(self, entry):
+        """
+        Rebuild a requests.Response from a cached entry.
+
+        :param entry: An entry from lookup().
+        :return: The requests.Response, or None if its body has gone missing.
+        """
+        try:
+            with open(self.object_path(entry['object']), 'rb') as object_file:
+                body = object_file.read()
+        except (IOError, OSError):
+            return None
+
+        response = requests.Response()
+        response.status_code = 200
+        response.url = entry['url']
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response._content = body
+        response.from_cache = True
+        return response
+
+    def refresh(self, url, entry):
+        """
+        Record that the server said a cached response is still current (a 304), restarting its max_age.
+
+        :param url: The url.
+        :param entry: The entry from lookup().
+        :return:
+        """
+        entry = dict(entry, stored=time.time())
+        key = self.key(url)
+        with self.lock:
+            if key in self.lru:
+                self.write_json(self.entry_path(key), entry)
+        return
+
+    def store(self, url, response):
+        """
+        Cache a 200 response, evicting older entries if the cache is full.
+
+        :param url: The url that was requested.
+        :param response: The requests.Response.
+        :return:
+        """
+        body = response.content
+        object_name = hashlib.sha256(body).hexdigest()
+        headers = dict((name, response.headers[name]) for name in KEPT_HEADERS if name in response.headers)
+        entry = {
+            'url': url,
+            'object': object_name,
+            'size': len(body),
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'headers': headers,
+            'stored': time.time()
+        }
+
+        key = self.key(url)
+        with self.lock:
+            if key in self.lru and self.lru[key][0] == object_name:
+                # Same body as before, only the entry changes.
+                self.write_json(self.entry_path(key), entry)
+                self.lru.move_to_end(key)
+                return
+
+            self.remove_reference(key)
+            object_path = self.object_path(object_name)
+            if not os.path.isfile(object_path):
+                if not os.path.isdir(os.path.dirname(object_path)):
+                    os.makedirs(os.path.dirname(object_path))
+                self.write_bytes(object_path, body)
+
+            self.write_json(self.entry_path(key), entry)
+            self.add_reference(key, object_name, len(body))
+            self.evict()
+        return
+
+    def add_reference(self, key, object_name, size):
+        self.lru[key] = (object_name, size)
+        self.references[object_name] = self.references.get(object_name, 0) + 1
+        if self.references[object_name] == 1:
+            self.total_bytes += size
+        return
+
+    def remove_reference(self, key):
+        """
+        Forget an entry, and delete its body if no other entry uses it. The caller removes the entry file.
+
+        :param key: The entry's key.
+        :return:
+        """
+        if key not in self.lru:
+            return
+        object_name, size = self.lru.pop(key)
+        self.references[object_name] -= 1
+        if not self.references[object_name]:
+            del self.references[object_name]
+            self.total_bytes -= size
+            if os.path.isfile(self.object_path(object_name)):
+                os.remove(self.object_path(object_name))
+        return
+
+    def evict(self):
+        """
+        Drop least recently used entries until the bodies fit in max_bytes. Always keeps the newest entry.
+
+        :return:
+        """
+        while self.total_bytes > self.max_bytes and len(self.lru) > 1:
+            key = next(iter(self.lru))
+            self.remove_reference(key)
+            if os.path.isfile(self.entry_path(key)):
+                os.remove(self.entry_path(key))
+        return
+
+    @staticmethod
+    def write_bytes(path, data):
+        """
+        Write a file via a temp file and a rename, so readers never see half of it.
+        """
+        handle, temp_path = tempfile.mkstemp(prefix='.', suffix='.tmp', dir=os.path.dirname(path))
+        with os.fdopen(handle, 'wb') as temp_file:
+            temp_file.write(data)
+        os.replace(temp_path, path)
+        return
+
+    def write_json(self, path, contents):
+        self.write_bytes(path, json.dumps(contents).encode('utf-8'))
+        return
@@ -2,12 +2,42 @@
 import csv
 import json
 import logging
+import multiprocessing
 import os
-import re
+import queue
 import string
+import threading
+import time
+from contextlib import contextmanager
+from glob import glob
+from itertools import chain
 from math import ceil
 from pprint import pprint
 
+from datasettoolkit import compression, normalizer
+from datasettoolkit.metrics import Metrics, open_metrics
+from datasettoolkit.npy_sink import NpySink
+from datasettoolkit.output_sink import open_sink, temp_filepath_for
+from datasettoolkit.vocabulary import VocabularyBuilder
+
+
+# The raw datasets cleanall() looks for. Compressed ones are decompressed as they're read.
+INPUT_PATTERNS = ('*.txt', '*.txt.gz', '*.txt.zst')
+
+
+def worker_context():
+    """
+    cleanall()'s worker processes aren't forked from the process calling it, since that may have other threads running,
+    i.e. the job runner's steps. A child forked while another thread holds a lock (logging's, a requests session's)
+    starts with that lock held forever and can deadlock. A forkserver, or spawning where there isn't one, starts them
+    from a clean single-threaded process instead.
+
+    :return: The multiprocessing context to make the pool with.
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
 
 class TextCleaningAndLabellingClient():
     """
@@ -22,6 +52,34 @@ class TextCleaningAndLabellingClient():
 
         max_sentence_size: The max number of words to interpret for a sentence. Example: 59
         output_labels: List of Strings, each string being an output label. Example: ['Spam','Not Spam']
+        read_chunk_size: Optional, number of bytes to read from the raw file at a time. Example: 1048576
+        output_buffer_bytes: Optional, number of bytes to buffer before writing to an output file. Example: 1048576
+        output_buffer_rows: Optional, number of rows to buffer before writing to an output file. Example: 10000
+        split_bytes: Optional, cleanall() cleans files bigger than this in parallel pieces. Example: 67108864
+        tokenizer: Optional, "raw" (the default) counts words by splitting the raw text on spaces, punctuation and all,
+        so a window's cleaned line can hold fewer than max_sentence_length words. "normalized" cleans the text first and
+        splits on the cleaned words, so every window holds exactly max_sentence_length of them. Example: "normalized"
+        output_format: Optional, "text" (the default) writes .txc and .csv files. "npy" writes a matrix of token ids
+        that can be memory-mapped, along with its vocabulary and labels, see NpySink. Example: "npy"
+        build_vocab: Optional, also write a .vocab file of token counts next to .txc and .csv output. The npy output
+        format always does. Only the npy output format encodes windows to token ids; text output is never encoded, its
+        .vocab is just the counts. Example: true
+        vocab_min_count: Optional, leave tokens seen fewer times than this out of the vocabulary. Example: 5
+        vocab_max_size: Optional, keep only this many of the most frequent tokens in the vocabulary. Example: 50000
+        vocab_memory_entries: Optional, distinct tokens to count in memory before spilling to disk. Example: 1000000
+        near_duplicates: Optional, "drop" to leave out windows that are near copies of an earlier window in the same
+        output, i.e. reposts and templated titles, or "flag" to keep them and list them in a .near_duplicates.csv next
+        to the output. See NearDuplicateFilter. Needs NumPy. Example: "drop"
+        near_duplicate_threshold: Optional, the estimated Jaccard similarity of two windows' word shingles at or above
+        which the later one is a near duplicate. Example: 0.8
+        near_duplicate_memory: Optional, the number of latest kept windows to compare each window with. Each costs
+        about 1.5KB. Example: 100000
+        output_compression: Optional, "gzip" or "zstd" to compress .txc and .csv output, which then ends in .gz or .zst.
+        .txt input ending in .gz or .zst is always decompressed as it's read. zstd needs the zstandard package.
+        Example: "zstd"
+        compression_level: Optional, the output compression level. Example: 3
+        build_index: Optional, also write a line index (.idx) next to uncompressed .txc and .csv output, so any line of
+        it can be read, or all of them shuffled, without loading it. See IndexedDataset. Example: true
 
         """
 
@@ -39,21 +97,153 @@ class TextCleaningAndLabellingClient():
             self.output_labels = []
             for output_label in config_data['output_labels']:
                 self.output_labels.append(output_label)
+            self.read_chunk_size = config_data.get('read_chunk_size', 1048576)
+            self.output_buffer_bytes = config_data.get('output_buffer_bytes', 1048576)
+            self.output_buffer_rows = config_data.get('output_buffer_rows', 10000)
+            self.split_bytes = config_data.get('split_bytes', 67108864)
+            self.tokenizer = config_data.get('tokenizer', 'raw')
+            if self.tokenizer not in ('raw', 'normalized'):
+                raise ValueError('tokenizer must be "raw" or "normalized", not "{}".'.format(self.tokenizer))
+            self.output_format = config_data.get('output_format', 'text')
+            if self.output_format not in ('text', 'npy'):
+                raise ValueError('output_format must be "text" or "npy", not "{}".'.format(self.output_format))
+            self.build_vocab = config_data.get('build_vocab', False) or self.output_format == 'npy'
+            self.vocab_min_count = config_data.get('vocab_min_count', 1)
+            self.vocab_max_size = config_data.get('vocab_max_size', None)
+            self.vocab_memory_entries = config_data.get('vocab_memory_entries', 1000000)
+            self.near_duplicates = config_data.get('near_duplicates', None)
+            if self.near_duplicates not in (None, 'drop', 'flag'):
+                raise ValueError('near_duplicates must be "drop" or "flag", not "{}".'.format(self.near_duplicates))
+            self.near_duplicate_threshold = config_data.get('near_duplicate_threshold', 0.8)
+            self.near_duplicate_memory = config_data.get('near_duplicate_memory', 100000)
+            self.output_compression = config_data.get('output_compression', None)
+            if self.output_compression is not None:
+                compression.require(self.output_compression)
+            self.compression_level = config_data.get('compression_level', None)
+            self.build_index = config_data.get('build_index', False)
+            # Replaced by the caller to share one with a reader, or to write it out, see Metrics.
+            self.metrics = Metrics()
 
             # Verify received config params.
             self.logger.info('max_sentence_length={}'.format(self.max_sentence_length))
             self.logger.info('output_labels={}'.format(str(self.output_labels)))
+            self.logger.info('read_chunk_size={}'.format(self.read_chunk_size))
+            self.logger.info('tokenizer={}'.format(self.tokenizer))
+            self.logger.info('output_format={}'.format(self.output_format))
+            self.logger.info('near_duplicates={}'.format(self.near_duplicates))
+            self.logger.info('output_compression={}'.format(self.output_compression))
 
             return
 
         except Exception as e:
             self.logger.error(e)
 
+    def sink(self, filename, append=True, index=True):
+        """
+        Open a buffered output sink for the given .txc, .csv or .npy file in self.dataset_path. Rows written to it are
+        only committed once the sink is closed, and discarded if it's left with an exception, so use it as a context
+        manager:
+
+        with self.sink('dataset.csv') as sink:
+            sink.write(['A positive sentence.', '1.0'])
+
+        :param filename: The .txc, .csv or .npy file to write to. A .txc or .csv file ending in .gz or .zst is
+        compressed.
+        :param append: If True, add to the end of the file rather than replacing it. .npy files are always replaced.
+        :param index: If False, don't write a line index even with build_index, i.e. for a part file.
+        :return: An OutputSink or NpySink.
+        """
+        if filename.endswith('.npy'):
+            return NpySink(
+                os.path.join(self.dataset_path, filename),
+                width=self.max_sentence_length,
+                labels=self.output_labels,
+                vocabulary=self.vocabulary_builder(),
+                buffer_rows=self.output_buffer_rows,
+                metrics=self.metrics
+            )
+
+        return open_sink(
+            os.path.join(self.dataset_path, filename),
+            buffer_bytes=self.output_buffer_bytes,
+            buffer_rows=self.output_buffer_rows,
+            append=append,
+            metrics=self.metrics,
+            compression_level=self.compression_level,
+            index=index and self.build_index and compression.compression_of(filename) is None
+        )
+
+    @contextmanager
+    def near_duplicate_filter(self, output_filename):
+        """
+        Set up the near_duplicates filter for one output file, if it's configured. Use it as a context manager alongside
+        the output's sink, so that with "flag" the list of near duplicates is written along with the output:
+
+        with self.sink('dataset.csv') as sink, self.near_duplicate_filter('dataset.csv') as near_duplicates:
+            if near_duplicates is not None:
+                lines = near_duplicates.filter(lines)
+
+        :param output_filename: The file in self.dataset_path the filtered windows are written to, or None to not
+        filter.
+        :return: A NearDuplicateFilter, or None if near_duplicates isn't set.
+        """
+        if self.near_duplicates is None or output_filename is None:
+            yield None
+            return
+
+        from datasettoolkit.near_duplicates import NearDuplicateFilter
+        flag_filepath = None
+        if self.near_duplicates == 'flag':
+            flag_filepath = os.path.join(
+                self.dataset_path,
+                '{}.near_duplicates.csv'.format(os.path.splitext(compression.strip_compression(output_filename))[0])
+            )
+
+        with NearDuplicateFilter(
+                threshold=self.near_duplicate_threshold,
+                memory_windows=self.near_duplicate_memory,
+                flag_filepath=flag_filepath,
+                metrics=self.metrics
+        ) as near_duplicates:
+            yield near_duplicates
+
+        self.logger.info('{}: {} near duplicate windows {}.'.format(
+            output_filename, near_duplicates.duplicates, 'flagged' if flag_filepath else 'dropped'))
+        return
+
+    def vocabulary_builder(self):
+        """
+        :return: A VocabularyBuilder set up with the configured pruning, spilling to self.dataset_path.
+        """
+        return VocabularyBuilder(
+            min_count=self.vocab_min_count,
+            max_size=self.vocab_max_size,
+            max_entries=self.vocab_memory_entries,
+            spill_dir=self.dataset_path
+        )
+
+    def write_vocabulary(self, output_filename, vocabulary):
+        """
+        Prune the counts in a VocabularyBuilder and write them to the .vocab file that goes with a .txc or .csv file.
+
+        :param output_filename: The .txc or .csv file the vocabulary is for.
+        :param vocabulary: The VocabularyBuilder.
+        :return:
+        """
+        vocab_filepath = os.path.join(
+            self.dataset_path, '{}.vocab'.format(os.path.splitext(compression.strip_compression(output_filename))[0]))
+        temp_filepath = temp_filepath_for(vocab_filepath)
+        vocabulary.write(temp_filepath, vocabulary.finish())
+        os.replace(temp_filepath, vocab_filepath)
+        vocabulary.close()
+        return
+
     def writer_single_row(self, single_row, filename):
         """
         Given a List, write as a new row to a CSV file. Basically the same thing as .writer() but for individual rows.
-        Expected to be comparatively inefficient since this will involve multiple file accesses rather than .writer()'s
-        single access to write all elements at once. Basically your harddrive IO becomes the limiting factor here.
+        Expected to be comparatively inefficient since this will involve a file access per row rather than .writer()'s
+        single access to write all elements at once. If you're writing many rows one at a time, keep a .sink() open
+        instead.
 
         Expected format is like the following:
 
@@ -65,15 +255,12 @@ class TextCleaningAndLabellingClient():
         :param filename: CSV file to write to.
         :return:
         """
-
-        with open(os.path.join(self.dataset_path, filename), 'ab+') as output_file:
-            wr = csv.writer(output_file, dialect='excel')
-            wr.writerow(single_row)
+        self.writer([single_row], filename)
         return
 
     def writer(self, multi_rows, filename):
         """
-        Given a list of lists of strings,
+        Given a list of lists of strings, append them all to the CSV file in one go.
 
         multi_rows looks like:
 
@@ -85,102 +272,872 @@ class TextCleaningAndLabellingClient():
         :param filename:
         :return:
         """
-        with open(os.path.join(self.dataset_path, filename), 'ab+') as output_file:
-            wr = csv.writer(output_file, dialect='excel')
-            wr.writerows(multi_rows)
+        with self.sink(filename) as sink:
+            sink.writerows(multi_rows)
         return
 
-    def cleanall(self):
+    def cleanall(self, filenames=None, label=-1, workers=None, append=True):
         """
-        Find all .txt files in datasets/ and call cleaner() on them. That way this tool can process multiple text files, or just a single one, depending on user's needs.
+        Find all .txt files in datasets/ and clean them on a pool of worker processes. That way this tool can process
+        multiple text files, or just a single one, depending on user's needs.
+
+        Files bigger than split_bytes are cut into segments at whitespace, so a single huge file is also spread across
+        the workers. Windows run across segment boundaries, so this takes two passes over those files: the first counts
+        the words in each segment (cheap, it's just counting separators), which tells every segment where its first
+        window starts and how many windows it owns. Each segment is cleaned into its own part file and the parts are
+        joined in order, so the output is byte-for-byte what calling cleaner() on each file would give.
+
+        With the npy output format files aren't split, since each file's vocabulary is built up as it's written.
+        Neither are .txt.gz and .txt.zst files, which can't be read from the middle, but each is decompressed on a
+        thread of its own while its worker cleans it.
+
+        :param filenames: Optional list of filenames in self.dataset_path to clean, rather than every .txt, .txt.gz and
+        .txt.zst file.
+        :param label: As for cleaner(), applied to every file.
+        :param workers: Number of processes to use. Defaults to the number of CPUs.
+        :param append: If False, replace each output rather than adding to the end of it, i.e. to rebuild it.
         :return:
         """
+        try:
+            if filenames is None:
+                filenames = sorted(
+                    os.path.basename(path)
+                    for pattern in INPUT_PATTERNS for path in glob(os.path.join(self.dataset_path, pattern))
+                )
+            if not filenames:
+                self.logger.info('No .txt files found in {}.'.format(self.dataset_path))
+                return
+
+            pool = worker_context().Pool(processes=workers)
+            try:
+                # First pass: count the words in each segment of the files that need splitting.
+                segments = dict((filename, self.segments(filename)) for filename in filenames)
+                count_tasks = [
+                    (filename, start, end, end == os.path.getsize(os.path.join(self.dataset_path, filename)))
+                    for filename in filenames if len(segments[filename]) > 1
+                    for start, end in segments[filename]
+                ]
+                with self.metrics.timer('clean.count'):
+                    counts = dict(zip(
+                        [(filename, start) for filename, start, _, _ in count_tasks],
+                        pool.map(self.count_words, count_tasks)
+                    ))
+
+                # Second pass: clean each segment into a part file.
+                clean_tasks = []
+                for filename in filenames:
+                    output_filename = self.output_filename(filename, label)
+                    # Part files are never compressed, the output is compressed as they're joined.
+                    extension = os.path.splitext(compression.strip_compression(output_filename))[1]
+
+                    if self.output_format == 'npy':
+                        # Written in one go, straight to the output.
+                        clean_tasks.append((filename, output_filename, 0, 0, None, label))
+                        continue
+
+                    if len(segments[filename]) == 1:
+                        part_filename = '.{}.part{:05d}{}'.format(filename, 0, extension)
+                        clean_tasks.append((filename, part_filename, 0, 0, None, label))
+                        continue
+
+                    total_words = sum(counts[(filename, start)] for start, _ in segments[filename])
+                    if self.tokenizer == 'raw':
+                        # The serial cleaner emits window j as long as there's at least one word after it.
+                        total_windows = max(total_words - 1, 0) // self.max_sentence_length
+                    else:
+                        total_windows = total_words // self.max_sentence_length
+
+                    first_word = 0
+                    for index, (start, _) in enumerate(segments[filename]):
+                        next_word = first_word + counts[(filename, start)]
+                        first_window = int(ceil(float(first_word) / self.max_sentence_length))
+                        last_window = min(int(ceil(float(next_word) / self.max_sentence_length)), total_windows)
+                        part_filename = '.{}.part{:05d}{}'.format(filename, index, extension)
+                        clean_tasks.append((
+                            filename,
+                            part_filename,
+                            start,
+                            first_window * self.max_sentence_length - first_word,
+                            max(last_window - first_window, 0),
+                            label
+                        ))
+                        first_word = next_word
+
+                parts = dict((filename, []) for filename in filenames)
+                for task in clean_tasks:
+                    parts[task[0]].append(task[1])
+                # Bytes of input each part covers, for the throughput.
+                part_bytes = {}
+                for filename in filenames:
+                    for (start, end), part_filename in zip(segments[filename], parts[filename]):
+                        part_bytes[part_filename] = end - start
+
+                finished = dict((filename, 0) for filename in filenames)
+                files_done = 0
+                bytes_done = 0
+                started = time.time()
+                for filename, part_filename, rows in pool.imap_unordered(self.clean_segment, clean_tasks):
+                    finished[filename] += 1
+                    bytes_done += part_bytes[part_filename]
+                    self.metrics.add('clean.bytes', part_bytes[part_filename])
+                    self.metrics.add('clean.windows', rows)
+                    self.logger.info('{}: {}/{} segments cleaned, {:.1f} MB/s so far.'.format(
+                        filename, finished[filename], len(parts[filename]),
+                        bytes_done / 1048576.0 / max(time.time() - started, 1e-9)))
+
+                    if finished[filename] == len(parts[filename]) and self.output_format != 'npy':
+                        # Every segment is done, so stitch the parts together in order.
+                        self.join_parts(self.output_filename(filename, label), parts[filename], append=append)
+
+                    if finished[filename] == len(parts[filename]):
+                        files_done += 1
+                        self.logger.info('[{}/{} files] {} cleaned and written to disk.'.format(
+                            files_done, len(filenames), filename))
+
+            finally:
+                pool.close()
+                pool.join()
+
+            return
+
+        except Exception as e:
+            self.metrics.error('clean', e)
+            self.logger.error(e)
+
+    def segments(self, filename):
+        """
+        Work out where to cut the given file for cleanall(), aiming for pieces of split_bytes each. Every cut is made
+        just after a space or LF (never between the CR and LF of a CRLF, and never at the very end of the file), so
+        each segment starts at the beginning of a word.
+
+        :param filename: The name of the .txt file in self.dataset_path.
+        :return: List of (start, end) byte offsets.
+        """
+        full_input_filename = os.path.join(self.dataset_path, filename)
+        file_size = os.path.getsize(full_input_filename)
+        if self.output_format == 'npy' or compression.compression_of(filename):
+            return [(0, file_size)]
+
+        cuts = [0]
+        with open(full_input_filename, 'rb') as raw_text_file:
+            target = self.split_bytes
+            while target < file_size:
+                raw_text_file.seek(target)
+                position = target
+                cut = None
+                while cut is None:
+                    chunk = raw_text_file.read(self.read_chunk_size)
+                    if not chunk:
+                        break
+                    separators = [index for index in (chunk.find(b' '), chunk.find(b'\n')) if index != -1]
+                    if separators:
+                        cut = position + min(separators) + 1
+                    position += len(chunk)
+
+                if cut is None or cut >= file_size:
+                    break
+                cuts.append(cut)
+                target = cut + self.split_bytes
+
+        cuts.append(file_size)
+        return list(zip(cuts[:-1], cuts[1:]))
+
+    def count_words(self, task):
+        """
+        Count the words words() would give for one segment of a file, without building them.
+
+        :param task: Tuple of (filename, start, end, is_last_segment).
+        :return: The number of words.
+        """
+        filename, start, end, is_last_segment = task
+
+        if self.tokenizer == 'normalized':
+            with open(os.path.join(self.dataset_path, filename), 'rb') as raw_text_file:
+                raw_text_file.seek(start)
+                return sum(
+                    len(block)
+                    for block in normalizer.normalized_word_blocks(raw_text_file, self.read_chunk_size, end - start)
+                )
+
+        count = 0
+        previous_byte = b''
+        with open(os.path.join(self.dataset_path, filename), 'rb') as raw_text_file:
+            raw_text_file.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                chunk = raw_text_file.read(min(self.read_chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+
+                count += chunk.count(b' ') + chunk.count(b'\n') + chunk.count(b'\r') - chunk.count(b'\r\n')
+                if previous_byte == b'\r' and chunk.startswith(b'\n'):
+                    count -= 1
+                previous_byte = chunk[-1:]
+
+        # Every segment but the last ends on a separator. The last one has a final word after its last separator,
+        # unless the file finishes on a line break.
+        if is_last_segment:
+            count += 1
+            if previous_byte in (b'\n', b'\r'):
+                count -= 1
+        return count
+
+    def clean_segment(self, task):
+        """
+        Clean one segment of a file into a part file for cleanall().
+
+        :param task: Tuple of (filename, part_filename, start, skip, window_count, label). The segment starts at byte
+        offset start, its first skip words belong to a window started in the previous segment, and it owns the next
+        window_count windows (which may run on into the following segments). A window_count of None cleans to the end
+        of the file, like cleaner().
+        :return: Tuple of (filename, part_filename, rows written), so cleanall() can track progress.
+        """
+        filename, part_filename, start, skip, window_count, label = task
+
+        # The npy sink counts tokens itself. For text output, count them here and leave the counts next to the part
+        # file for cleanall() to merge, unless near duplicates are left out when the parts are joined, in which case
+        # cleanall() counts what's left.
+        vocabulary = None
+        if self.build_vocab and self.output_format != 'npy' and self.near_duplicates is None:
+            vocabulary = self.vocabulary_builder()
+
+        # npy output isn't split, so the one segment is the whole file and goes straight to the output. Text parts are
+        # filtered as they're joined, so a window can be compared with the ones in earlier parts.
+        duplicate_filter = self.near_duplicate_filter(part_filename if self.output_format == 'npy' else None)
+
+        with self.sink(part_filename, append=False, index=False) as sink, duplicate_filter as near_duplicates:
+            lines = self.windows(filename, start=start, skip=skip, limit=window_count)
+            if near_duplicates is not None:
+                lines = near_duplicates.filter(lines)
+
+            for line in lines:
+                if vocabulary is not None:
+                    vocabulary.add(line.split())
+                if label == -1:
+                    sink.write(line)
+                else:
+                    sink.write([line, self.output_labels[label]])
+
+        if vocabulary is not None:
+            vocabulary.save(os.path.join(self.dataset_path, '{}.counts'.format(part_filename)))
+            vocabulary.close()
+        return filename, part_filename, sink.rows_written
+
+    def join_parts(self, output_filename, part_filenames, append=True):
+        """
+        Append the part files cleanall() cleaned a file into to its output, in order, and delete them. With
+        near_duplicates set, the parts' rows go through the filter on the way, and the vocabulary is counted from what's
+        left; otherwise the parts are copied as they are and their token counts merged.
+
+        :param output_filename: The .txc or .csv file in self.dataset_path.
+        :param part_filenames: The part files in self.dataset_path, in order.
+        :param append: If False, replace the output rather than adding to the end of it.
+        :return:
+        """
+        part_filepaths = [os.path.join(self.dataset_path, part_filename) for part_filename in part_filenames]
+        vocabulary = self.vocabulary_builder() if self.build_vocab else None
+
+        duplicate_filter = self.near_duplicate_filter(output_filename)
+        with self.sink(output_filename, append=append) as sink, duplicate_filter as near_duplicates:
+            for part_filepath in part_filepaths:
+                if near_duplicates is None:
+                    sink.append_file(part_filepath)
+                    continue
+
+                with open(part_filepath, 'r', encoding='utf-8', newline='') as part_file:
+                    if output_filename.endswith('.csv'):
+                        rows = near_duplicates.filter(csv.reader(part_file, dialect='excel'), key=lambda row: row[0])
+                    else:
+                        rows = near_duplicates.filter(line.rstrip('\n') for line in part_file)
+                    for row in rows:
+                        if vocabulary is not None:
+                            vocabulary.add((row[0] if isinstance(row, list) else row).split())
+                        sink.write(row)
+
+        for part_filepath in part_filepaths:
+            os.remove(part_filepath)
+
+        if vocabulary is not None:
+            # Unless they were counted above, each segment spilled its token counts next to its part file, merge them.
+            counts_filepaths = []
+            if self.near_duplicates is None:
+                counts_filepaths = ['{}.counts'.format(part_filepath) for part_filepath in part_filepaths]
+            for counts_filepath in counts_filepaths:
+                vocabulary.add_run(counts_filepath)
+            self.write_vocabulary(output_filename, vocabulary)
+            for counts_filepath in counts_filepaths:
+                os.remove(counts_filepath)
         return
 
+    def output_filename(self, filename, label=-1):
+        """
+        Create the output filename based on input filename: a .txc if there's no label, or a .csv if there is, or a
+        .npy either way with the npy output format. With output_compression, .txc and .csv names end in .gz or .zst.
+
+        :param filename: The name of the .txt, .txt.gz or .txt.zst file.
+        :param label: As for cleaner().
+        :return: The name of the output file.
+        """
+        name = compression.strip_compression(filename).split('.txt')[0]
+        if self.output_format == 'npy':
+            return '{}.npy'.format(name)
+
+        suffix = compression.EXTENSIONS[self.output_compression] if self.output_compression else ''
+        if label == -1:
+            return '{}.txc{}'.format(name, suffix)
+        return '{}.csv{}'.format(name, suffix)
+
     def cleaner(self, filename, label=-1):
         """
         From the given text file, read text as stream ('cause these will be huge) and strip out unnecessary characters (including newlines and commas). For each segment of max_sentence_length, write to a .txc file.
 
         Could also just overwrite the original file but I dislike the idea of mutating the source data. This also makes it possible to set up checkpoints to stop and come back to if the labeler() takes a long time to finish.
 
-        :param filename: The name of the .txt file to read from.
+        :param filename: The name of the .txt file to read from, which can be compressed as .txt.gz or .txt.zst.
         :param label: An optional Integer value of which output_label to add to the data, indexed from 0. Making optional in case you want to create a dataset of live data for an algorithm, rather than a training or test set, or in case you'll invoke the labeler() function later.
         :return:
         """
         try:
-            # Determine the file path based on the self.dataset_path and the passed-in filename.
-            full_input_filename = os.path.join(self.dataset_path, filename)
-
-            with open(full_input_filename, 'rb') as raw_text_file:
-                # This is not scalable! Reads in whole file rather than piece by piece.
-                # Use .read().splitlines() to cross newline boundaries.
-                cleaned_text_fileraw = ' '.join(raw_text_file.read().splitlines()).split(' ')
-                total_number_of_raw_words = len(cleaned_text_fileraw)
-
-            while len(cleaned_text_fileraw) > self.max_sentence_length:
-                # Make line var out of the first max_sentence_length elements from the file, then delete them from the
-                # original collection to prepare for next iteration.
-                line = ' '.join(cleaned_text_fileraw[:self.max_sentence_length])
-                del cleaned_text_fileraw[:self.max_sentence_length]
-
-                # Transform the line for algorithmic consumption - removing commas, capital letters, etc.
-                line = line.lower()
-                line = re.sub(r'[\W_]+', ' ', line)  # Remove non-alpha characters.
-
-                # Write to file.
-                if label == -1:
-                    # Create the output filename based on input filename.
-                    cleaned_text_filename = '{}.txc'.format(filename.split('.txt')[0])
+            # The npy sink builds its own vocabulary, for .txc and .csv output we count tokens as the lines go by.
+            vocabulary = self.vocabulary_builder() if self.build_vocab and self.output_format != 'npy' else None
 
-                    with open(os.path.join(self.dataset_path, cleaned_text_filename), 'a+') as cleaned_file:
-                        line += '\n'
-                        cleaned_file.writelines(line)
+            # If label wasn't -1, the user is expected to have passed in the index of the output label, so we'll create
+            # an actual CSV out of it.
+            output_filename = self.output_filename(filename, label)
+            duplicate_filter = self.near_duplicate_filter(output_filename)
+            with self.metrics.timer('clean'), self.sink(output_filename) as sink, duplicate_filter as near_duplicates:
+                lines = self.windows(filename)
+                if near_duplicates is not None:
+                    lines = near_duplicates.filter(lines)
 
-                else:
-                    # If label wasn't -1, the user is expected to have passed in the index of the output label, so we'll
-                    # create an actual CSV out of it with our writer function.
-                    line_list = [line, self.output_labels[label]]
-
-                    # Create the output filename based on input filename.
-                    cleaned_text_filename = '{}.csv'.format(filename.split('.txt')[0])
+                for line in lines:
+                    if vocabulary is not None:
+                        vocabulary.add(line.split())
 
-                    self.writer_single_row(line_list, cleaned_text_filename)
+                    # Write to file.
+                    if label == -1:
+                        sink.write(line)
+                    else:
+                        sink.write([line, self.output_labels[label]])
 
-                    # DEBUG
-                    # self.logger.info('Label: {} Wrote: {}'.format(self.output_labels[label], line))
+            self.metrics.add('clean.bytes', os.path.getsize(os.path.join(self.dataset_path, filename)))
+            self.metrics.add('clean.windows', sink.rows_written)
 
-                # Give the user some indication of how far we are through the processing - could be millions of lines
-                # left to go. This is not working correctly at the moment because of an apparent division problem, so
-                # I'll come back to this later.
-                # progress_percentage = ceil(100 - (len(cleaned_text_fileraw) / total_number_of_raw_words))
-                # if progress_percentage % 2 == 0:
-                #     self.logger.info('{}/{} words processed. ({}%)'.format(len(cleaned_text_fileraw), total_number_of_raw_words, progress_percentage))
+            if vocabulary is not None:
+                self.write_vocabulary(output_filename, vocabulary)
 
             self.logger.info('{} cleaned and written to disk.'.format(filename))
             return
 
         except Exception as e:
+            self.metrics.error('clean', e)
             self.logger.error(e)
 
-    def labeler(self, filename):
+    def word_blocks(self, raw_text_file):
+        """
+        Read the raw file read_chunk_size bytes at a time and split each chunk into words with the configured tokenizer,
+        so memory use doesn't depend on the size of the file. See normalizer.raw_word_blocks() and
+        normalizer.normalized_word_blocks().
+
+        :param raw_text_file: File object opened in binary mode.
+        :return: Generator of lists of words as bytes, one list per chunk.
+        """
+        if self.tokenizer == 'normalized':
+            return normalizer.normalized_word_blocks(raw_text_file, self.read_chunk_size)
+        return normalizer.raw_word_blocks(raw_text_file, self.read_chunk_size)
+
+    def words(self, raw_text_file):
+        """
+        The same as word_blocks(), one word at a time.
+
+        :param raw_text_file: File object opened in binary mode.
+        :return: Generator of words as bytes.
+        """
+        return chain.from_iterable(self.word_blocks(raw_text_file))
+
+    def windows(self, filename, start=0, skip=0, limit=None):
+        """
+        Stream the given .txt, .txt.gz or .txt.zst file and yield one cleaned line per max_sentence_length words. Only
+        the current chunk's words are kept in memory. With the raw tokenizer, as before, the trailing words that don't
+        fill a complete window (plus one more word) are dropped. With the normalized tokenizer only an incomplete last
+        window is.
+
+        :param filename: The name of the .txt file to read from.
+        :param start: Byte offset to start reading from, which must be the start of a word. Compressed files can only
+        be read from the start.
+        :param skip: Number of words to skip before the first window.
+        :param limit: If set, yield exactly this many windows rather than reading to the end of the file.
+        :return: Generator of cleaned lines as strings.
+        """
+        # Determine the file path based on the self.dataset_path and the passed-in filename.
+        full_input_filename = os.path.join(self.dataset_path, filename)
+
+        # The raw cleaner only emits a window once there's at least one more word after it.
+        lookahead = 1 if limit is None and self.tokenizer == 'raw' else 0
+        emitted = 0
+
+        # A compressed file is decompressed on another thread as it's read.
+        with compression.open_input(full_input_filename, self.read_chunk_size, self.metrics) as raw_text_file:
+            if start:
+                raw_text_file.seek(start)
+
+            pending = []
+            for block in self.word_blocks(raw_text_file):
+                if skip:
+                    skipped = min(skip, len(block))
+                    block = block[skipped:]
+                    skip -= skipped
+                pending.extend(block)
+
+                position = 0
+                while len(pending) - position >= self.max_sentence_length + lookahead:
+                    if emitted == limit:
+                        return
+                    yield self.clean_window(pending[position:position + self.max_sentence_length])
+                    position += self.max_sentence_length
+                    emitted += 1
+                del pending[:position]
+
+                if emitted == limit:
+                    return
+
+    def clean_window(self, window):
+        """
+        Transform a window of words for algorithmic consumption - removing commas, capital letters, etc. Words from the
+        normalized tokenizer have already been through this.
+
+        :param window: List of words as bytes.
+        :return: The cleaned line as a string.
+        """
+        line = b' '.join(window)
+        if self.tokenizer == 'raw':
+            line = normalizer.clean_line(line)  # Lowercase and remove non-alpha characters.
+        return line.decode('ascii')
+
+    def labeler(self, filename, batch_size=10, prefetch=1000):
         """
         For the given .txc file, check if a checkpoint marker exists (.txcc file). If so, start from that line in the file. If not, start from top of file. Ask the user (StdIn) which class this line belongs to. User gives 0, 1, 2, etc. based on the index of the output_labels options, and it is saved to the CSV as a new line followed by a comma, followed by the label the user offered. Update the checkpoint marker file to indicate the readline position, and update the user's percentage progress through the file so they know how much farther they have to go.
 
         Could also just lop off the just-finished line in the .txc file to avoid the use of a checkpoint file altogether, but I'd prefer keeping the .txc file so the user can clobber the checkpoint file to restart it if they so chose.
 
-        To reduce the amount of actual changes written to disk, we'll write multiple rows in bulk to the .csv file, every ten decisions. They'll be passed to writer() in the format:
+        To reduce the amount of actual changes written to disk, we'll write multiple rows in bulk to the .csv file, every ten decisions, through one sink that's kept open for the whole session. They're written in the format:
         multi_rows = [
             ['A positive sentence.', '1.0'],
             ['A negative sentence.', '0.0']
         ]
 
+        The checkpoint holds the byte offset just past the last line decided on, so starting up is a single seek however
+        far into the file that is, and it's only moved on once the rows before it are in the .csv. Lines are read ahead
+        on a background thread so the next one is ready as soon as the user answers. Enter "s" to skip a line without
+        labelling it, or "q" (or Ctrl-C) to save and stop.
+
+        :param filename: The .txc file in self.dataset_path to label. Rows go to the .csv file of the same name.
+        :param batch_size: Write to the .csv and move the checkpoint every this many decisions.
+        :param prefetch: Number of lines to read ahead.
+        :return:
+        """
+        try:
+            if compression.compression_of(filename):
+                raise ValueError('Decompress {} first, labelling resumes from a byte offset into the .txc file.'.format(
+                    filename))
+            filepath = os.path.join(self.dataset_path, filename)
+            csv_filename = '{}.csv'.format(os.path.splitext(filename)[0])
+            checkpoint = self.load_labeler_checkpoint(filename)
+            file_size = os.path.getsize(filepath)
+
+            if checkpoint['offset']:
+                self.logger.info('Found a checkpoint, carrying on from line {} of {}.'.format(
+                    checkpoint['lines'] + 1, filename))
+            if checkpoint.get('pending'):
+                self.logger.warning('{} lines left waiting by active_labeler() will be skipped.'.format(
+                    len(checkpoint['pending'])))
+
+            prompt_string = self.labeler_prompt()
+
+            # Rows for the .csv, and where the checkpoint goes once they're written. Appending to one sink for the whole
+            # session, synced at each batch, keeps a batch's cost the same however big the .csv gets.
+            multi_rows = []
+            position = {'offset': checkpoint['offset'], 'lines': checkpoint['lines']}
+            decisions = 0
+            sink = self.sink(csv_filename)
+
+            def save():
+                sink.writerows(multi_rows)
+                del multi_rows[:]
+                sink.sync()
+                self.save_labeler_checkpoint(filename, position)
+
+            try:
+                for line, offset in self.prefetched_lines(filepath, checkpoint['offset'], prefetch):
+                    progress = 100.0 * offset / file_size if file_size else 100.0
+                    print('\n====\n{}\n====\n[line {}, {:.2f}% through {}]'.format(
+                        line, position['lines'] + 1, progress, filename))
+
+                    choice = self.labeler_choice(prompt_string)
+                    if choice == 'q':
+                        break
+                    if choice != 's':
+                        multi_rows.append([line, self.output_labels[choice]])
+
+                    position = {'offset': offset, 'lines': position['lines'] + 1}
+                    decisions += 1
+                    if decisions % batch_size == 0:
+                        save()
+                else:
+                    print('\nReached the end of {}.'.format(filename))
+
+            except (KeyboardInterrupt, EOFError):
+                print('')
+
+            finally:
+                # Closed rather than aborted on an error, as the checkpoint has already moved past what's written.
+                save()
+                sink.close()
+                self.logger.info('{} lines of {} labelled or skipped so far, rows written to {}.'.format(
+                    position['lines'], filename, csv_filename))
+
+            return
+
+        except Exception as e:
+            self.logger.error(e)
+
+    def active_labeler(self, filename, target_size=None, confidence=0.95, pool_size=1000, batch_size=10,
+                       prefetch=1000):
+        """
+        Like labeler(), but an ActiveLearner trained on each answer picks which line to ask about next, and labels the
+        lines it's sure of without asking, so a labelled set takes far fewer prompts.
+
+        Lines are read into a pool of pool_size at a time. Each turn the model scores the whole pool: lines it gives
+        one label at least the confidence probability are written with that label straight away, and the user is asked
+        about the line it's least sure of, preferring lines that look like labels that are still short of examples.
+        With target_size set, each label is filled up to an equal share of it and then the labeller stops, so the set
+        comes out balanced. Lines confidently of a label that's already full are dropped.
+
+        The .txcc checkpoint holds the read position plus the offsets of the lines still waiting in the pool, and the
+        model is saved next to it (<filename>.model.npz), so stopping and starting again carries on exactly where it
+        was.
+
+        :param filename: The .txc file in self.dataset_path to label. Rows go to the .csv file of the same name.
+        :param target_size: Optional number of rows to stop at, split equally between the output labels.
+        :param confidence: Label a line without asking once the model gives one label at least this probability.
+        :param pool_size: Number of lines to choose between.
+        :param batch_size: Write to the .csv, move the checkpoint and save the model every this many answers.
+        :param prefetch: Number of lines to read ahead.
         :return:
         """
+        from datasettoolkit.active_learner import ActiveLearner
+
+        try:
+            if compression.compression_of(filename):
+                raise ValueError('Decompress {} first, labelling resumes from a byte offset into the .txc file.'.format(
+                    filename))
+            filepath = os.path.join(self.dataset_path, filename)
+            csv_filename = '{}.csv'.format(os.path.splitext(filename)[0])
+            model_filepath = os.path.join(self.dataset_path, '{}.model.npz'.format(filename))
+            checkpoint = self.load_labeler_checkpoint(filename)
+            file_size = os.path.getsize(filepath)
+            n_labels = len(self.output_labels)
+
+            learner = ActiveLearner(n_labels, confidence=confidence)
+            if checkpoint['offset'] and os.path.isfile(model_filepath):
+                learner.load(model_filepath)
+                self.logger.info('Found a checkpoint, carrying on from line {} of {}.'.format(
+                    checkpoint['lines'] + 1, filename))
+
+            quota = int(ceil(float(target_size) / n_labels)) if target_size else None
+            counts = checkpoint.get('counts', [0] * n_labels)
+            frontier = checkpoint['offset']
+            lines_read = checkpoint['lines']
+
+            # Each item in the pool is (start offset, line, features). Lines left waiting last time go first.
+            pool = []
+            with open(filepath, 'rb') as text_file:
+                for start in checkpoint.get('pending', []):
+                    text_file.seek(start)
+                    line = text_file.readline().rstrip(b'\r\n').decode('utf-8')
+                    pool.append((start, line, learner.features(line)))
+
+            prompt_string = self.labeler_prompt()
+            multi_rows = []
+            answers = 0
+            automatic = 0
+            sink = self.sink(csv_filename)
+
+            def save():
+                sink.writerows(multi_rows)
+                del multi_rows[:]
+                sink.sync()
+                self.save_labeler_checkpoint(filename, {
+                    'offset': frontier,
+                    'lines': lines_read,
+                    'pending': [item[0] for item in pool],
+                    'counts': counts
+                })
+                learner.save(model_filepath)
+
+            lines = self.prefetched_lines(filepath, frontier, prefetch)
+            try:
+                while True:
+                    while len(pool) < pool_size:
+                        item = next(lines, None)
+                        if item is None:
+                            break
+                        line, offset = item
+                        pool.append((frontier, line, learner.features(line)))
+                        frontier = offset
+                        lines_read += 1
+
+                    if quota is not None and min(counts) >= quota:
+                        print('\nEvery label has {} rows.'.format(quota))
+                        break
+                    if not pool:
+                        print('\nReached the end of {}.'.format(filename))
+                        break
+
+                    wanted = [quota is None or count < quota for count in counts]
+                    confident, order, probabilities = learner.rank([item[2] for item in pool], wanted)
+
+                    for index, label in sorted(confident.items()):
+                        if quota is None or counts[label] < quota:
+                            multi_rows.append([pool[index][1], self.output_labels[label]])
+                            counts[label] += 1
+                    automatic += len(confident)
+
+                    question = pool[order[0]] if order else None
+                    pool = [item for index, item in enumerate(pool) if index not in confident]
+                    if question is None:
+                        continue
+
+                    _, line, features = question
+                    probability = probabilities[order[0]]
+                    print('\n====\n{}\n====\n[{:.2f}% through {}, model says "{}" at {:.2f}, rows so far: {}]'.format(
+                        line,
+                        100.0 * frontier / file_size if file_size else 100.0,
+                        filename,
+                        self.output_labels[int(probability.argmax())],
+                        float(probability.max()),
+                        ', '.join('{} {}'.format(count, label) for label, count in zip(self.output_labels, counts))
+                    ))
+
+                    choice = self.labeler_choice(prompt_string)
+                    if choice == 'q':
+                        break
+
+                    pool = [item for item in pool if item is not question]
+                    if choice != 's':
+                        learner.update(features, choice)
+                        if quota is None or counts[choice] < quota:
+                            multi_rows.append([line, self.output_labels[choice]])
+                            counts[choice] += 1
+
+                    answers += 1
+                    if answers % batch_size == 0:
+                        save()
+
+            except (KeyboardInterrupt, EOFError):
+                print('')
+
+            finally:
+                lines.close()
+                save()
+                sink.close()
+                self.logger.info('{} answers and {} lines labelled automatically, {} rows written to {}.'.format(
+                    answers, automatic, sum(counts), csv_filename))
+
+            return
+
+        except Exception as e:
+            self.logger.error(e)
+
+    def labeler_prompt(self):
+        """
+        :return: The question the labellers ask about each line.
+        """
+        return 'Which class does this line belong to? {}, s to skip, q to quit.\n>'.format(
+            ', '.join('{} for {}'.format(index, label) for index, label in enumerate(self.output_labels)))
+
+    def labeler_choice(self, prompt_string):
+        """
+        Ask the user about a line until they give a valid answer.
+
+        :param prompt_string: The question, from labeler_prompt().
+        :return: The index of the label they chose, or 's' to skip or 'q' to quit.
+        """
+        while True:
+            choice = input(prompt_string).strip().lower()
+            if choice in ('s', 'q'):
+                return choice
+            if choice.isdigit() and int(choice) < len(self.output_labels):
+                return int(choice)
+            print('Enter a number from 0 to {}, s or q.'.format(len(self.output_labels) - 1))
+
+    def labeler_checkpoint_path(self, filename):
+        """
+        :param filename: The .txc file being labelled.
+        :return: The path to its .txcc checkpoint file.
+        """
+        return os.path.join(self.dataset_path, '{}c'.format(filename))
+
+    def load_labeler_checkpoint(self, filename):
+        """
+        :param filename: The .txc file being labelled.
+        :return: Dict of the byte offset to carry on from and how many lines come before it, zeroes if there's no
+        checkpoint yet. Checkpoints from active_labeler() also hold the offsets of lines before that which are still
+        waiting to be labelled, and how many rows each label has.
+        """
+        checkpoint_path = self.labeler_checkpoint_path(filename)
+        if not os.path.isfile(checkpoint_path):
+            return {'offset': 0, 'lines': 0}
+        with open(checkpoint_path, 'r') as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+        loaded = {'offset': int(checkpoint['offset']), 'lines': int(checkpoint['lines'])}
+        if 'pending' in checkpoint:
+            loaded['pending'] = [int(offset) for offset in checkpoint['pending']]
+            loaded['counts'] = [int(count) for count in checkpoint['counts']]
+        return loaded
+
+    def save_labeler_checkpoint(self, filename, checkpoint):
+        """
+        Atomically replace the .txcc checkpoint file for the given .txc file.
+
+        :param filename: The .txc file being labelled.
+        :param checkpoint: Dict like load_labeler_checkpoint() returns.
+        :return:
+        """
+        checkpoint_path = self.labeler_checkpoint_path(filename)
+        temp_filepath = temp_filepath_for(checkpoint_path)
+        with open(temp_filepath, 'w') as checkpoint_file:
+            json.dump(checkpoint, checkpoint_file)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(temp_filepath, checkpoint_path)
         return
 
+    @staticmethod
+    def prefetched_lines(filepath, offset, prefetch):
+        """
+        Read lines from a file on a background thread, up to prefetch of them ahead of the caller.
+
+        :param filepath: The file to read.
+        :param offset: Byte offset to start reading from, i.e. the start of a line.
+        :param prefetch: Maximum number of lines to hold in memory.
+        :return: Generator of (line, offset), the line as a string without its newline and the byte offset just past it.
+        """
+        lines = queue.Queue(maxsize=prefetch)
+        stopped = threading.Event()
+
+        def put(item):
+            while not stopped.is_set():
+                try:
+                    lines.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def read():
+            try:
+                with open(filepath, 'rb') as text_file:
+                    text_file.seek(offset)
+                    position = offset
+                    for line in text_file:
+                        position += len(line)
+                        if not put((line.rstrip(b'\r\n').decode('utf-8'), position)):
+                            return
+            finally:
+                put(None)
+
+        reader = threading.Thread(target=read)
+        reader.daemon = True
+        reader.start()
+
+        try:
+            while True:
+                item = lines.get()
+                if item is None:
+                    return
+                yield item
+        finally:
+            stopped.set()
 
 def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Clean raw .txt datasets into .txc or labelled .csv files.')
+    parser.add_argument(
+        'filenames',
+        nargs='*',
+        help='Files in datasettoolkit/datasets/ to clean. (default: every .txt, .txt.gz and .txt.zst file)'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        action='store',
+        default=None,
+        help='The number of processes to clean with. (default: the number of CPUs)'
+    )
+    parser.add_argument(
+        '--label',
+        type=int,
+        action='store',
+        default=-1,
+        help='Index of the output label to give every line, or -1 to write unlabelled .txc files. (default: -1)'
+    )
+    parser.add_argument(
+        '--labeler',
+        action='store_true',
+        default=False,
+        help='Label the given .txc files interactively, rather than cleaning .txt files.'
+    )
+    parser.add_argument(
+        '--active',
+        action='store_true',
+        default=False,
+        help='With --labeler, ask about the lines a model trained on your answers is least sure of, and label the '
+             'ones it is sure of automatically.'
+    )
+    parser.add_argument(
+        '--target',
+        type=int,
+        action='store',
+        default=None,
+        help='With --active, stop once there are this many rows, split equally between the labels.'
+    )
+    parser.add_argument(
+        '--confidence',
+        type=float,
+        action='store',
+        default=0.95,
+        help='With --active, the probability above which lines are labelled automatically. (default: 0.95)'
+    )
+
+    parser.add_argument(
+        '--metrics',
+        nargs='?',
+        const='datasettoolkit/metrics.jsonl',
+        default=None,
+        help='Append counters, stage timings and latency histograms to this file as JSON lines, and print a summary '
+             'at the end. (default: off, or datasettoolkit/metrics.jsonl if no file is given)'
+    )
+    parser.add_argument(
+        '--metrics-interval',
+        type=float,
+        action='store',
+        default=10.0,
+        help='Seconds between --metrics lines. (default: 10)'
+    )
+    parser.add_argument(
+        '--profile',
+        choices=['cpu', 'memory'],
+        default=None,
+        help='Also run cProfile or tracemalloc, and write what they find next to the --metrics file.'
+    )
+
+    flags = parser.parse_args()
+
     client = TextCleaningAndLabellingClient()
+    client.metrics = open_metrics(flags)
 
     # Testing the writer.
     # multi_rows = [
@@ -189,8 +1146,15 @@ def main():
     # ]
     # client.writer(multi_rows=multi_rows, filename='debugging.csv')
 
-    client.cleaner(filename='text_from_papers.txt.example')
-    client.cleaner(filename='text_from_reddit.txt.example')
+    with client.metrics:
+        if flags.labeler:
+            for filename in flags.filenames:
+                if flags.active:
+                    client.active_labeler(filename, target_size=flags.target, confidence=flags.confidence)
+                else:
+                    client.labeler(filename)
+        else:
+            client.cleanall(filenames=flags.filenames or None, label=flags.label, workers=flags.workers)
     client.logger.info('Done.')
 
 if __name__ == '__main__':
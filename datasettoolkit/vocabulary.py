@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# Counts token frequencies as the cleaner writes windows, in bounded memory, and turns the counts into a vocabulary.
+
+import hashlib
+import heapq
+import io
+import os
+import struct
+import tempfile
+from itertools import groupby
+
+PAD_TOKEN = '<pad>'
+UNKNOWN_TOKEN = '<unk>'
+RESERVED_TOKENS = [PAD_TOKEN, UNKNOWN_TOKEN]
+
+
+def token_fingerprint(token):
+    """
+    :param token: A token as a string.
+    :return: A nonzero 64-bit fingerprint of the token, 0 being kept for padding.
+    """
+    value = struct.unpack('<Q', hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest())[0]
+    return value or 1
+
+
+def read_run(run_path):
+    """
+    :param run_path: A run file written by VocabularyBuilder.spill() or save().
+    :return: Generator of (token, count), in token order.
+    """
+    with io.open(run_path, 'r', encoding='utf-8', newline='\n') as run_file:
+        for line in run_file:
+            token, count = line.rstrip('\n').split('\t')
+            yield token, int(count)
+
+
+class VocabularyBuilder():
+    """
+    Counts how often each token turns up. Counts are kept in a dict until it holds max_entries distinct tokens, then
+    sorted and spilled to a run file on disk and the dict starts again, so memory stays bounded however many distinct
+    tokens the corpus has. finish() merges the runs back together (reading them in step, a line at a time), drops tokens
+    seen fewer than min_count times and keeps the max_size most frequent. Set max_size to bound memory there too,
+    otherwise every kept token is sorted in memory.
+
+    Builders for different pieces of a corpus can be combined by save()ing each one and passing the run files to
+    add_run() on another.
+    """
+
+    def __init__(self, min_count=1, max_size=None, max_entries=1000000, spill_dir=None):
+        """
+        :param min_count: Leave out tokens seen fewer times than this.
+        :param max_size: If set, keep only this many of the most frequent tokens, not counting the reserved ones.
+        :param max_entries: How many distinct tokens to count in memory before spilling to disk.
+        :param spill_dir: Where to put run files. Defaults to the system temp directory.
+        """
+        self.min_count = min_count
+        self.max_size = max_size
+        self.max_entries = max_entries
+        self.spill_dir = spill_dir
+        self.counts = {}
+        self.runs = []
+        self.own_runs = []
+        return
+
+    def add(self, tokens):
+        """
+        Count the given tokens.
+
+        :param tokens: Iterable of tokens as strings.
+        :return:
+        """
+        counts = self.counts
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        if len(counts) > self.max_entries:
+            self.spill()
+        return
+
+    def spill(self):
+        """
+        Write the in-memory counts to a new run file in spill_dir, sorted by token, and clear them. The run file is
+        removed by close().
+
+        :return: The path to the run file.
+        """
+        handle, run_path = tempfile.mkstemp(prefix='.vocab.', suffix='.run', dir=self.spill_dir)
+        os.close(handle)
+        self.own_runs.append(run_path)
+
+        with io.open(run_path, 'w', encoding='utf-8', newline='\n') as run_file:
+            for token in sorted(self.counts):
+                run_file.write(u'{}\t{}\n'.format(token, self.counts[token]))
+
+        self.runs.append(run_path)
+        self.counts = {}
+        return run_path
+
+    def save(self, run_path):
+        """
+        Merge everything counted so far, in memory and in any runs already spilled, into a single run file, i.e. to pass
+        to add_run() on another builder.
+
+        :param run_path: Where to write the run.
+        :return:
+        """
+        with io.open(run_path, 'w', encoding='utf-8', newline='\n') as run_file:
+            for token, count in self.merged_counts():
+                run_file.write(u'{}\t{}\n'.format(token, count))
+        return
+
+    def add_run(self, run_path):
+        """
+        Include the counts from another builder's run file.
+
+        :param run_path: A run file written by save().
+        :return:
+        """
+        self.runs.append(run_path)
+        return
+
+    def merged_counts(self):
+        """
+        :return: Generator of (token, total count) across memory and every run, in token order.
+        """
+        streams = [read_run(run_path) for run_path in self.runs]
+        streams.append(sorted(self.counts.items()))
+        for token, entries in groupby(heapq.merge(*streams), key=lambda entry: entry[0]):
+            yield token, sum(count for _, count in entries)
+
+    def finish(self):
+        """
+        Prune the counts into the vocabulary: the reserved tokens first, then the kept tokens from most to least
+        frequent (ties broken alphabetically). A token's id is its position in the list.
+
+        :return: List of (token, count).
+        """
+        kept = ((token, count) for token, count in self.merged_counts() if count >= self.min_count)
+        if self.max_size is not None:
+            # nsmallest with a negated count keeps only max_size entries in memory at a time.
+            kept = heapq.nsmallest(self.max_size, kept, key=lambda entry: (-entry[1], entry[0]))
+        else:
+            kept = sorted(kept, key=lambda entry: (-entry[1], entry[0]))
+
+        return [(token, 0) for token in RESERVED_TOKENS] + list(kept)
+
+    @staticmethod
+    def write(vocab_path, entries):
+        """
+        Write a vocabulary as "token<TAB>count" lines, the line number being the token's id.
+
+        :param vocab_path: The file to write.
+        :param entries: List of (token, count) from finish().
+        :return:
+        """
+        with io.open(vocab_path, 'w', encoding='utf-8', newline='\n') as vocab_file:
+            for token, count in entries:
+                vocab_file.write(u'{}\t{}\n'.format(token, count))
+            vocab_file.flush()
+            os.fsync(vocab_file.fileno())
+        return
+
+    @staticmethod
+    def read(vocab_path):
+        """
+        :param vocab_path: A file written by write().
+        :return: List of tokens, indexed by id.
+        """
+        with io.open(vocab_path, 'r', encoding='utf-8', newline='\n') as vocab_file:
+            return [line.rstrip('\n').split('\t')[0] for line in vocab_file]
+
+    def close(self):
+        """
+        Remove the run files this builder spilled.
+
+        :return:
+        """
+        for run_path in self.own_runs:
+            if os.path.isfile(run_path):
+                os.remove(run_path)
+        self.own_runs = []
+        return
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Shared fixtures for the tests. Run from the repo root: python -m pytest
+
+import io
+import json
+import os
+import sys
+
+import pytest
+import requests
+from requests.structures import CaseInsensitiveDict
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from datasettoolkit.text_cleaning_and_labelling import TextCleaningAndLabellingClient  # noqa: E402
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """
+    A client reading the repo's singleconfig.json, with its datasets in a temp directory.
+    """
+    # The client finds its configs relative to the working directory.
+    monkeypatch.chdir(REPO_ROOT)
+    client = TextCleaningAndLabellingClient()
+    client.dataset_path = str(tmp_path)
+    return client
+
+
+class StubReddit:
+    """
+    Stands in for reddit's listing API by answering requests.Session.get() with canned pages, and counts the requests.
+
+    pages maps a subreddit to a list of pages, each a list of post dicts with a title and selftext. Page n points at
+    page n + 1 with an "after" of "t3_<subreddit>p<n + 1>", and the last one has no "after".
+    """
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.requests = []
+
+    def get(self, url, headers=None, timeout=None, **kwargs):
+        from urllib.parse import parse_qs, urlparse
+
+        self.requests.append(url)
+        parsed = urlparse(url)
+        subreddit = parsed.path.split('/')[2]
+        after = parse_qs(parsed.query).get('after', [None])[0]
+        number = int(after.rsplit('p', 1)[1]) if after else 0
+        pages = self.pages[subreddit]
+
+        children = [
+            {'kind': 't3', 'data': dict({
+                'id': '{}{}x{}'.format(subreddit, number, index),
+                'name': 't3_{}{}x{}'.format(subreddit, number, index),
+                'is_self': True
+            }, **post)}
+            for index, post in enumerate(pages[number])
+        ]
+        body = json.dumps({'kind': 'Listing', 'data': {
+            'after': 't3_{}p{}'.format(subreddit, number + 1) if number + 1 < len(pages) else None,
+            'children': children
+        }}).encode('utf-8')
+
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response.headers = CaseInsensitiveDict({'Content-Type': 'application/json'})
+        response._content = body
+        response.raw = io.BytesIO(body)
+        return response
+
+
+@pytest.fixture
+def stub_reddit(monkeypatch):
+    """
+    :return: Function taking the pages to serve, see StubReddit, that patches them in and returns the StubReddit.
+    """
+    def serve(pages):
+        stub = StubReddit(pages)
+        monkeypatch.setattr(requests.Session, 'get', lambda session, url, **kwargs: stub.get(url, **kwargs))
+        return stub
+    return serve
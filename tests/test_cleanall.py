@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Tests that cleanall() splitting files across workers gives the same output as cleaner(). Run from the repo root:
+# python -m pytest
+
+import os
+
+import pytest
+
+TEXT = '\n'.join(
+    'Line {}, with some punctuation; and a few more words to make it wrap across windows.'.format(index)
+    for index in range(60)
+) + '\r\nA CRLF line at the very end'
+
+
+def read(filepath):
+    with open(filepath, 'rb') as input_file:
+        return input_file.read()
+
+
+def write_inputs(client, *filenames):
+    for filename in filenames:
+        with open(os.path.join(client.dataset_path, filename), 'w', encoding='utf-8', newline='') as text_file:
+            text_file.write(TEXT)
+
+
+@pytest.mark.parametrize('tokenizer', ['raw', 'normalized'])
+@pytest.mark.parametrize('label', [-1, 1])
+def test_split_file_matches_serial_cleaner(client, tokenizer, label):
+    client.tokenizer = tokenizer
+    write_inputs(client, 'serial.txt', 'split.txt')
+    client.cleaner('serial.txt', label=label)
+
+    # Small enough to cut the file into a couple of dozen segments.
+    client.split_bytes = 200
+    assert len(client.segments('split.txt')) > 10
+    client.cleanall(filenames=['split.txt'], label=label, workers=2)
+
+    serial = read(os.path.join(client.dataset_path, client.output_filename('serial.txt', label)))
+    split = read(os.path.join(client.dataset_path, client.output_filename('split.txt', label)))
+    assert serial
+    assert split == serial
+    # The part files are joined and removed.
+    outputs = [client.output_filename(filename, label) for filename in ('serial.txt', 'split.txt')]
+    assert sorted(os.listdir(client.dataset_path)) == sorted(['serial.txt', 'split.txt'] + outputs)
+
+
+def test_append_false_replaces_output(client):
+    write_inputs(client, 'split.txt')
+    client.split_bytes = 200
+    client.cleanall(filenames=['split.txt'], workers=2)
+    once = read(os.path.join(client.dataset_path, 'split.txc'))
+
+    client.cleanall(filenames=['split.txt'], workers=2)
+    assert read(os.path.join(client.dataset_path, 'split.txc')) == once + once
+
+    client.cleanall(filenames=['split.txt'], workers=2, append=False)
+    assert read(os.path.join(client.dataset_path, 'split.txc')) == once
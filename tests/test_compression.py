@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Tests for reading and writing gzip and zstd datasets, and the background decompressor. Run from the repo root:
+# python -m pytest
+
+import io
+
+import pytest
+
+from datasettoolkit import compression
+from datasettoolkit.compression import BackgroundReader, open_input
+from datasettoolkit.output_sink import TextSink
+
+COMPRESSIONS = ['gzip', pytest.param('zstd', marks=pytest.mark.skipif(
+    compression.zstandard is None, reason='needs zstandard'))]
+
+
+def read_text(filepath, chunk_size=1048576):
+    with io.TextIOWrapper(open_input(filepath, chunk_size=chunk_size), encoding='utf-8') as input_file:
+        return input_file.read()
+
+
+@pytest.mark.parametrize('name', COMPRESSIONS)
+def test_sink_output_reads_back_through_open_input(tmp_path, name):
+    filepath = str(tmp_path / 'dataset.txc{}'.format(compression.EXTENSIONS[name]))
+    lines = ['line {} with café'.format(index) for index in range(5000)]
+    with TextSink(filepath, append=False, compression=name) as sink:
+        sink.writerows(lines)
+
+    assert compression.compression_of(filepath) == name
+    # A small chunk size makes the background reader hand over many chunks, splitting multi-byte characters.
+    assert read_text(filepath, chunk_size=7).splitlines() == lines
+
+
+@pytest.mark.parametrize('name', COMPRESSIONS)
+def test_appending_adds_a_member_read_as_one_stream(tmp_path, name):
+    filepath = str(tmp_path / 'dataset.txc{}'.format(compression.EXTENSIONS[name]))
+    with TextSink(filepath, append=True, compression=name) as sink:
+        sink.writerows(['first', 'second'])
+    with TextSink(filepath, append=True, compression=name) as sink:
+        sink.write('third')
+
+    assert read_text(filepath).splitlines() == ['first', 'second', 'third']
+
+
+def test_plain_files_are_read_as_they_are(tmp_path):
+    filepath = str(tmp_path / 'dataset.txc')
+    with open(filepath, 'w', encoding='utf-8') as output_file:
+        output_file.write('plain\n')
+    with open_input(filepath) as input_file:
+        assert not isinstance(input_file, BackgroundReader)
+        assert input_file.read() == b'plain\n'
+
+
+def test_unknown_compression_is_rejected():
+    with pytest.raises(ValueError):
+        compression.require('bzip2')
+    assert compression.strip_compression('dataset.csv.gz') == 'dataset.csv'
+    assert compression.strip_compression('dataset.csv') == 'dataset.csv'
+
+
+def test_background_reader_returns_whole_chunks_and_partial_reads():
+    data = bytes(range(256)) * 40
+    with BackgroundReader(io.BytesIO(data), chunk_size=1000) as reader:
+        assert reader.read(1000) == data[:1000]
+        assert reader.read(10) == data[1000:1010]
+        assert reader.read1() == data[1010:2000]
+        assert reader.read() == data[2000:]
+        assert reader.read() == b''
+
+
+class FailingSource(io.RawIOBase):
+    """
+    A source that hands back one chunk and then fails, as a corrupt archive does part way through.
+    """
+
+    def __init__(self):
+        io.RawIOBase.__init__(self)
+        self.reads = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        self.reads += 1
+        if self.reads == 1:
+            return b'x' * size
+        raise IOError('corrupt input')
+
+
+def test_background_reader_raises_the_source_error_to_the_reader():
+    with BackgroundReader(FailingSource(), chunk_size=4) as reader:
+        assert reader.read(4) == b'xxxx'
+        with pytest.raises(IOError, match='corrupt input'):
+            reader.read(4)
+        # Once failed, it reports the end of the input rather than waiting forever.
+        assert reader.read(4) == b''
+
+
+def test_corrupt_gzip_raises_while_reading(tmp_path):
+    filepath = str(tmp_path / 'dataset.txc.gz')
+    with TextSink(filepath, append=False, compression='gzip') as sink:
+        sink.writerows('line {}'.format(index) for index in range(1000))
+    with open(filepath, 'r+b') as raw_file:
+        raw_file.truncate(raw_file.seek(0, io.SEEK_END) // 2)
+
+    with pytest.raises(EOFError):
+        read_text(filepath)
+
+
+def test_closing_early_stops_the_reader_thread():
+    with BackgroundReader(io.BytesIO(b'x' * 100000), chunk_size=10, queue_chunks=1) as reader:
+        assert reader.read(10) == b'x' * 10
+    assert not reader.reader.is_alive()
+    assert reader.closed
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Tests for splitting labelled datasets with DatasetSplitter. Run from the repo root: python -m pytest
+
+import csv
+import os
+
+import pytest
+
+from datasettoolkit.dataset_splitter import DatasetSplitter
+
+LABELS = ['Reddit comment', 'Not a Reddit comment']
+
+
+def write_dataset(path, rows):
+    with open(path, 'w', encoding='utf-8', newline='') as output_file:
+        csv.writer(output_file, dialect='excel').writerows(rows)
+
+
+def read_dataset(path):
+    with open(path, 'r', encoding='utf-8', newline='') as input_file:
+        return [tuple(row) for row in csv.reader(input_file, dialect='excel')]
+
+
+def dataset_rows(count, label, prefix):
+    return [['{} window {}'.format(prefix, index), label] for index in range(count)]
+
+
+def test_split_is_deterministic_and_keeps_every_record_once(client, tmp_path):
+    rows = dataset_rows(500, LABELS[0], 'reddit') + dataset_rows(500, LABELS[1], 'other')
+    write_dataset(str(tmp_path / 'dataset.csv'), rows)
+    splitter = DatasetSplitter(client)
+
+    counts = splitter.split(['dataset.csv'])
+    first = dict((split, read_dataset(str(tmp_path / '{}.csv'.format(split)))) for split in splitter.splits)
+    assert splitter.split(['dataset.csv']) == counts
+    second = dict((split, read_dataset(str(tmp_path / '{}.csv'.format(split)))) for split in splitter.splits)
+    assert first == second
+
+    assert sorted(row for split in first.values() for row in split) == sorted(tuple(row) for row in rows)
+    for split, records in first.items():
+        assert all(splitter.split_for(line) == split for line, _ in records)
+    # 1000 records hashed at 0.8/0.1/0.1 land within a few percent of the ratios.
+    assert 740 <= len(first['training']) <= 860
+    assert 60 <= len(first['eval']) <= 140
+    assert 60 <= len(first['test']) <= 140
+
+
+def test_salt_gives_a_different_split(client):
+    lines = ['window {}'.format(index) for index in range(200)]
+    unsalted = [DatasetSplitter(client).split_for(line) for line in lines]
+    salted = [DatasetSplitter(client, salt='again').split_for(line) for line in lines]
+    assert unsalted != salted
+
+
+@pytest.mark.parametrize('resample, size', [('down', 125), ('up', 500)])
+def test_resampling_evens_out_the_training_classes(client, tmp_path, resample, size):
+    rows = dataset_rows(500, LABELS[0], 'reddit') + dataset_rows(125, LABELS[1], 'other')
+    write_dataset(str(tmp_path / 'dataset.csv'), rows)
+    splitter = DatasetSplitter(client, ratios=(1, 0, 0), resample=resample)
+
+    counts = splitter.split(['dataset.csv'])
+    training = read_dataset(str(tmp_path / 'training.csv'))
+    # Every record is in training, so the classes meet at the smaller one's 125 or the larger one's 500.
+    assert counts['training'] == {LABELS[0]: size, LABELS[1]: size}
+    assert len(training) == 2 * size
+    assert set(training) <= set(tuple(row) for row in rows)
+
+
+def test_resampling_honours_class_ratios_and_the_row_cap(client, tmp_path):
+    rows = dataset_rows(300, LABELS[0], 'reddit') + dataset_rows(300, LABELS[1], 'other')
+    write_dataset(str(tmp_path / 'dataset.csv'), rows)
+    splitter = DatasetSplitter(client, ratios=(1, 0, 0), resample='up', max_class_rows=200,
+                               class_ratios={LABELS[0]: 1.0, LABELS[1]: 0.5})
+
+    counts = splitter.split(['dataset.csv'])
+    assert counts['training'] == {LABELS[0]: 200, LABELS[1]: 100}
+
+
+def test_split_refuses_to_overwrite_its_input(client, tmp_path):
+    write_dataset(str(tmp_path / 'training.csv'), dataset_rows(10, LABELS[0], 'reddit'))
+    with pytest.raises(ValueError):
+        DatasetSplitter(client).split(['training.csv'])
+    assert os.path.exists(str(tmp_path / 'training.csv'))
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Tests for DedupIndex reserving, committing and growing. Run from the repo root: python -m pytest
+
+import pytest
+
+from datasettoolkit import dedup_index
+from datasettoolkit.dedup_index import DedupIndex
+
+
+def test_committed_keys_persist_and_uncommitted_ones_are_forgotten(tmp_path):
+    filepath = str(tmp_path / 'dedup.idx')
+    saved = DedupIndex.post_keys('t3_saved', 'A saved post')
+    crashed = DedupIndex.post_keys('t3_crashed', 'A post the run crashed before saving')
+
+    with DedupIndex(filepath) as index:
+        assert index.reserve(saved)
+        assert index.reserve(crashed)
+        # Reserved keys are seen straight away, before they're committed.
+        assert not index.reserve(saved)
+        assert 'id:t3_crashed' in index
+        index.commit(saved)
+        assert len(index) == 2
+
+    with DedupIndex(filepath) as index:
+        assert len(index) == 2
+        assert all(key in index for key in saved)
+        assert not any(key in index for key in crashed)
+        assert not index.reserve(saved)
+        assert index.reserve(crashed)
+
+
+def test_repost_under_new_id_is_a_duplicate(tmp_path):
+    with DedupIndex(str(tmp_path / 'dedup.idx')) as index:
+        assert index.reserve(DedupIndex.post_keys('t3_first', 'Hello, World!'))
+        assert not index.reserve(DedupIndex.post_keys('t3_second', '  hello   world '))
+        assert index.reserve(DedupIndex.post_keys('t3_third', 'Hello, other world!'))
+
+
+def test_posts_with_no_text_left_are_only_indexed_by_id(tmp_path):
+    assert DedupIndex.post_keys('t3_first', '\U0001F680\U0001F680 !!!') == ['id:t3_first']
+
+    with DedupIndex(str(tmp_path / 'dedup.idx')) as index:
+        assert index.reserve(DedupIndex.post_keys('t3_first', '\U0001F680\U0001F680 !!!'))
+        assert index.reserve(DedupIndex.post_keys('t3_second', '???'))
+        assert not index.reserve(DedupIndex.post_keys('t3_first', '\U0001F680'))
+
+
+def test_grows_and_keeps_every_key(tmp_path):
+    filepath = str(tmp_path / 'dedup.idx')
+    keys = ['key {}'.format(number) for number in range(100)]
+
+    with DedupIndex(filepath, initial_capacity=8) as index:
+        assert index.capacity == 8
+        for key in keys:
+            index.add(key)
+        assert index.capacity == 256
+        assert len(index) == 100
+
+    with DedupIndex(filepath) as index:
+        assert index.capacity == 256
+        assert len(index) == 100
+        assert all(key in index for key in keys)
+        assert 'key 100' not in index
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['dedup.idx']
+
+
+@pytest.mark.parametrize('use_numpy', [True, False])
+def test_grow_with_and_without_numpy(tmp_path, monkeypatch, use_numpy):
+    if not use_numpy:
+        monkeypatch.setattr(dedup_index, 'numpy', None)
+    keys = ['key {}'.format(number) for number in range(5000)]
+    with DedupIndex(str(tmp_path / 'dedup.idx'), initial_capacity=8) as index:
+        for key in keys:
+            index.add(key)
+        assert index.capacity == 8192
+        assert all(key in index for key in keys)
+
+
+def test_rehash_resolves_collisions_and_wraps_around():
+    numpy = pytest.importorskip('numpy')
+    mask = 15
+    # Six fingerprints all at home in slot 13, two at home in slot 14 and one in slot 0: the cluster runs off the end
+    # of the table and carries on at the start.
+    fingerprints = [13 + 16 * number for number in range(1, 7)] + [14 + 16, 14 + 32, 16]
+    new_slots = numpy.zeros(mask + 1, dtype=numpy.uint64)
+    dedup_index.rehash(numpy.array(fingerprints + [0, 0], dtype=numpy.uint64), new_slots, mask)
+
+    assert sorted(value for value in new_slots.tolist() if value) == sorted(fingerprints)
+    for fingerprint in fingerprints:
+        # Every slot between a fingerprint's home and where it ended up is filled.
+        slot = fingerprint & mask
+        while new_slots[slot] != fingerprint:
+            assert new_slots[slot]
+            slot = (slot + 1) & mask
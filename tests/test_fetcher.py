@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Tests for Fetcher's retries and backoff, against a stubbed session. Run from the repo root: python -m pytest
+
+import email.utils
+import time
+
+import pytest
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from datasettoolkit.fetcher import Fetcher
+
+
+def response(status_code, headers=None):
+    stubbed = requests.Response()
+    stubbed.status_code = status_code
+    stubbed.url = 'https://example.com/'
+    stubbed.headers = CaseInsensitiveDict(headers or {})
+    stubbed._content = b'{}'
+    return stubbed
+
+
+def fetcher(responses, max_retries=5):
+    """
+    :param responses: What the session answers with, in order. Exceptions are raised instead.
+    :return: The Fetcher, with the waits it paused for in fetcher.waits rather than actually waiting.
+    """
+    stubbed = Fetcher({'User-Agent': 'test'}, workers=1, rate=0, max_retries=max_retries, backoff=1.0)
+    answers = iter(responses)
+
+    def get(url, **kwargs):
+        answer = next(answers)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    stubbed.session.get = get
+    stubbed.waits = []
+    stubbed.rate_limiter.pause = stubbed.waits.append
+    return stubbed
+
+
+def test_backs_off_exponentially_then_succeeds():
+    stubbed = fetcher([response(503), response(502), requests.ConnectionError(), response(200)])
+    assert stubbed.get('https://example.com/').status_code == 200
+    assert stubbed.waits == [1.0, 2.0, 4.0]
+    assert stubbed.metrics.counters['http.retries'] == 3
+
+
+def test_waits_as_long_as_retry_after_says():
+    retry_date = email.utils.formatdate(time.time() + 30, usegmt=True)
+    stubbed = fetcher([response(429, {'Retry-After': '7'}), response(429, {'Retry-After': retry_date}),
+                       response(429, {'Retry-After': 'soon'}), response(200)])
+    assert stubbed.get('https://example.com/').status_code == 200
+
+    assert stubbed.waits[0] == 7.0
+    assert 25 < stubbed.waits[1] <= 30
+    # An unreadable header falls back to the backoff for the third attempt.
+    assert stubbed.waits[2] == 4.0
+
+
+def test_gives_up_after_max_retries():
+    stubbed = fetcher([response(503)] * 3, max_retries=2)
+    with pytest.raises(requests.HTTPError):
+        stubbed.get('https://example.com/')
+    assert stubbed.waits == [1.0, 2.0]
+
+    stubbed = fetcher([requests.ConnectionError()] * 3, max_retries=2)
+    with pytest.raises(requests.ConnectionError):
+        stubbed.get('https://example.com/')
+
+
+def test_client_errors_are_not_retried():
+    stubbed = fetcher([response(404), response(200)])
+    with pytest.raises(requests.HTTPError):
+        stubbed.get('https://example.com/')
+    assert stubbed.waits == []
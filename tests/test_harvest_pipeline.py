@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Tests that the harvest pipeline writes the same labelled windows as harvesting with read() and then cleaning the
+# category files, against a stubbed listing API. Run from the repo root: python -m pytest
+
+import csv
+import os
+import shutil
+
+import pytest
+
+from conftest import REPO_ROOT
+from datasettoolkit.harvest_pipeline import HarvestPipeline
+from datasettoolkit.multi_reddit_reader import MultiRedditReader
+from datasettoolkit.text_cleaning_and_labelling import TextCleaningAndLabellingClient
+
+LABELS = {'interest': 'Reddit comment', 'avoid': 'Not a Reddit comment'}
+
+
+def subreddit_pages(subreddit, pages=3, posts=7):
+    return [
+        [{'title': '{} post {}, part {}'.format(subreddit, index, page),
+          'selftext': ' '.join('{}-word-{}'.format(subreddit, word) for word in range(index * 3))}
+         for index in range(posts)]
+        for page in range(pages)
+    ]
+
+
+PAGES = dict((subreddit, subreddit_pages(subreddit)) for subreddit in ('spacex', 'python', 'funny'))
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """
+    The reader and client both work under datasettoolkit/ in the working directory.
+    """
+    monkeypatch.chdir(str(tmp_path))
+    for directory in ('configs', 'datasets', 'checkpoints'):
+        os.makedirs(os.path.join('datasettoolkit', directory))
+    shutil.copy(os.path.join(REPO_ROOT, 'datasettoolkit', 'configs', 'singleconfig.json'), 'datasettoolkit/configs')
+    return tmp_path
+
+
+def read_rows(path):
+    with open(path, 'r', encoding='utf-8', newline='') as input_file:
+        return [tuple(row) for row in csv.reader(input_file, dialect='excel')]
+
+
+def serial_rows(config, tokenizer):
+    """
+    Harvest with read(), one subreddit at a time, then clean each category file, as before the pipeline.
+    """
+    MultiRedditReader(posts=100, stage='serial', workers=1, rate=0, dedup=None, config=config).read()
+    client = TextCleaningAndLabellingClient()
+    client.tokenizer = tokenizer
+    rows = {}
+    for category in config['subreddit_labels']:
+        client.cleaner('serial-{}.txt'.format(category), label=client.output_labels.index(LABELS[category]))
+        rows[category] = read_rows('datasettoolkit/datasets/serial-{}.csv'.format(category))
+    return rows
+
+
+def pipeline_rows(config, tokenizer, workers, queue_pages):
+    # Without dedup, as the serial harvest's posts would otherwise all be skipped.
+    reader = MultiRedditReader(posts=100, stage='dataset', workers=workers, rate=0, dedup=None, config=config)
+    client = TextCleaningAndLabellingClient()
+    client.tokenizer = tokenizer
+    return read_rows(HarvestPipeline(reader, client, labels=LABELS, queue_pages=queue_pages).run())
+
+
+@pytest.mark.parametrize('tokenizer', ['raw', 'normalized'])
+def test_one_worker_matches_harvesting_then_cleaning(workdir, stub_reddit, tokenizer):
+    stub_reddit(PAGES)
+    config = {'subreddit_labels': {'interest': ['spacex', 'python'], 'avoid': ['funny']}}
+    serial = serial_rows(config, tokenizer)
+    assert serial['interest'] and serial['avoid']
+
+    # With one worker, and a queue of one page to make the harvest wait on the cleaner, the categories come out in
+    # config order.
+    assert pipeline_rows(config, tokenizer, workers=1, queue_pages=1) == serial['interest'] + serial['avoid']
+
+
+def test_parallel_workers_keep_each_category_in_order(workdir, stub_reddit):
+    stub_reddit(PAGES)
+    config = {'subreddit_labels': {'interest': ['spacex'], 'avoid': ['funny']}}
+    serial = serial_rows(config, 'raw')
+
+    rows = pipeline_rows(config, 'raw', workers=2, queue_pages=2)
+    # The categories' windows interleave as their pages arrive, but each category's are in order.
+    for category, label in LABELS.items():
+        assert [row for row in rows if row[1] == label] == serial[category]
+    assert not [name for name in os.listdir('datasettoolkit/datasets') if name.startswith('.')]
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Tests for JobRunner rebuilding steps and reading fetch steps' subreddits from the reader configs.
+
+import json
+import os
+import shutil
+
+import pytest
+
+from conftest import REPO_ROOT
+from datasettoolkit.job_runner import JobRunner
+
+READER_CONFIG = {'subreddit_labels': {'interest': ['spacex', 'python'], 'avoid': ['funny']}}
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """
+    The runner, client and reader all work under datasettoolkit/ in the working directory, so give them a copy of the
+    cleaner's config and a reader config of their own.
+    """
+    monkeypatch.chdir(str(tmp_path))
+    for directory in ('configs', 'datasets', 'checkpoints'):
+        os.makedirs(os.path.join('datasettoolkit', directory))
+    shutil.copy(os.path.join(REPO_ROOT, 'datasettoolkit', 'configs', 'singleconfig.json'), 'datasettoolkit/configs')
+    with open('datasettoolkit/configs/config.dataset.json', 'w') as config_file:
+        json.dump(READER_CONFIG, config_file)
+    return tmp_path
+
+
+def job_runner(steps):
+    with open('datasettoolkit/configs/jobs.json', 'w') as config_file:
+        json.dump({'steps': steps}, config_file)
+    return JobRunner(config_path='datasettoolkit/configs/jobs.json', workers=1)
+
+
+def write_words(path, count, prefix):
+    with open(path, 'w', encoding='utf-8') as text_file:
+        text_file.write(' '.join('{}{}'.format(prefix, index) for index in range(count)))
+
+
+def test_rebuilt_clean_step_replaces_its_output(workdir):
+    write_words('datasettoolkit/datasets/raw.txt', 100, 'old')
+    runner = job_runner({'clean': {'type': 'clean', 'files': ['raw.txt'], 'label': 0, 'workers': 1}})
+    assert runner.run() == {'clean': 'built'}
+
+    # The input changed, so the step is rebuilt, and only the new windows should be in its output.
+    write_words('datasettoolkit/datasets/raw.txt', 70, 'new')
+    assert runner.run() == {'clean': 'built'}
+
+    with open('datasettoolkit/datasets/raw.csv', 'r', encoding='utf-8') as output_file:
+        rows = output_file.read().splitlines()
+    assert len(rows) == 2
+    assert all(row.startswith('new') for row in rows)
+
+
+def test_fetch_step_reads_subreddits_from_reader_config(workdir, stub_reddit):
+    posts = [[{'title': 'post {}'.format(index), 'selftext': ''} for index in range(3)]]
+    stub = stub_reddit(dict((subreddit, posts) for subreddit in ('spacex', 'python', 'funny')))
+    runner = job_runner({'fetch': {'type': 'fetch', 'config': 'dataset', 'category': 'interest', 'posts': 10,
+                                   'workers': 1, 'rate': 0}})
+
+    assert runner.run() == {'fetch': 'built'}
+    assert sorted(url.split('/')[4] for url in stub.requests) == ['python', 'spacex']
+
+    # Editing another category of the same reader config leaves the step up to date.
+    with open('datasettoolkit/configs/config.dataset.json', 'w') as config_file:
+        json.dump({'subreddit_labels': dict(READER_CONFIG['subreddit_labels'], avoid=['funny', 'pics'])}, config_file)
+    assert runner.run() == {'fetch': 'current'}
+
+
+def test_fetch_step_without_subreddits_is_rejected(workdir):
+    with pytest.raises(ValueError):
+        job_runner({'fetch': {'type': 'fetch', 'config': 'dataset', 'category': 'unknown'}})
+
+
+def test_clean_steps_run_side_by_side(workdir):
+    write_words('datasettoolkit/datasets/first.txt', 100, 'first')
+    write_words('datasettoolkit/datasets/second.txt', 100, 'second')
+    runner = job_runner({
+        'clean-first': {'type': 'clean', 'files': ['first.txt'], 'label': 0, 'workers': 2},
+        'clean-second': {'type': 'clean', 'files': ['second.txt'], 'label': 1, 'workers': 2},
+    })
+    runner.workers = 2
+    assert runner.run() == {'clean-first': 'built', 'clean-second': 'built'}
+
+    # Each step's worker processes started from a clean process rather than a fork of the runner's threads.
+    from datasettoolkit.text_cleaning_and_labelling import worker_context
+    assert worker_context().get_start_method() != 'fork'
+    for name in ('first', 'second'):
+        with open('datasettoolkit/datasets/{}.csv'.format(name), 'r', encoding='utf-8') as output_file:
+            assert len(output_file.read().splitlines()) == 3
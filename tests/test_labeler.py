@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Tests for the interactive labeller's batching and checkpoints, with the user's answers scripted.
+
+import csv
+import os
+
+
+def script_answers(client, monkeypatch, answers):
+    answers = iter(answers)
+    monkeypatch.setattr(client, 'labeler_choice', lambda prompt_string: next(answers))
+
+
+def count_sinks(client, monkeypatch):
+    opened = []
+    sink = client.sink
+
+    def counting_sink(filename, *args, **kwargs):
+        opened.append(filename)
+        return sink(filename, *args, **kwargs)
+
+    monkeypatch.setattr(client, 'sink', counting_sink)
+    return opened
+
+
+def read_rows(client, filename):
+    with open(os.path.join(client.dataset_path, filename), 'r', encoding='utf-8', newline='') as csv_file:
+        return list(csv.reader(csv_file))
+
+
+def test_labeler_writes_through_one_sink_and_resumes(client, monkeypatch):
+    lines = ['line {}'.format(index) for index in range(25)]
+    with open(os.path.join(client.dataset_path, 'dataset.txc'), 'w', encoding='utf-8') as txc_file:
+        txc_file.write('\n'.join(lines) + '\n')
+    labels = client.output_labels
+
+    opened = count_sinks(client, monkeypatch)
+    script_answers(client, monkeypatch, [0, 1, 's'] * 4 + ['q'])
+    client.labeler('dataset.txc', batch_size=5)
+
+    assert opened == ['dataset.csv']
+    expected = [[lines[index], labels[index % 3]] for index in range(12) if index % 3 != 2]
+    assert read_rows(client, 'dataset.csv') == expected
+    assert client.load_labeler_checkpoint('dataset.txc')['lines'] == 12
+
+    del opened[:]
+    script_answers(client, monkeypatch, [1] * 13)
+    client.labeler('dataset.txc', batch_size=5)
+
+    assert opened == ['dataset.csv']
+    assert read_rows(client, 'dataset.csv') == expected + [[line, labels[1]] for line in lines[12:]]
+    assert client.load_labeler_checkpoint('dataset.txc')['lines'] == 25
+
+
+def test_active_labeler_writes_through_one_sink(client, monkeypatch):
+    lines = ['alpha beta {}'.format(index) if index % 2 else 'gamma delta {}'.format(index) for index in range(40)]
+    with open(os.path.join(client.dataset_path, 'dataset.txc'), 'w', encoding='utf-8') as txc_file:
+        txc_file.write('\n'.join(lines) + '\n')
+
+    opened = count_sinks(client, monkeypatch)
+    script_answers(client, monkeypatch, [0, 1] * 10 + ['q'])
+    client.active_labeler('dataset.txc', batch_size=5, pool_size=10)
+
+    assert opened == ['dataset.csv']
+    rows = read_rows(client, 'dataset.csv')
+    checkpoint = client.load_labeler_checkpoint('dataset.txc')
+    assert len(rows) == sum(checkpoint['counts']) >= 20
+    assert all(label in client.output_labels for _, label in rows)
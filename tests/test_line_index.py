@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Tests for line indexes, random access with IndexedDataset and shuffling with Permutation. Run from the repo root:
+# python -m pytest
+
+import os
+
+import pytest
+
+from datasettoolkit import line_index
+from datasettoolkit.line_index import IndexedDataset, Permutation, index_filepath_for, index_is_current, write_index
+from datasettoolkit.output_sink import open_sink
+
+LINES = ['first line', 'a line with café in it', '', 'the last line']
+ROWS = [['plain', 'Reddit comment'], ['with, a comma', 'Not a Reddit comment'], ['with "quotes"', 'Reddit comment']]
+
+
+def write_bytes(path, data):
+    with open(path, 'wb') as output_file:
+        output_file.write(data)
+    return path
+
+
+@pytest.fixture(params=['numpy', 'no numpy'])
+def numpy_or_not(request, monkeypatch):
+    """
+    Run a test with and without NumPy, which the index scan and Permutation.take() use when it's there.
+    """
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(line_index, 'numpy', None)
+    return request.param
+
+
+@pytest.mark.parametrize('size', [0, 1, 2, 3, 7, 100, 1000, 4099])
+def test_permutation_is_a_bijection(numpy_or_not, size):
+    permutation = Permutation(size, seed=3)
+    shuffled = list(permutation)
+    assert sorted(shuffled) == list(range(size))
+    assert permutation.take(0, size) == [permutation[position] for position in range(size)]
+    if size > 10:
+        assert shuffled != list(range(size))
+
+
+def test_permutation_take_resumes_part_way(numpy_or_not):
+    permutation = Permutation(500, seed=1)
+    assert permutation.take(0, 200) + permutation.take(200, 600) == list(permutation)
+
+
+def test_permutation_depends_only_on_size_and_seed():
+    assert list(Permutation(300, seed=5)) == list(Permutation(300, seed=5))
+    assert list(Permutation(300, seed=5)) != list(Permutation(300, seed=6))
+    with pytest.raises(IndexError):
+        Permutation(10)[10]
+
+
+@pytest.mark.parametrize('data', [b'one\ntwo\nthree\n', b'one\ntwo\nthree', b'one\r\ntwo\r\nthree\r\n', b'\n\n'])
+def test_lines_read_back_by_number(tmp_path, numpy_or_not, data):
+    filepath = write_bytes(str(tmp_path / 'dataset.txc'), data)
+    expected = data.decode('utf-8').splitlines()
+    # A tiny chunk size, so the scan finds line starts across chunk boundaries.
+    assert write_index(filepath, chunk_size=3) == len(expected)
+
+    with IndexedDataset(filepath, build=False) as dataset:
+        assert len(dataset) == len(expected)
+        assert [dataset.get(index) for index in range(len(dataset))] == expected
+        assert dataset[-1] == expected[-1]
+        assert dataset[1:] == expected[1:]
+        assert list(dataset) == expected
+        with pytest.raises(IndexError):
+            dataset.get(len(expected))
+
+
+def test_empty_file_has_no_lines(tmp_path):
+    filepath = write_bytes(str(tmp_path / 'dataset.txc'), b'')
+    with IndexedDataset(filepath) as dataset:
+        assert len(dataset) == 0
+        assert list(dataset.shuffled()) == []
+
+
+def test_sink_index_gives_random_access_to_csv_rows(tmp_path):
+    filepath = str(tmp_path / 'dataset.csv')
+    with open_sink(filepath, append=False, index=True) as sink:
+        sink.writerows(ROWS)
+    assert index_is_current(filepath)
+
+    with IndexedDataset(filepath, build=False) as dataset:
+        assert dataset[1] == ROWS[1]
+        assert dataset[2] == ROWS[2]
+        assert dataset.line_offset(len(dataset)) == os.path.getsize(filepath)
+
+
+def test_appending_extends_the_index(tmp_path):
+    filepath = str(tmp_path / 'dataset.txc')
+    with open_sink(filepath, append=True, index=True) as sink:
+        sink.writerows(LINES[:2])
+    with open_sink(filepath, append=True, index=True) as sink:
+        assert sink.reuse_index
+        sink.writerows(LINES[2:])
+
+    with IndexedDataset(filepath, build=False) as dataset:
+        assert list(dataset) == LINES
+
+
+def test_stale_index_is_rebuilt_or_refused(tmp_path):
+    filepath = write_bytes(str(tmp_path / 'dataset.txc'), b'one\ntwo\n')
+    write_index(filepath)
+    with open(filepath, 'ab') as output_file:
+        output_file.write(b'three\n')
+    assert not index_is_current(filepath)
+
+    with pytest.raises(ValueError):
+        IndexedDataset(filepath, build=False)
+    with IndexedDataset(filepath) as dataset:
+        assert list(dataset) == ['one', 'two', 'three']
+
+
+def test_index_is_a_npy_array_of_offsets(tmp_path):
+    numpy = pytest.importorskip('numpy')
+    filepath = write_bytes(str(tmp_path / 'dataset.txc'), b'one\ntwo\nthree\n')
+    write_index(filepath)
+    assert numpy.load(index_filepath_for(filepath), mmap_mode='r').tolist() == [0, 4, 8, 14]
+
+
+def test_shuffled_reads_every_line_once_and_resumes(tmp_path):
+    filepath = str(tmp_path / 'dataset.txc')
+    lines = ['line {}'.format(index) for index in range(1000)]
+    with open_sink(filepath, append=False, index=True) as sink:
+        sink.writerows(lines)
+
+    with IndexedDataset(filepath) as dataset:
+        shuffled = list(dataset.shuffled(seed=2))
+        assert sorted(shuffled) == sorted(lines)
+        assert shuffled != lines
+        assert list(dataset.shuffled(seed=2, start=400)) == shuffled[400:]
+        assert dataset.sample(10, seed=2) == shuffled[:10]
+        assert sorted(dataset.sample(5000)) == sorted(lines)
+
+
+def test_compressed_files_cannot_be_indexed(tmp_path):
+    filepath = str(tmp_path / 'dataset.txc.gz')
+    with pytest.raises(ValueError):
+        write_index(filepath)
+    with pytest.raises(ValueError):
+        IndexedDataset(filepath)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Tests for decoding listing pages with each backend, and streaming them through the fetcher. Run from the repo root:
+# python -m pytest
+
+import io
+import json
+
+import pytest
+import requests
+
+from datasettoolkit.fetcher import Fetcher
+from datasettoolkit.listing_parser import BACKENDS, LISTING_FIELDS, parse_listing, parse_listing_stream
+
+POSTS = [
+    {'id': 'a1', 'name': 't3_a1', 'title': 'A title', 'selftext': 'Some text', 'is_self': True, 'score': 12,
+     'preview': {'images': [{'source': {'url': 'https://example.com/a.jpg', 'width': 10}}]}},
+    {'id': 'b2', 'name': 't3_b2', 'title': 'Ünïcode, "quotes" and \\\\ slashes\n', 'selftext': '', 'is_self': False,
+     'all_awardings': [], 'media': None},
+    # Fields a post doesn't have are left out, not filled in.
+    {'id': 'c3', 'name': 't3_c3', 'title': 'No selftext'},
+]
+BODY = json.dumps({'kind': 'Listing', 'data': {
+    'after': 't3_c3', 'dist': 3, 'children': [{'kind': 't3', 'data': post} for post in POSTS], 'before': None
+}}).encode('utf-8')
+
+
+def projected(fields=LISTING_FIELDS):
+    return {'after': 't3_c3', 'children': [
+        {'data': dict((field, post[field]) for field in fields if field in post)} for post in POSTS
+    ]}
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_every_backend_projects_the_same(backend):
+    assert parse_listing(BODY, backend=backend) == projected()
+    assert parse_listing(BODY, fields=('title',), backend=backend) == projected(('title',))
+
+
+def test_last_page_has_no_after():
+    body = json.dumps({'data': {'after': None, 'children': []}}).encode('utf-8')
+    for backend in BACKENDS:
+        assert parse_listing(body, backend=backend) == {'after': None, 'children': []}
+
+
+@pytest.mark.skipif('ijson' not in BACKENDS, reason='ijson is not installed')
+def test_fetcher_streams_pages_to_ijson(stub_reddit, monkeypatch):
+    stub = stub_reddit({'spacex': [[{'title': 'first', 'selftext': ''}, {'title': 'second', 'selftext': 'text'}]]})
+    streamed = []
+    get = requests.Session.get
+    monkeypatch.setattr(requests.Session, 'get',
+                        lambda session, url, **kwargs: streamed.append(kwargs.get('stream')) or get(session, url))
+
+    url = 'http://www.reddit.com/r/spacex/new/.json?limit=100'
+    fetcher = Fetcher({'User-Agent': 'test'}, workers=1, rate=0, parser='ijson')
+    listing = fetcher.get_listing(url)
+    assert streamed == [True]
+    assert listing == parse_listing(stub.get(url).content, backend='json')
+    assert [child['data']['title'] for child in listing['children']] == ['first', 'second']
+    assert fetcher.metrics.counters['http.bytes'] == len(stub.get(url).content)
+
+
+@pytest.mark.skipif('ijson' not in BACKENDS, reason='ijson is not installed')
+def test_stream_parser_reads_file_objects():
+    assert parse_listing_stream(io.BytesIO(BODY)) == projected()
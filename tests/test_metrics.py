@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Tests for the Metrics registry, its histograms and the JSON lines it writes. Run from the repo root:
+# python -m pytest
+
+import json
+import pickle
+import threading
+
+import pytest
+
+from datasettoolkit.metrics import Histogram, Metrics
+
+
+def test_counters_add_up_across_threads():
+    metrics = Metrics()
+
+    def count():
+        for _ in range(1000):
+            metrics.add('posts')
+            metrics.add('bytes', 10)
+
+    threads = [threading.Thread(target=count) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert metrics.counters == {'posts': 4000, 'bytes': 40000}
+
+
+def test_gauges_keep_their_maximum():
+    metrics = Metrics()
+    for value in (3, 9, 2):
+        metrics.gauge('queue', value)
+    assert metrics.snapshot()['gauges'] == {'queue': {'value': 2, 'max': 9}}
+
+
+def test_timers_sum_time_and_calls_even_when_the_block_raises():
+    metrics = Metrics()
+    with metrics.timer('clean'):
+        pass
+    with pytest.raises(ValueError):
+        with metrics.timer('clean'):
+            raise ValueError('failed')
+    metrics.add_time('clean', 2.0)
+
+    seconds, calls = metrics.timers['clean']
+    assert calls == 3
+    assert 2.0 <= seconds < 3.0
+
+
+def test_errors_are_counted_and_kept():
+    metrics = Metrics()
+    for index in range(25):
+        metrics.error('http', IOError('timeout {}'.format(index)))
+
+    record = metrics.snapshot()
+    assert record['counters'] == {'errors.http': 25}
+    # Only the latest few are kept.
+    assert len(record['errors']) == 20
+    assert record['errors'][-1]['type'] == 'OSError'
+    assert record['errors'][-1]['message'] == 'timeout 24'
+
+
+def test_histogram_percentiles_stay_within_their_buckets():
+    histogram = Histogram(bounds=(1.0, 2.0, 4.0))
+    for value in [0.5] * 50 + [1.5] * 40 + [3.0] * 9 + [10.0]:
+        histogram.observe(value)
+
+    snapshot = histogram.snapshot()
+    assert snapshot['count'] == 100
+    assert snapshot['min'] == 0.5
+    assert snapshot['max'] == 10.0
+    assert snapshot['mean'] == pytest.approx((25 + 60 + 27 + 10) / 100.0)
+    assert 0.5 <= snapshot['p50'] <= 1.0
+    assert 1.0 <= snapshot['p90'] <= 2.0
+    assert 2.0 <= snapshot['p99'] <= 4.0
+    assert snapshot['buckets'] == {'le_1.0': 50, 'le_2.0': 40, 'le_4.0': 9, 'le_inf': 1}
+
+
+def test_empty_histogram_has_no_percentiles():
+    snapshot = Histogram().snapshot()
+    assert snapshot['count'] == 0
+    assert snapshot['p50'] is None
+    assert snapshot['buckets'] == {}
+
+
+def test_rates_are_since_the_previous_snapshot():
+    metrics = Metrics()
+    metrics.add('posts', 100)
+    first = metrics.snapshot()
+    assert first['rates']['posts'] > 0
+    second = metrics.snapshot()
+    assert second['counters'] == {'posts': 100}
+    assert second['rates'] == {'posts': 0}
+
+
+def test_snapshots_are_written_as_json_lines(tmp_path, capsys):
+    path = str(tmp_path / 'metrics.jsonl')
+    with Metrics(path=path, interval=0.01) as metrics:
+        metrics.add('posts', 5)
+        metrics.observe('http.latency', 0.2)
+        with metrics.timer('http'):
+            threading.Event().wait(0.05)
+
+    with open(path, 'r') as metrics_file:
+        records = [json.loads(line) for line in metrics_file]
+    # However many interval snapshots were written, only the last is final.
+    assert [record['final'] for record in records] == [False] * (len(records) - 1) + [True]
+    final = records[-1]
+    assert final['counters'] == {'posts': 5}
+    assert final['stages']['http']['calls'] == 1
+    assert final['histograms']['http.latency']['count'] == 1
+    assert set(final['cpu_seconds']) == {'user', 'system', 'children'}
+    # Stopping also prints where the time went.
+    assert 'http' in capsys.readouterr().out
+
+
+def test_an_exception_in_the_block_is_recorded_in_the_final_snapshot(tmp_path):
+    path = str(tmp_path / 'metrics.jsonl')
+    with pytest.raises(KeyError):
+        with Metrics(path=path, interval=60):
+            raise KeyError('missing')
+
+    with open(path, 'r') as metrics_file:
+        final = [json.loads(line) for line in metrics_file][-1]
+    assert final['counters'] == {'errors.run': 1}
+
+
+def test_pickled_metrics_start_empty():
+    metrics = Metrics(interval=5.0)
+    metrics.add('posts', 3)
+    copy = pickle.loads(pickle.dumps(metrics))
+    assert copy.counters == {}
+    assert copy.interval == 5.0
+    assert copy.path is None
+
+
+def test_unknown_profile_is_rejected():
+    with pytest.raises(ValueError):
+        Metrics(profile='gpu')
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Tests for MultiRedditReader re-runs, resumes and dedup, against a stubbed listing API.
+
+import os
+
+import pytest
+
+from datasettoolkit.multi_reddit_reader import MultiRedditReader
+
+CONFIG = {'subreddit_labels': {'interest': ['spacex', 'python'], 'avoid': ['funny']}}
+
+
+def subreddit_pages(subreddit, pages=4, posts=10):
+    return [
+        [{'title': '{} post {}'.format(subreddit, page * posts + index), 'selftext': ''} for index in range(posts)]
+        for page in range(pages)
+    ]
+
+
+PAGES = dict((subreddit, subreddit_pages(subreddit)) for subreddit in ('spacex', 'python', 'funny'))
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """
+    The reader keeps its checkpoints and datasets under the working directory.
+    """
+    monkeypatch.chdir(str(tmp_path))
+    os.makedirs(os.path.join('datasettoolkit', 'checkpoints'))
+    os.makedirs(os.path.join('datasettoolkit', 'datasets'))
+    return tmp_path
+
+
+def reader(stage='training', dedup='global', config=CONFIG, workers=2):
+    return MultiRedditReader(posts=100, stage=stage, workers=workers, rate=0, dedup=dedup, config=config)
+
+
+def category_lines(stage, category):
+    with open('datasettoolkit/datasets/{}-{}.txt'.format(stage, category), 'r', encoding='utf-8') as category_file:
+        return category_file.read().splitlines()
+
+
+def test_second_run_replaces_files_with_the_same_posts(workdir, stub_reddit):
+    stub_reddit(PAGES)
+    reader().read()
+    first = category_lines('training', 'interest')
+    assert len(first) == 80
+    assert first[:40] == ['spacex post {}'.format(index) for index in range(40)]
+
+    reader().read()
+    assert category_lines('training', 'interest') == first
+    assert len(category_lines('training', 'avoid')) == 40
+
+
+def test_noclobber_run_skips_posts_already_saved(workdir, stub_reddit):
+    stub_reddit(PAGES)
+    reader().read()
+    reader().read(noclobber=True)
+    assert len(category_lines('training', 'interest')) == 80
+
+    # New posts on a later run are appended, and only those.
+    new_post = {'title': 'funny post new', 'selftext': '', 'id': 'new', 'name': 't3_new'}
+    stub_reddit(dict(PAGES, funny=[[new_post]] + PAGES['funny']))
+    reader().read(noclobber=True)
+    assert category_lines('training', 'avoid') == ['funny post {}'.format(index) for index in range(40)] + [
+        'funny post new']
+    # The parts were appended in place, with no copy of the category file left behind.
+    assert sorted(os.listdir('datasettoolkit/datasets')) == ['training-avoid.txt', 'training-interest.txt']
+
+
+def test_global_dedup_skips_other_stages_posts(workdir, stub_reddit):
+    stub_reddit(PAGES)
+    reader(stage='training', config={'subreddit_labels': {'interest': ['spacex']}}).read()
+    reader(stage='eval', config={'subreddit_labels': {'interest': ['spacex', 'python']}}).read()
+    assert category_lines('eval', 'interest') == ['python post {}'.format(index) for index in range(40)]
+
+    # Only this stage's own files count with dedup "stage".
+    reader(stage='eval', dedup='stage', config={'subreddit_labels': {'interest': ['spacex']}}).read()
+    assert len(category_lines('eval', 'interest')) == 40
+
+
+def test_interrupted_run_resumes_without_refetching(workdir, stub_reddit):
+    stub = stub_reddit(PAGES)
+    reader().read()
+    expected = dict((category, category_lines('training', category)) for category in CONFIG['subreddit_labels'])
+    for filename in os.listdir('datasettoolkit/datasets'):
+        os.remove(os.path.join('datasettoolkit/datasets', filename))
+
+    # Fail /r/python part way through: the other subreddits finish, and python's pages so far are kept.
+    get = stub.get
+
+    def failing_get(url, **kwargs):
+        if '/r/python/' in url and 'after=t3_pythonp2' in url:
+            raise ValueError('Connection reset')
+        return get(url, **kwargs)
+
+    stub.get = failing_get
+    reader().read()
+    assert not os.path.isfile('datasettoolkit/datasets/training-interest.txt')
+    assert category_lines('training', 'avoid') == expected['avoid']
+
+    stub.get = get
+    del stub.requests[:]
+    reader().read()
+    assert category_lines('training', 'interest') == expected['interest']
+    # Only the two pages python hadn't got to were fetched.
+    assert stub.requests == [url for url in stub.requests if '/r/python/' in url]
+    assert len(stub.requests) == 2
+
+
+def test_page_cut_off_while_committing_its_keys_is_not_refetched(workdir, stub_reddit, monkeypatch):
+    from datasettoolkit.dedup_index import DedupIndex
+
+    stub = stub_reddit(PAGES)
+    pending_path = 'datasettoolkit/checkpoints/training-interest-python.json.pending'
+    flush = DedupIndex.flush
+
+    def crashing_flush(index):
+        # Stop between committing python's second page to the index and moving its checkpoint on.
+        if os.path.isfile(pending_path) and MultiRedditReader.load_checkpoint(pending_path)['posts'] == 20:
+            raise IOError('Killed')
+        flush(index)
+
+    monkeypatch.setattr(DedupIndex, 'flush', crashing_flush)
+    reader(workers=1, config={'subreddit_labels': {'interest': ['python']}}).read()
+    assert os.path.isfile(pending_path)
+    assert not os.path.isfile('datasettoolkit/datasets/training-interest.txt')
+
+    monkeypatch.setattr(DedupIndex, 'flush', flush)
+    del stub.requests[:]
+    reader(workers=1, config={'subreddit_labels': {'interest': ['python']}}).read()
+    assert category_lines('training', 'interest') == ['python post {}'.format(index) for index in range(40)]
+    # The page was kept and its keys committed, so only the two pages after it were fetched.
+    assert len(stub.requests) == 2
+    assert not os.path.isfile(pending_path)
+
+
+def test_second_pipeline_run_keeps_the_dataset(client, stub_reddit, tmp_path, monkeypatch):
+    from datasettoolkit.harvest_pipeline import HarvestPipeline
+
+    workdir = tmp_path / 'work'
+    os.makedirs(str(workdir / 'datasettoolkit' / 'checkpoints'))
+    monkeypatch.chdir(str(workdir))
+    client.max_sentence_length = 3
+    stub_reddit(PAGES)
+
+    # One worker, so the pages arrive in the same order both times.
+    first = HarvestPipeline(reader(stage='dataset', workers=1), client).run()
+    with open(first, 'r', encoding='utf-8') as dataset_file:
+        rows = dataset_file.read()
+    assert rows.count('\n') > 0
+
+    second = HarvestPipeline(reader(stage='dataset', workers=1), client).run()
+    with open(second, 'r', encoding='utf-8') as dataset_file:
+        assert dataset_file.read() == rows
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Tests for dropping and flagging near duplicate windows with NearDuplicateFilter. Run from the repo root:
+# python -m pytest
+
+import csv
+import os
+import random
+
+import pytest
+
+numpy = pytest.importorskip('numpy')
+
+from datasettoolkit.near_duplicates import NearDuplicateFilter, lsh_bands  # noqa: E402
+
+
+def distinct_windows(count, words=30, seed=0):
+    rng = random.Random(seed)
+    vocabulary = ['word{}'.format(index) for index in range(5000)]
+    return [' '.join(rng.choice(vocabulary) for _ in range(words)) for _ in range(count)]
+
+
+def reworded(line, changes=1):
+    """
+    The line with its last few words swapped, i.e. a repost with a different punchline.
+    """
+    words = line.split()
+    return ' '.join(words[:-changes] + ['changed{}'.format(index) for index in range(changes)])
+
+
+def test_distinct_windows_are_all_kept():
+    windows = distinct_windows(1000)
+    near_duplicates = NearDuplicateFilter(memory_windows=2000, batch_rows=64)
+    assert list(near_duplicates.filter(windows)) == windows
+    assert near_duplicates.duplicates == 0
+
+
+def test_near_copies_are_dropped_in_and_across_batches():
+    originals = distinct_windows(100)
+    # Exact copies, and copies with one word of thirty changed, from the same batch and from later ones.
+    windows = originals + [originals[5], reworded(originals[7]), reworded(originals[60])]
+    near_duplicates = NearDuplicateFilter(memory_windows=1000, batch_rows=32)
+
+    assert list(near_duplicates.filter(windows)) == originals
+    assert near_duplicates.duplicates == 3
+
+
+def test_rewritten_windows_are_kept():
+    originals = distinct_windows(50)
+    # Half the words changed is well under the 0.8 threshold.
+    rewritten = [reworded(line, changes=15) for line in originals]
+    near_duplicates = NearDuplicateFilter(memory_windows=1000)
+    assert list(near_duplicates.filter(originals + rewritten)) == originals + rewritten
+
+
+def test_flagged_duplicates_are_kept_and_listed(tmp_path):
+    originals = distinct_windows(20)
+    rows = [[line, 'Reddit comment'] for line in originals + [originals[3], originals[10]]]
+    flag_filepath = str(tmp_path / 'dataset.near_duplicates.csv')
+    with NearDuplicateFilter(flag_filepath=flag_filepath, memory_windows=100) as near_duplicates:
+        assert list(near_duplicates.filter(rows, key=lambda row: row[0])) == rows
+    assert near_duplicates.duplicates == 2
+
+    with open(flag_filepath, 'r', encoding='utf-8', newline='') as flag_file:
+        flagged = list(csv.reader(flag_file))
+    assert flagged == [['20', '3', '1.000'], ['21', '10', '1.000']]
+
+
+def test_flag_list_is_discarded_on_error(tmp_path):
+    flag_filepath = str(tmp_path / 'dataset.near_duplicates.csv')
+    windows = distinct_windows(5)
+    with pytest.raises(RuntimeError):
+        with NearDuplicateFilter(flag_filepath=flag_filepath, memory_windows=100) as near_duplicates:
+            list(near_duplicates.filter(windows + windows))
+            raise RuntimeError('the output failed')
+    assert not os.listdir(str(tmp_path))
+
+
+def test_windows_older_than_the_ring_buffer_are_forgotten():
+    originals = distinct_windows(30)
+    near_duplicates = NearDuplicateFilter(memory_windows=10, batch_rows=5)
+
+    # The first window has been pushed out of the buffer by the time its copy comes round, the last hasn't.
+    windows = originals + [originals[0], originals[-1]]
+    assert list(near_duplicates.filter(windows)) == originals + [originals[0]]
+    assert near_duplicates.duplicates == 1
+    # Evicted windows' band keys are gone from the tables too.
+    assert all(len(table) <= 10 for table in near_duplicates.tables)
+
+
+def test_short_windows_are_one_shingle():
+    near_duplicates = NearDuplicateFilter(memory_windows=10)
+    assert list(near_duplicates.filter(['', 'a b', 'a b', 'a c'])) == ['', 'a b', 'a c']
+
+
+def test_the_same_seed_gives_the_same_signatures():
+    windows = distinct_windows(10)
+    first = NearDuplicateFilter(memory_windows=10).signatures_for(windows)
+    second = NearDuplicateFilter(memory_windows=10).signatures_for(windows)
+    assert (first == second).all()
+    assert first.shape == (10, 128)
+
+
+@pytest.mark.parametrize('threshold', [0.5, 0.8, 0.95])
+def test_lsh_bands_fit_the_signature(threshold):
+    bands, rows = lsh_bands(threshold, 128)
+    assert bands * rows <= 128
+    # The S curve's step, where half of all pairs become candidates, is near the threshold.
+    assert abs((1 - 0.5 ** (1.0 / bands)) ** (1.0 / rows) - threshold) < 0.15
+
+
+def test_threshold_must_be_a_similarity():
+    with pytest.raises(ValueError):
+        NearDuplicateFilter(threshold=0)
+
+
+def test_cleaner_drops_reposted_windows(client):
+    client.near_duplicates = 'drop'
+    window = ' '.join('word{}'.format(index) for index in range(client.max_sentence_length))
+    other = ' '.join('other{}'.format(index) for index in range(client.max_sentence_length))
+    with open(os.path.join(client.dataset_path, 'input.txt'), 'w', encoding='utf-8') as text_file:
+        text_file.write(' '.join([window, other, window, window, 'tail']))
+    client.cleaner('input.txt', label=-1)
+
+    with open(os.path.join(client.dataset_path, 'input.txc'), 'r', encoding='utf-8') as output_file:
+        assert output_file.read().splitlines() == [window, other]
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Tests for the translate-table normaliser and the normalized tokenizer. Run from the repo root: python -m pytest
+
+import io
+import os
+import re
+
+import pytest
+
+from datasettoolkit import normalizer
+
+SAMPLES = [
+    b'',
+    b' ',
+    b'!!!',
+    b'Hello, World!',
+    b'  leading and trailing  ',
+    b'snake_case and CamelCase_',
+    b'tabs\tand\nnewlines\r\n',
+    b'digits 123 and 4.5e6',
+    'Café naïve – résumé'.encode('utf-8'),
+    bytes(range(256)),
+]
+
+TEXT = '\n'.join(
+    'Line {}: SOME punctuation, under_scores & café -- and  double  spaces.'.format(index) for index in range(50)
+).encode('utf-8')
+
+
+def reference_clean(line):
+    return re.sub(br'[\W_]+', b' ', line.lower())
+
+
+@pytest.mark.parametrize('line', SAMPLES)
+def test_clean_line_matches_the_regex(line):
+    assert normalizer.clean_line(line) == reference_clean(line)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 4, 13, 1048576])
+def test_normalized_word_blocks_split_the_cleaned_text(chunk_size):
+    blocks = normalizer.normalized_word_blocks(io.BytesIO(TEXT), chunk_size)
+    words = [word for block in blocks for word in block]
+    assert words == reference_clean(TEXT).split()
+    assert all(word for word in words)
+
+
+def test_normalized_word_blocks_stop_at_length():
+    blocks = normalizer.normalized_word_blocks(io.BytesIO(b'first second, third'), 3, length=13)
+    assert [word for block in blocks for word in block] == [b'first', b'second']
+
+
+def test_normalized_windows_hold_exactly_max_sentence_length_words(client):
+    client.tokenizer = 'normalized'
+    client.read_chunk_size = 7
+    with open(os.path.join(client.dataset_path, 'input.txt'), 'wb') as text_file:
+        text_file.write(TEXT)
+
+    words = [word.decode('ascii') for word in reference_clean(TEXT).split()]
+    length = client.max_sentence_length
+    expected = [' '.join(words[start:start + length]) for start in range(0, len(words) - length + 1, length)]
+    assert list(client.windows('input.txt')) == expected
+    assert all(len(window.split(' ')) == length for window in expected)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Tests for writing windows as token ids with NpySink and loading them back. Run from the repo root: python -m pytest
+
+import logging
+import os
+
+import pytest
+
+from datasettoolkit.metrics import Metrics
+from datasettoolkit.npy_sink import PAD_ID, UNKNOWN_ID, NpySink, load_windows
+from datasettoolkit.vocabulary import RESERVED_TOKENS, VocabularyBuilder
+
+numpy = pytest.importorskip('numpy')
+LABELS = ['Reddit comment', 'Not a Reddit comment']
+
+
+def decode(row, vocabulary):
+    return [vocabulary[token_id] for token_id in row.tolist() if token_id != PAD_ID]
+
+
+def test_labelled_round_trip_pads_short_windows(tmp_path):
+    filepath = str(tmp_path / 'dataset.npy')
+    rows = [['the cat sat', LABELS[1]], ['a dog', LABELS[0]], ['the dog sat down', LABELS[1]]]
+    with NpySink(filepath, width=4, labels=LABELS, vocabulary=VocabularyBuilder()) as sink:
+        sink.writerows(rows)
+
+    ids, labels, vocabulary = load_windows(filepath)
+    assert ids.shape == (3, 4)
+    assert ids.dtype == numpy.int32
+    assert [decode(row, vocabulary) for row in ids] == [line.split() for line, _ in rows]
+    assert ids[1].tolist()[2:] == [PAD_ID, PAD_ID]
+    assert labels.tolist() == [1, 0, 1]
+    # Reserved tokens first, then by frequency, ties alphabetically.
+    assert vocabulary == RESERVED_TOKENS + ['dog', 'sat', 'the', 'a', 'cat', 'down']
+    assert sorted(os.listdir(str(tmp_path))) == ['dataset.labels.npy', 'dataset.npy', 'dataset.vocab']
+
+
+def test_pruned_tokens_are_unknown_and_unlabelled_has_no_labels(tmp_path):
+    filepath = str(tmp_path / 'dataset.npy')
+    with NpySink(filepath, width=3, labels=LABELS, vocabulary=VocabularyBuilder(min_count=2)) as sink:
+        sink.writerows(['common rare', 'common word', 'word once'])
+
+    ids, labels, vocabulary = load_windows(filepath)
+    assert labels is None
+    assert vocabulary == RESERVED_TOKENS + ['common', 'word']
+    assert ids.tolist() == [[2, UNKNOWN_ID, PAD_ID], [2, 3, PAD_ID], [3, UNKNOWN_ID, PAD_ID]]
+
+
+def test_long_windows_are_cut_short_and_counted(tmp_path, caplog):
+    filepath = str(tmp_path / 'dataset.npy')
+    metrics = Metrics()
+    with caplog.at_level(logging.WARNING):
+        with NpySink(filepath, width=3, labels=LABELS, vocabulary=VocabularyBuilder(), metrics=metrics) as sink:
+            sink.write('don t you know it')
+            sink.write('fits in three')
+
+    ids, _, vocabulary = load_windows(filepath)
+    assert [decode(row, vocabulary) for row in ids] == [['don', 't', 'you'], ['fits', 'in', 'three']]
+    assert metrics.counters['npy.truncated_tokens'] == 2
+    assert '2 tokens were cut off' in caplog.text
+
+
+def test_abort_leaves_the_old_dataset(tmp_path):
+    filepath = str(tmp_path / 'dataset.npy')
+    with NpySink(filepath, width=2, labels=LABELS, vocabulary=VocabularyBuilder()) as sink:
+        sink.write('old window')
+
+    with pytest.raises(KeyError):
+        with NpySink(filepath, width=2, labels=LABELS, vocabulary=VocabularyBuilder(), buffer_rows=1) as sink:
+            sink.write('new window')
+            raise KeyError
+    ids, _, vocabulary = load_windows(filepath)
+    assert decode(ids[0], vocabulary) == ['old', 'window']
+    assert sorted(os.listdir(str(tmp_path))) == ['dataset.npy', 'dataset.vocab']
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Tests for the buffered output sinks. Run from the repo root: python -m pytest
+
+import gzip
+import os
+
+import pytest
+
+from datasettoolkit.output_sink import open_sink
+
+
+def read(filepath):
+    with open(filepath, 'r', encoding='utf-8', newline='') as input_file:
+        return input_file.read()
+
+
+def test_fresh_write_only_appears_on_close(tmp_path):
+    filepath = str(tmp_path / 'dataset.txc')
+    with open_sink(filepath, append=False) as sink:
+        sink.write('a line')
+        sink.flush()
+        assert not os.path.isfile(filepath)
+    assert read(filepath) == 'a line\n'
+    assert os.listdir(str(tmp_path)) == ['dataset.txc']
+
+
+def test_replace_keeps_old_file_on_error(tmp_path):
+    filepath = str(tmp_path / 'dataset.csv')
+    with open_sink(filepath) as sink:
+        sink.write(['old', '1'])
+
+    with pytest.raises(KeyError):
+        with open_sink(filepath, append=False) as sink:
+            sink.write(['new', '2'])
+            sink.flush()
+            raise KeyError
+    assert read(filepath) == 'old,1\r\n'
+    assert os.listdir(str(tmp_path)) == ['dataset.csv']
+
+
+def test_append_writes_to_the_target(tmp_path):
+    filepath = str(tmp_path / 'dataset.csv')
+    with open_sink(filepath) as sink:
+        sink.write(['first', '1'])
+    with open_sink(filepath) as sink:
+        sink.write(['second', '2'])
+        sink.flush()
+        # No copy of the target is made to append to, just a marker of where it ended.
+        assert sorted(os.listdir(str(tmp_path))) == ['dataset.csv', 'dataset.csv.appending']
+        assert read(filepath + '.appending') == str(len('first,1\r\n'))
+    assert read(filepath) == 'first,1\r\nsecond,2\r\n'
+    assert os.listdir(str(tmp_path)) == ['dataset.csv']
+
+
+def test_append_abort_truncates_what_was_added(tmp_path):
+    filepath = str(tmp_path / 'dataset.txc')
+    with open_sink(filepath) as sink:
+        sink.write('kept')
+
+    with pytest.raises(KeyError):
+        with open_sink(filepath) as sink:
+            sink.writerows(['dropped'] * 3)
+            sink.flush()
+            raise KeyError
+    assert read(filepath) == 'kept\n'
+
+
+def test_compressed_append_and_abort(tmp_path):
+    filepath = str(tmp_path / 'dataset.txc.gz')
+    with open_sink(filepath) as sink:
+        sink.write('one')
+    with open_sink(filepath) as sink:
+        sink.write('two')
+
+    with pytest.raises(KeyError):
+        with open_sink(filepath) as sink:
+            sink.write('three')
+            sink.flush()
+            raise KeyError
+    with gzip.open(filepath, 'rt', encoding='utf-8') as input_file:
+        assert input_file.read() == 'one\ntwo\n'
+
+
+def test_append_sync_commits_and_abort_of_new_file(tmp_path):
+    filepath = str(tmp_path / 'dataset.csv')
+    with pytest.raises(KeyError):
+        with open_sink(filepath) as sink:
+            sink.write(['synced', '1'])
+            sink.sync()
+            assert read(filepath) == 'synced,1\r\n'
+            sink.write(['dropped', '2'])
+            sink.flush()
+            raise KeyError
+    # Aborting only drops what was written since the sync.
+    assert read(filepath) == 'synced,1\r\n'
+    assert os.listdir(str(tmp_path)) == ['dataset.csv']
+
+    with pytest.raises(KeyError):
+        with open_sink(str(tmp_path / 'new.csv')) as sink:
+            sink.write(['dropped', '1'])
+            sink.flush()
+            raise KeyError
+    # The sink created the file, so aborting removes it.
+    assert os.listdir(str(tmp_path)) == ['dataset.csv']
+
+
+def killed(sink):
+    """
+    Leave a sink the way a process killed part way through writing would: its rows flushed but never committed.
+    """
+    sink.flush()
+    sink.output_file.close()
+    return
+
+
+def test_append_cut_short_is_undone_on_next_open(tmp_path):
+    filepath = str(tmp_path / 'dataset.txc')
+    with open_sink(filepath) as sink:
+        sink.write('kept')
+    sink = open_sink(filepath)
+    sink.writerows(['half', 'written'])
+    sink.sync()
+    sink.write('lost')
+    killed(sink)
+    assert read(filepath) == 'kept\nhalf\nwritten\nlost\n'
+
+    # Whichever way it's next opened, the rows after the last sync are cut off first.
+    with open_sink(filepath) as sink:
+        sink.write('next')
+    assert read(filepath) == 'kept\nhalf\nwritten\nnext\n'
+
+    sink = open_sink(str(tmp_path / 'new.txc'))
+    sink.write('lost')
+    killed(sink)
+    with open_sink(str(tmp_path / 'new.txc'), append=False) as sink:
+        pass
+    assert read(str(tmp_path / 'new.txc')) == ''
+    assert sorted(os.listdir(str(tmp_path))) == ['dataset.txc', 'new.txc']
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Tests for the single subreddit reader, against a stubbed listing API.
+
+import builtins
+import os
+
+import pytest
+
+from datasettoolkit.reddit_reader import RedditReader
+
+PAGES = {'learnmachinelearning': [
+    [{'title': 'FAQ: which course first?', 'selftext': 'Asking which\ncourse to take'},
+     {'title': 'My GAN project', 'selftext': 'Trained a GAN on café photos'},
+     {'title': 'Link post', 'selftext': '', 'is_self': False}],
+    [{'title': 'FAQ: which book first?', 'selftext': 'Asking which book to read'},
+     {'title': 'My RNN project', 'selftext': 'Trained an RNN on lyrics'}]
+]}
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """
+    The reader writes to datasettoolkit/datasets/ under the working directory.
+    """
+    monkeypatch.chdir(str(tmp_path))
+    os.makedirs(os.path.join('datasettoolkit', 'datasets'))
+    return tmp_path
+
+
+def answer_faqs(monkeypatch):
+    """
+    Answer 1 (faqs) for posts starting "FAQ" and 2 for the rest, and count the questions.
+    """
+    asked = []
+
+    def answer(prompt):
+        asked.append(prompt)
+        return '1' if answer.shown.startswith('FAQ') else '2'
+
+    print_ = builtins.print
+
+    def remember_shown(*args, **kwargs):
+        if args and isinstance(args[0], str) and args[0].startswith('\n====\n'):
+            answer.shown = args[0][len('\n====\n'):]
+        print_(*args, **kwargs)
+
+    monkeypatch.setattr(builtins, 'input', answer)
+    monkeypatch.setattr(builtins, 'print', remember_shown)
+    return asked
+
+
+def read_class(reader, key):
+    with open(reader.classes[key], 'r', encoding='utf-8') as class_file:
+        return class_file.read().splitlines()
+
+
+def test_read_sorts_self_posts_into_class_files(workdir, stub_reddit, monkeypatch):
+    stub = stub_reddit(PAGES)
+    asked = answer_faqs(monkeypatch)
+    reader = RedditReader()
+    reader.read()
+
+    assert len(stub.requests) == 2
+    assert len(asked) == 4
+    assert read_class(reader, '1') == ['FAQ: which course first? Asking which course to take',
+                                       'FAQ: which book first? Asking which book to read']
+    assert read_class(reader, '2') == ['My GAN project Trained a GAN on café photos',
+                                       'My RNN project Trained an RNN on lyrics']
+    # The last page has no "after", so the next run starts from the top.
+    with open(reader.checkpoint_file, 'r', encoding='utf-8') as checkpoint:
+        assert checkpoint.read() == ''
+
+
+def test_active_read_classes_every_self_post(workdir, stub_reddit, monkeypatch):
+    pytest.importorskip('numpy')
+    stub_reddit(PAGES)
+    asked = answer_faqs(monkeypatch)
+    reader = RedditReader(active=True)
+    reader.read()
+
+    written = read_class(reader, '1') + read_class(reader, '2')
+    assert 1 <= len(asked) <= 4
+    assert len(written) == 4
+    assert not any(line.startswith("b'") for line in written)
+    assert 'FAQ: which course first? Asking which course to take' in read_class(reader, '1')
+
+
+def test_second_read_is_served_from_the_cache(workdir, stub_reddit, monkeypatch):
+    from datasettoolkit.response_cache import ResponseCache
+
+    stub = stub_reddit(PAGES)
+    answer_faqs(monkeypatch)
+    cache_directory = str(workdir / 'cache')
+
+    RedditReader(cache=ResponseCache(cache_directory, max_age=3600)).read()
+    assert len(stub.requests) == 2
+
+    # A new reader, as on the next run, starts from the top again and finds both pages in the cache.
+    reader = RedditReader(cache=ResponseCache(cache_directory, max_age=3600))
+    reader.read()
+    assert len(stub.requests) == 2
+    assert len(read_class(reader, '1')) == 4
+
+
+def test_compressed_class_files_hold_every_answer(workdir, stub_reddit, monkeypatch):
+    import gzip
+
+    stub_reddit(PAGES)
+    answer_faqs(monkeypatch)
+    reader = RedditReader(compression='gzip')
+    reader.read()
+
+    # Each answer is its own gzip member, and they read back as one file.
+    assert reader.classes['1'].endswith('.txt.gz')
+    with gzip.open(reader.classes['1'], 'rt', encoding='utf-8') as class_file:
+        assert class_file.read().splitlines() == ['FAQ: which course first? Asking which course to take',
+                                                  'FAQ: which book first? Asking which book to read']
+    assert not os.path.exists('{}.appending'.format(reader.classes['1']))
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Tests for counting tokens with VocabularyBuilder, spilled to disk or not. Run from the repo root: python -m pytest
+
+import os
+import random
+from collections import Counter
+
+import pytest
+
+from datasettoolkit.vocabulary import RESERVED_TOKENS, VocabularyBuilder, token_fingerprint
+
+
+def corpus(seed=0, windows=300):
+    rng = random.Random(seed)
+    tokens = ['tok{}'.format(index) for index in range(120)] + ['café', 'naïve']
+    # Skewed, so there are clear frequent tokens and a long tail of rare ones.
+    return [[rng.choice(tokens[:rng.randrange(1, len(tokens) + 1)]) for _ in range(10)] for _ in range(windows)]
+
+
+def expected_vocabulary(windows, min_count=1, max_size=None):
+    counts = Counter(token for window in windows for token in window)
+    kept = sorted(((token, count) for token, count in counts.items() if count >= min_count),
+                  key=lambda entry: (-entry[1], entry[0]))
+    return [(token, 0) for token in RESERVED_TOKENS] + kept[:max_size]
+
+
+def build(windows, tmp_path, **kwargs):
+    builder = VocabularyBuilder(spill_dir=str(tmp_path), **kwargs)
+    for window in windows:
+        builder.add(window)
+    return builder
+
+
+@pytest.mark.parametrize('max_entries', [30, 80, 1000000])
+def test_spilled_counts_match_counting_in_memory(tmp_path, max_entries):
+    windows = corpus()
+    builder = build(windows, tmp_path, max_entries=max_entries)
+    if max_entries < 100:
+        assert len(builder.runs) > 1
+    else:
+        assert not builder.runs
+
+    assert builder.finish() == expected_vocabulary(windows)
+    builder.close()
+    assert not [name for name in os.listdir(str(tmp_path)) if name.endswith('.run')]
+
+
+@pytest.mark.parametrize('min_count, max_size', [(5, None), (1, 10), (3, 7), (1000, None)])
+def test_pruning_keeps_the_most_frequent_tokens(tmp_path, min_count, max_size):
+    windows = corpus(seed=1)
+    builder = build(windows, tmp_path, min_count=min_count, max_size=max_size, max_entries=50)
+    entries = builder.finish()
+    builder.close()
+
+    assert entries == expected_vocabulary(windows, min_count, max_size)
+    assert entries[:len(RESERVED_TOKENS)] == [(token, 0) for token in RESERVED_TOKENS]
+
+
+def test_saved_runs_merge_into_another_builder(tmp_path):
+    first, second = corpus(seed=2, windows=100), corpus(seed=3, windows=150)
+    run_paths = []
+    for index, windows in enumerate((first, second)):
+        builder = build(windows, tmp_path, max_entries=50)
+        run_paths.append(str(tmp_path / 'piece{}.run'.format(index)))
+        builder.save(run_paths[-1])
+        builder.close()
+
+    merged = VocabularyBuilder(spill_dir=str(tmp_path))
+    merged.add(['extra'])
+    for run_path in run_paths:
+        merged.add_run(run_path)
+    assert merged.finish() == expected_vocabulary(first + second + [['extra']])
+    merged.close()
+    # Runs passed in belong to whoever saved them.
+    assert all(os.path.isfile(run_path) for run_path in run_paths)
+
+
+def test_written_vocabulary_reads_back_by_id(tmp_path):
+    builder = build(corpus(), tmp_path)
+    entries = builder.finish()
+    vocab_path = str(tmp_path / 'dataset.vocab')
+    VocabularyBuilder.write(vocab_path, entries)
+
+    assert VocabularyBuilder.read(vocab_path) == [token for token, _ in entries]
+
+
+def test_token_fingerprint_is_stable_and_never_zero():
+    assert token_fingerprint('café') == token_fingerprint('café')
+    assert token_fingerprint('café') != token_fingerprint('cafe')
+    assert all(token_fingerprint('tok{}'.format(index)) for index in range(1000))
+
+
+def test_cleaner_writes_a_vocabulary_of_its_windows(client):
+    client.build_vocab = True
+    client.vocab_memory_entries = 10
+    with open(os.path.join(client.dataset_path, 'input.txt'), 'w', encoding='utf-8') as text_file:
+        text_file.write(' '.join(token for window in corpus() for token in window))
+    client.cleaner('input.txt', label=-1)
+
+    with open(os.path.join(client.dataset_path, 'input.txc'), 'r', encoding='utf-8') as output_file:
+        windows = [line.split() for line in output_file.read().splitlines()]
+    vocab_path = os.path.join(client.dataset_path, 'input.vocab')
+    assert VocabularyBuilder.read(vocab_path) == [token for token, _ in expected_vocabulary(windows)]
+    # The cleaner's spilled runs are cleaned up with it.
+    assert sorted(os.listdir(client.dataset_path)) == ['input.txc', 'input.txt', 'input.vocab']
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Tests that streaming windows() a chunk at a time gives the same windows as the original read-everything cleaner.
+# Run from the repo root: python -m pytest
+
+import os
+import re
+
+import pytest
+
+TEXTS = {
+    'lf': '\n'.join('Line {}, with: some punctuation and words.'.format(index) for index in range(40)),
+    'crlf': '\r\n'.join('Line {} ends in a CRLF'.format(index) for index in range(40)) + '\r\n',
+    'cr': '\r'.join('Line {} ends in a bare CR'.format(index) for index in range(40)) + '\r',
+    'spaces': '  '.join('word{}   with  runs of   spaces'.format(index) for index in range(40)) + ' \n\n',
+    'unicode': ' '.join('Café {} naïve résumé_{}'.format(index, index) for index in range(60)),
+    # 30 words exactly fill one window, and 31 fill it with one to spare.
+    'one-window': ' '.join('w{}'.format(index) for index in range(30)),
+    'one-window-plus-one': ' '.join('w{}'.format(index) for index in range(31)),
+    'empty': '',
+}
+
+
+def reference_windows(data, max_sentence_length):
+    """
+    The original cleaner()'s windowing, with str swapped for bytes as Python 2's str was.
+    """
+    words = b' '.join(data.splitlines()).split(b' ')
+    windows = []
+    while len(words) > max_sentence_length:
+        line = b' '.join(words[:max_sentence_length])
+        del words[:max_sentence_length]
+        windows.append(re.sub(br'[\W_]+', b' ', line.lower()).decode('ascii'))
+    return windows
+
+
+def write_input(client, name):
+    data = TEXTS[name].encode('utf-8')
+    with open(os.path.join(client.dataset_path, 'input.txt'), 'wb') as text_file:
+        text_file.write(data)
+    return data
+
+
+@pytest.mark.parametrize('name', sorted(TEXTS))
+@pytest.mark.parametrize('read_chunk_size', [1, 2, 3, 7, 64, 1048576])
+def test_raw_windows_match_the_original_cleaner(client, name, read_chunk_size):
+    # Tiny chunks cut words, CRLFs and multi-byte characters at every possible point.
+    client.read_chunk_size = read_chunk_size
+    data = write_input(client, name)
+    assert list(client.windows('input.txt')) == reference_windows(data, client.max_sentence_length)
+
+
+def test_cleaner_writes_the_streamed_windows(client):
+    data = write_input(client, 'crlf')
+    client.read_chunk_size = 5
+    client.cleaner('input.txt', label=-1)
+
+    with open(os.path.join(client.dataset_path, 'input.txc'), 'r', encoding='utf-8', newline='') as output_file:
+        assert output_file.read().splitlines() == reference_windows(data, client.max_sentence_length)
+
+
+def test_skip_and_limit_pick_out_windows(client):
+    data = write_input(client, 'lf')
+    client.read_chunk_size = 11
+    expected = reference_windows(data, client.max_sentence_length)
+    length = client.max_sentence_length
+
+    assert list(client.windows('input.txt', limit=2)) == expected[:2]
+    assert list(client.windows('input.txt', skip=length, limit=3)) == expected[1:4]